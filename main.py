@@ -12,16 +12,9 @@ import uvicorn
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), 'src'))
 
 if __name__ == "__main__":
-    # Verificar y configurar API key con el gestor
-    from Backend.utils.api_key_manager import get_working_api_key
-
-    try:
-        # Intentar obtener una API key funcional
-        active_key = get_working_api_key()
-        print(f"✅ API key funcional encontrada: {active_key[:15]}...")
-    except ValueError as e:
-        print(f"⚠️  Advertencia: {e}")
-        print("   El servidor iniciará, pero las funciones de IA pueden no estar disponibles.")
+    # La validación de API keys, el modelo y el esquema de la base de datos se
+    # preparan en segundo plano al arrancar (ver /health/ready)
+    development = os.getenv("ENVIRONMENT", "production").lower() == "development"
 
     print("\n🚀 Iniciando LEAN BOT Server...")
     print("📊 Sistema de análisis de sentimientos con BETO activado")
@@ -31,14 +24,16 @@ if __name__ == "__main__":
     print("   - Analytics: http://localhost:PORT/analytics.html")
     print("   - API Docs: http://localhost:PORT/docs")
     print("   - Dashboard: http://localhost:PORT/dashboard.html")
+    print("   - Disponibilidad: http://localhost:PORT/health/ready")
     print("\n" + "="*60)
 
     # Ejecutar el servidor SIEMPRE en el puerto 8000 (coherente con Render)
+    # Recarga automática solo con ENVIRONMENT=development
     uvicorn.run(
         "Backend.api:app",
         host="0.0.0.0",
         port=8000,
-        reload=True,
-        reload_dirs=["src"],
+        reload=development,
+        reload_dirs=["src"] if development else None,
         log_level="info"
-    )
\ No newline at end of file
+    )
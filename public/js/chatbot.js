@@ -1142,8 +1142,12 @@ document.addEventListener("DOMContentLoaded", function() {
                 chatWindow.scrollTop = chatWindow.scrollHeight;
                 
                 try {
-                    // Enviar al backend y obtener respuesta
-                    const fullResponse = await window.leanBotAPI.sendMessage(userInput);
+                    // Enviar al backend y mostrar la respuesta a medida que llega
+                    const loadingText = loadingIndicator.querySelector(".message-text");
+                    const fullResponse = await window.leanBotAPI.sendMessageStream(userInput, (partialText) => {
+                        loadingText.textContent = partialText;
+                        chatWindow.scrollTop = chatWindow.scrollHeight;
+                    });
                     
                     // Reemplazar indicador de carga con la respuesta del backend
                     chatWindow.removeChild(loadingIndicator);
@@ -250,6 +250,90 @@ class LeanBotAPI {
         }
     }
 
+    // Enviar mensaje y recibir la respuesta token a token (Server-Sent Events)
+    // onToken(textoAcumulado, fragmento) se llama con cada fragmento recibido
+    async sendMessageStream(userMessage, onToken) {
+        if (!this.isBackendAvailable || !this.currentChatId || !window.ReadableStream) {
+            return this.sendMessage(userMessage);
+        }
+
+        let received = '';
+        try {
+            const response = await fetch(`${this.baseURL}/chats/${this.currentChatId}/stream`, {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                    'Accept': 'text/event-stream'
+                },
+                body: JSON.stringify({
+                    message: userMessage,
+                    timestamp: new Date().toISOString(),
+                    ai_provider: this.aiProvider,
+                    api_key: this.customApiKey
+                })
+            });
+
+            if (!response.ok || !response.body) {
+                throw new Error(`Error ${response.status}: ${response.statusText}`);
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder('utf-8');
+            let buffer = '';
+            let messageData = null;
+
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+
+                // Los eventos SSE se separan con una línea en blanco
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                    const rawEvent = buffer.slice(0, boundary);
+                    buffer = buffer.slice(boundary + 2);
+
+                    let eventName = 'message';
+                    let data = '';
+                    rawEvent.split('\n').forEach(line => {
+                        if (line.startsWith('event:')) eventName = line.slice(6).trim();
+                        else if (line.startsWith('data:')) data += line.slice(5).trim();
+                    });
+                    if (!data) continue;
+
+                    const payload = JSON.parse(data);
+                    if (eventName === 'token') {
+                        received += payload.text;
+                        if (onToken) onToken(received, payload.text);
+                    } else if (eventName === 'done') {
+                        messageData = payload;
+                    } else if (eventName === 'error') {
+                        const streamError = new Error(payload.detail);
+                        streamError.status = payload.status;
+                        throw streamError;
+                    }
+                }
+            }
+
+            if (!messageData) {
+                throw new Error('El stream terminó sin respuesta final');
+            }
+            console.log('✅ Respuesta del backend (stream):', messageData);
+            return messageData;
+        } catch (error) {
+            console.error('❌ Error en streaming:', error);
+            // Si ya se mostró texto, conservarlo; si no, intentar sin streaming
+            if (received) {
+                return { message: userMessage, response: received, score: null, timestamp: new Date().toISOString() };
+            }
+            // Servicio de IA saturado (503): reintentar sin streaming solo sumaría carga
+            if (error.status === 503) {
+                return this.fallbackResponse(userMessage);
+            }
+            return this.sendMessage(userMessage);
+        }
+    }
+
     // Respuesta de fallback cuando el backend no está disponible
     fallbackResponse(userMessage) {
         const fallbackResponses = [
@@ -468,6 +552,7 @@ URL Backend: ${leanBotAPI.baseURL}
 
 Funciones disponibles:
 - leanBotAPI.sendMessage(mensaje)
+- leanBotAPI.sendMessageStream(mensaje, onToken)
 - leanBotAPI.getChatHistory()
 - leanBotAPI.testGeminiConnection()
 - leanBotAPI.getChatStats()
@@ -2,14 +2,27 @@
 from fastapi import FastAPI, Depends, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
 from typing import Union
 from .database import engine, Base, Session as DBSession
+from .models.chat import Chat
 from .schemas.chat_schemas import UsuarioCreate, UsuarioOut, ChatUpdate, ChatOut, MessageRequest, MessageResponse
-from .repositories.chat_repository import create_usuario_y_chat, get_usuario_y_chat, update_chat, get_score, process_message
+from .repositories.chat_repository import create_usuario_y_chat, get_usuario_y_chat, update_chat, get_score, process_message, process_message_stream
 from .repositories.chat_repository import get_all_chats_with_score, get_chat_messages, get_chat_messages_by_user, get_ai_service
-from .utils.beto_sentiment import analyze_sentiment, get_sentiment_analyzer, get_sentiment_score
+from .utils.beto_sentiment import analyze_sentiment, analyze_sentiment_batch, get_sentiment_analyzer, get_sentiment_score
 from .utils.sentiment_analytics import get_analytics_service
+from .utils.http_client import warm_up_connections
+from .utils.response_cache import get_response_cache
+from .utils.semantic_cache import get_semantic_cache
+from .utils.gemini_context_cache import get_gemini_context_cache
+from .utils.knowledge_index import get_knowledge_index, reload_knowledge_index
+from .utils.intent_router import get_intent_router
+from .utils.admission import ProviderOverloadedError
+from .utils.api_key_manager import get_api_key_manager
+from .utils.startup import get_startup_manager
+from .utils.score_backfill import BACKFILL_METHODS, get_score_backfill_job
+from .utils.pipeline_timings import get_pipeline_timings
 import os
 import json
 import random
@@ -24,6 +37,9 @@ app = FastAPI(title="LEAN BOT API", description="API para el chatbot LEAN de ING
 
 # Health check endpoint (eliminado duplicado)
 
+# Máximo de textos aceptados por /sentiment/analyze/batch
+SENTIMENT_BATCH_MAX_TEXTS = int(os.getenv("SENTIMENT_BATCH_MAX_TEXTS", "256"))
+
 # Variable global temporal para almacenar la API key recibida
 GEMINI_API_KEY_RUNTIME = None
 
@@ -40,6 +56,8 @@ def configure_gemini_api_key(request: dict):
             GEMINI_API_KEY_RUNTIME = api_key.strip()
             # También configurar en el entorno para que lo use gemini_chat.py
             os.environ["GEMINI_API_KEY"] = api_key.strip()
+            # Las instancias reutilizadas conservan la key anterior
+            get_ai_service().clear_service_cache()
             print(f"✅ API key de Gemini configurada: {api_key[:10]}...")
             return {"status": "success", "message": "API key configurada correctamente"}
         else:
@@ -57,7 +75,52 @@ app.add_middleware(
     allow_headers=["*"],  # Permite todos los headers
 )
 
-Base.metadata.create_all(bind=engine)
+def _create_schema():
+    Base.metadata.create_all(bind=engine)
+    return {"tables": sorted(Base.metadata.tables)}
+
+def _validate_api_keys():
+    manager = get_api_key_manager()
+    manager.refresh()
+    # Renueva la validación periódicamente antes de que venza su TTL
+    manager.start_background_refresh()
+    return {"valid_keys": sum(1 for key in manager.get_status()["keys"] if key["valid"])}
+
+def _load_sentiment_model():
+    analyzer = get_sentiment_analyzer()
+    return {"model_loaded": analyzer.analyzer is not None, "load_timings": analyzer.load_timings}
+
+def _build_knowledge_index():
+    return get_knowledge_index().get_stats()
+
+def _build_intent_router():
+    return {"faq_entries": len(get_intent_router().faq)}
+
+def _warm_up_http_pool():
+    results = warm_up_connections()
+    print(f"🔌 Conexiones pre-calentadas: {results}")
+    return results
+
+@app.on_event("startup")
+def start_background_warmup():
+    """
+    Prepara los componentes en paralelo sin bloquear la apertura del puerto;
+    /health/ready indica cuándo terminaron
+    """
+    startup = get_startup_manager()
+    startup.register("database", _create_schema)
+    startup.register("sentiment_model", _load_sentiment_model)
+    startup.register("knowledge_index", _build_knowledge_index)
+    startup.register("intent_router", _build_intent_router)
+    # Sin claves válidas se responde con Mistral; sin pre-calentar, con conexiones nuevas
+    startup.register("api_keys", _validate_api_keys, required=False)
+    startup.register("http_pool", _warm_up_http_pool, required=False)
+    startup.start()
+
+@app.on_event("shutdown")
+def persist_semantic_cache():
+    """Guarda la caché semántica al apagar (si SEMANTIC_CACHE_PATH está configurado)"""
+    get_semantic_cache().save()
 
 @app.get("/")
 def health_check():
@@ -69,6 +132,20 @@ def health_check_alt():
     """Endpoint alternativo de health check"""
     return {"message": "LEAN BOT API funcionando correctamente", "status": "healthy"}
 
+@app.get("/health/live")
+def health_live():
+    """El proceso está vivo y atiende peticiones (no indica que esté caliente)"""
+    return {"status": "alive"}
+
+@app.get("/health/ready")
+def health_ready():
+    """
+    Estado y tiempos de cada componente del arranque; 503 hasta que terminan
+    los requeridos (healthCheckPath de Render)
+    """
+    status = get_startup_manager().get_status()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
 def get_db():
     db = DBSession()
     try:
@@ -110,6 +187,14 @@ def crear_usuario_y_chat_endpoint(usuario: UsuarioCreate, db: Session = Depends(
     db_usuario = create_usuario_y_chat(db, usuario.doc_id)
     return db_usuario
 
+def _overloaded(e: ProviderOverloadedError) -> HTTPException:
+    """503 con Retry-After cuando los proveedores de IA están saturados"""
+    return HTTPException(
+        status_code=503,
+        detail=f"Servicio de IA saturado, intenta de nuevo en {e.retry_after} s ({e})",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
 # NUEVO ENDPOINT: Enviar mensaje al chatbot LEAN BOT
 @app.post('/chats/{chat_id}', response_model=MessageResponse)
 def enviar_mensaje_al_chat(chat_id: str, message_request: MessageRequest, db: Session = Depends(get_db)):
@@ -122,9 +207,50 @@ def enviar_mensaje_al_chat(chat_id: str, message_request: MessageRequest, db: Se
         return response
     except ValueError as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ProviderOverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+# ENDPOINT STREAMING: Enviar mensaje y recibir la respuesta token a token (SSE)
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post('/chats/{chat_id}/stream')
+def enviar_mensaje_al_chat_stream(chat_id: str, message_request: MessageRequest):
+    """
+    Igual que POST /chats/{chat_id}, pero responde con Server-Sent Events:
+    un evento `token` por cada fragmento generado por la IA y un evento `done`
+    con el mensaje completo (mismos campos que MessageResponse) una vez guardado.
+    """
+    # Verificar el chat antes de abrir el stream para poder responder 404
+    db = DBSession()
+    if not db.query(Chat).filter(Chat.id == chat_id).first():
+        db.close()
+        raise HTTPException(status_code=404, detail='Chat no encontrado')
+    
+    def event_stream():
+        # La sesión vive lo que dura el stream, no lo que dura el endpoint
+        try:
+            for event in process_message_stream(db, chat_id, message_request):
+                if event["type"] == "token":
+                    yield _sse("token", {"text": event["text"]})
+                else:
+                    yield _sse("done", {k: v for k, v in event.items() if k != "type"})
+        except ProviderOverloadedError as e:
+            yield _sse("error", {"detail": _overloaded(e).detail, "status": 503, "retry_after": e.retry_after})
+        except Exception as e:
+            print(f"❌ Error en streaming del chat {chat_id}: {e}")
+            yield _sse("error", {"detail": f"Error interno del servidor: {str(e)}"})
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 # ENDPOINT ALTERNATIVO: Enviar mensaje con doc_id en lugar de chat_id
 @app.post('/usuarios/{doc_id}/message', response_model=MessageResponse)
 def enviar_mensaje_por_usuario(doc_id: Union[int, str], message_request: MessageRequest, db: Session = Depends(get_db)):
@@ -140,6 +266,8 @@ def enviar_mensaje_por_usuario(doc_id: Union[int, str], message_request: Message
     try:
         response = process_message(db, usuario.chat.id, message_request)
         return response
+    except ProviderOverloadedError as e:
+        raise _overloaded(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
@@ -210,23 +338,15 @@ def test_gemini_integration():
 def obtener_todos_los_chats_admin(db: Session = Depends(get_db)):
     """
     Endpoint para el panel de administración que obtiene todos los chats con información de usuarios
-    Calcula scores automáticamente para mensajes que no los tienen
+    Solo lectura: los mensajes sin score se puntúan con POST /admin/scores/backfill
     """
     try:
         chats_data = get_all_chats_with_score(db)
         
-        # Procesar cada chat para asegurar que los mensajes tengan scores
         for chat in chats_data:
             if chat.get('mensajes') and isinstance(chat['mensajes'], list):
                 updated_messages = []
                 for message in chat['mensajes']:
-                    # Si el mensaje no tiene score, calcularlo automáticamente
-                    if not message.get('score') and message.get('message'):
-                        # Usar contexto completo (mensaje + respuesta) para mejor scoring
-                        respuesta_bot = message.get('response', '')
-                        message['score'] = calculate_message_score(message['message'], respuesta_bot)
-                        print(f"Score calculado para mensaje admin: {message['score']}")
-                    
                     # Asegurar que tenga timestamp
                     if not message.get('timestamp'):
                         message['timestamp'] = datetime.now().isoformat()
@@ -239,6 +359,40 @@ def obtener_todos_los_chats_admin(db: Session = Depends(get_db)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {str(e)}")
 
+@app.post('/admin/scores/backfill', status_code=202)
+def iniciar_backfill_de_scores(request: dict = None):
+    """
+    Puntúa y guarda en segundo plano los mensajes sin score
+    
+    Body (opcional): {
+        "method": "auto" | "beto" | "llm",
+        "batch_size": 32,
+        "limit": 1000
+    }
+    """
+    request = request or {}
+    method = request.get('method')
+    if method and method not in BACKFILL_METHODS:
+        raise HTTPException(status_code=400, detail=f"method debe ser uno de: {', '.join(BACKFILL_METHODS)}")
+    options = {'method': method} if method else {}
+    try:
+        for key in ('batch_size', 'limit'):
+            if request.get(key) is not None:
+                options[key] = int(request[key])
+    except (TypeError, ValueError):
+        raise HTTPException(status_code=400, detail="batch_size y limit deben ser enteros")
+    
+    job = get_score_backfill_job()
+    started = job.start(DBSession, **options)
+    return {"started": started, **job.get_status()}
+
+@app.get('/admin/scores/backfill')
+def estado_backfill_de_scores():
+    """
+    Estado del backfill de scores y resumen de la última ejecución
+    """
+    return get_score_backfill_job().get_status()
+
 # ENDPOINTS PARA ADMINISTRACIÓN
 @app.get('/admin/chats')
 def get_all_chats_admin(db: Session = Depends(get_db)):
@@ -321,6 +475,96 @@ def test_ai_provider(request: dict):
     
     return result
 
+@app.get('/ai/router/metrics')
+def get_provider_router_metrics():
+    """
+    Salud de los proveedores (circuitos, EWMA de latencia y éxito) y decisiones de enrutamiento
+    """
+    return get_ai_service().get_router_metrics()
+
+@app.get('/ai/gemini/context-cache')
+def get_gemini_context_cache_metrics():
+    """
+    Estado de la caché del contexto de LEAN BOT en Gemini (cachedContents)
+    """
+    return get_gemini_context_cache().get_metrics()
+
+@app.get('/ai/knowledge/search')
+def search_knowledge(q: str, k: int = 4):
+    """
+    Fragmentos de conocimiento que se entregarían al modelo para una consulta
+    """
+    index = get_knowledge_index()
+    return {"query": q, "results": index.search(q, top_k=k), "index": index.get_stats()}
+
+@app.post('/ai/knowledge/reload')
+def reload_knowledge():
+    """
+    Reconstruye el índice tras editar src/Backend/knowledge/ o data.json
+    """
+    index = reload_knowledge_index()
+    return {"status": "success", "index": index.get_stats()}
+
+@app.get('/ai/intents/metrics')
+def get_intent_metrics():
+    """
+    Mensajes respondidos sin LLM (saludos, despedidas, FAQ) y tasa de acierto
+    """
+    return get_intent_router().get_metrics()
+
+@app.get('/ai/keys/status')
+def get_api_keys_status():
+    """
+    Validaciones en caché de las API keys de Gemini (claves enmascaradas)
+    """
+    return get_api_key_manager().get_status()
+
+@app.get('/ai/single-flight/metrics')
+def get_single_flight_metrics():
+    """
+    Peticiones idénticas concurrentes unificadas en una sola llamada al proveedor
+    """
+    return get_ai_service().single_flight.get_metrics()
+
+@app.get('/ai/cache/metrics')
+def get_response_cache_metrics():
+    """
+    Métricas de la caché de respuestas (aciertos, fallos, tamaño, desalojos)
+    """
+    return get_response_cache().get_metrics()
+
+@app.get('/ai/pipeline/metrics')
+def get_pipeline_metrics():
+    """
+    Tiempos por etapa de los mensajes (contexto, LLM, sentimiento, guardado)
+    """
+    return get_pipeline_timings().get_metrics()
+
+@app.get('/ai/semantic-cache/metrics')
+def get_semantic_cache_metrics():
+    """
+    Métricas de la caché semántica (preguntas parecidas)
+    """
+    return get_semantic_cache().get_metrics()
+
+@app.post('/ai/semantic-cache/save')
+def save_semantic_cache():
+    """
+    Guarda el índice de la caché semántica en SEMANTIC_CACHE_PATH
+    """
+    if not get_semantic_cache().save():
+        raise HTTPException(status_code=400, detail='Caché semántica desactivada o sin SEMANTIC_CACHE_PATH configurado')
+    return {"status": "success", "message": "Caché semántica guardada"}
+
+@app.post('/ai/cache/clear')
+def clear_response_cache():
+    """
+    Vacía la caché de respuestas (exacta y semántica)
+    """
+    get_response_cache().clear()
+    get_semantic_cache().clear()
+    return {"status": "success", "message": "Caché de respuestas vaciada"}
+
 # NUEVOS ENDPOINTS PARA ANÁLISIS DE SENTIMIENTOS CON BETO
 
 @app.post('/sentiment/analyze')
@@ -362,6 +606,56 @@ def analyze_text_sentiment(request: dict):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error en análisis de sentimiento: {str(e)}")
 
+@app.post('/sentiment/analyze/batch')
+def analyze_text_sentiment_batch(request: dict):
+    """
+    Analiza el sentimiento de varios textos en una sola petición usando BETO en lote
+    
+    Body: {
+        "texts": ["texto 1", "texto 2", ...],
+        "record": false,
+        "user_id": "optional_user_id",
+        "conversation_id": "optional_conversation_id"
+    }
+    
+    Los resultados se devuelven en el mismo orden que "texts".
+    """
+    texts = request.get("texts")
+    
+    if not isinstance(texts, list) or not texts:
+        raise HTTPException(status_code=400, detail="Se requiere una lista 'texts' no vacía")
+    if len(texts) > SENTIMENT_BATCH_MAX_TEXTS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo {SENTIMENT_BATCH_MAX_TEXTS} textos por petición"
+        )
+    if not all(isinstance(text, str) for text in texts):
+        raise HTTPException(status_code=400, detail="Todos los elementos de 'texts' deben ser cadenas")
+    
+    try:
+        results = analyze_sentiment_batch(texts)
+        
+        # Registrar en analytics en una sola inserción (opcional)
+        if request.get("record", False):
+            user_id = request.get("user_id", "unknown")
+            conversation_id = request.get("conversation_id", "default")
+            analytics_service = get_analytics_service()
+            analytics_service.add_sentiment_data_batch([
+                {
+                    **result,
+                    "user_id": user_id,
+                    "conversation_id": conversation_id,
+                    "message": text
+                }
+                for text, result in zip(texts, results)
+                if text.strip()
+            ])
+        
+        return {"results": results, "count": len(results)}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Error en análisis de sentimiento en lote: {str(e)}")
+
 @app.get('/sentiment/model-info')
 def get_sentiment_model_info():
     """
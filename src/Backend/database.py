@@ -9,3 +9,18 @@ database_url = f"sqlite:///{os.path.join(base_dir, sqlite_file_name)}"
 engine = create_engine(database_url, echo=True)
 Session = sessionmaker(bind=engine)
 Base = declarative_base()
+
+def begin_write(db) -> None:
+    """
+    Abre la transacción de la sesión tomando ya el lock de escritura
+    (BEGIN IMMEDIATE en SQLite), para que un leer-modificar-escribir de una
+    fila no se intercale con otra escritura. Después hay que volver a leer la
+    fila (populate_existing) y terminar con commit o rollback; en otros
+    motores el lock lo toma la consulta con with_for_update().
+    """
+    connection = db.connection()
+    if connection.dialect.name != "sqlite":
+        return
+    # Si la transacción ya escribió algo, SQLite ya tiene el lock de escritura
+    if not connection.connection.dbapi_connection.in_transaction:
+        connection.exec_driver_sql("BEGIN IMMEDIATE")
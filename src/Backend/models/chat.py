@@ -1,4 +1,4 @@
-from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float
+from sqlalchemy import Column, String, Integer, ForeignKey, DateTime, Float, Text
 from sqlalchemy.dialects.sqlite import JSON as SQLiteJSON
 from sqlalchemy.orm import relationship
 from src.Backend.database import Base
@@ -20,3 +20,10 @@ class Usuario(Base):
     doc_id = Column(String, nullable=False, unique=True)
     chat_id = Column(String, ForeignKey('chats.id'), nullable=False, unique=True)
     chat = relationship('Chat', back_populates='usuario', uselist=False)
+
+class ChatSummary(Base):
+    __tablename__ = 'chat_summaries'
+    chat_id = Column(String, ForeignKey('chats.id'), primary_key=True)
+    summary = Column(Text, nullable=False, default="")
+    turns_covered = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -1,15 +1,25 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.attributes import flag_modified
-from ..models.chat import Usuario, Chat
+from ..models.chat import Usuario, Chat, ChatSummary
+from ..database import Session as DBSession, begin_write
 from ..schemas.chat_schemas import UsuarioCreate, ChatCreate, ChatUpdate, MessageRequest, MessageResponse
-from ..utils.beto_sentiment import analyze_sentiment, get_sentiment_score
+from ..utils.beto_sentiment import analyze_sentiment, fallback_analysis, sentiment_result_to_score
 from ..utils.sentiment_analytics import get_analytics_service
 from ..utils.gemini_chat import GeminiChatService
-from ..utils.ai_chat_service import AIChatService
+from ..utils.ai_chat_service import AIChatService, get_ai_chat_service
 from ..utils.scoring import calculate_message_score
+from ..utils.structured_reply import SENTIMENT_CODES, STRUCTURED_REPLY_ENABLED
+from ..utils.context_builder import ConversationSummary
+from ..utils.conversation_summary import needs_refresh, summary_target, summarize_turns
+from ..utils.pipeline_timings import get_pipeline_timings
+from ..utils.startup import get_startup_manager
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 import json
 import os
+import threading
+import time
+from typing import Any, Dict, Iterator, Optional, Tuple
 
 # Función para obtener una instancia actualizada del servicio de Gemini
 def get_gemini_service():
@@ -17,8 +27,8 @@ def get_gemini_service():
     return GeminiChatService()
 
 def get_ai_service():
-    """Obtiene una instancia del servicio unificado de IA"""
-    return AIChatService()
+    """Obtiene la instancia compartida del servicio unificado de IA"""
+    return get_ai_chat_service()
 
 def create_usuario_y_chat(db: Session, doc_id):
     # Convertir doc_id a string para consistencia
@@ -39,34 +49,123 @@ def get_usuario_y_chat(db: Session, doc_id):
     doc_id_str = str(doc_id)
     return db.query(Usuario).filter(Usuario.doc_id == doc_id_str).first()
 
-def process_message(db: Session, chat_id: str, message_request: MessageRequest) -> MessageResponse:
+# Resúmenes de conversación: se refrescan en segundo plano, uno a la vez
+_summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chat-summary")
+_summary_in_flight = set()
+_summary_lock = threading.Lock()
+
+def get_chat_summary(db: Session, chat_id: str) -> Optional[ConversationSummary]:
     """
-    Procesa un mensaje completo: genera respuesta con IA (Gemini o Mistral), analiza sentimiento y guarda en BD
+    Obtiene el resumen acumulado de un chat (o None si aún no tiene)
     """
-    chat = db.query(Chat).filter(Chat.id == chat_id).first()
-    if not chat:
-        raise ValueError("Chat no encontrado")
-    
-    # Obtener historial de conversación actual
-    conversation_history = chat.mensajes if chat.mensajes else []
-    
-    # Generar respuesta usando el servicio unificado de IA
-    ai_service = get_ai_service()
-    ai_result = ai_service.generate_response(
-        message_request.message, 
-        conversation_history,
-        provider=message_request.ai_provider,
-        api_key=message_request.api_key
-    )
-    
-    bot_response = ai_result["response"]
-    ai_provider_used = ai_result["provider"]
-    
-    # Analizar sentimiento usando BETO
+    row = db.query(ChatSummary).filter(ChatSummary.chat_id == chat_id).first()
+    if row is None or not row.summary:
+        return None
+    return ConversationSummary(text=row.summary, turns_covered=row.turns_covered or 0)
+
+def _refresh_chat_summary(chat_id: str):
+    """
+    Pliega en el resumen los turnos que salieron de la ventana reciente
+    (se ejecuta en el hilo de resúmenes con su propia sesión de BD)
+    """
+    db = DBSession()
+    try:
+        chat = db.query(Chat).filter(Chat.id == chat_id).first()
+        if not chat or not isinstance(chat.mensajes, list):
+            return
+        row = db.query(ChatSummary).filter(ChatSummary.chat_id == chat_id).first()
+        covered = row.turns_covered if row else 0
+        if not needs_refresh(len(chat.mensajes), covered):
+            return
+        
+        target = summary_target(len(chat.mensajes))
+        new_turns = [msg for msg in chat.mensajes[covered:target] if isinstance(msg, dict)]
+        summary = summarize_turns(
+            row.summary if row else None,
+            new_turns,
+            complete=get_ai_service().complete
+        )
+        
+        if row is None:
+            row = ChatSummary(chat_id=chat_id)
+            db.add(row)
+        row.summary = summary
+        row.turns_covered = target
+        db.commit()
+        print(f"📝 Resumen del chat {chat_id} actualizado ({target} turnos cubiertos)")
+    except Exception as e:
+        print(f"❌ Error al actualizar el resumen del chat {chat_id}: {e}")
+        db.rollback()
+    finally:
+        db.close()
+        with _summary_lock:
+            _summary_in_flight.discard(chat_id)
+
+def schedule_summary_refresh(chat_id: str, total_turns: int, summary: Optional[ConversationSummary]):
+    """
+    Programa el refresco del resumen si hay suficientes turnos nuevos para plegar
+    """
+    if not needs_refresh(total_turns, summary.turns_covered if summary else 0):
+        return
+    with _summary_lock:
+        if chat_id in _summary_in_flight:
+            return
+        _summary_in_flight.add(chat_id)
+    _summary_executor.submit(_refresh_chat_summary, chat_id)
+
+# El sentimiento del usuario solo depende de su mensaje, así que BETO corre
+# en su propio executor mientras el hilo del request espera al LLM (E/S).
+# La inferencia ya se serializa/agrupa dentro del analizador; pocos hilos
+# bastan para no competir por CPU con el resto del proceso.
+SENTIMENT_WORKERS = int(os.getenv("SENTIMENT_WORKERS", "2"))
+_sentiment_executor = ThreadPoolExecutor(max_workers=max(1, SENTIMENT_WORKERS), thread_name_prefix="chat-sentiment")
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 1)
+
+def _sentiment_model_loaded() -> bool:
+    """
+    BETO ya está cargado, según el arranque en segundo plano. No espera la
+    carga: mientras el modelo carga (o si no cargó) devuelve False.
+    """
+    detail = get_startup_manager().component_detail("sentiment_model")
+    return bool(detail and detail.get("model_loaded"))
+
+def _analyze_user_message(text: str) -> Tuple[Dict[str, Any], float, float]:
+    """
+    Analiza el sentimiento del mensaje del usuario con BETO; mientras el
+    modelo no está listo usa el léxico de respaldo (get_sentiment_analyzer
+    esperaría toda la carga)
+
+    Returns:
+        (análisis, score, duración en ms)
+    """
+    started = time.perf_counter()
+    sentiment_analysis = analyze_sentiment(text) if _sentiment_model_loaded() else fallback_analysis(text)
+    return sentiment_analysis, sentiment_result_to_score(sentiment_analysis), _elapsed_ms(started)
+
+def _start_sentiment(message_request: MessageRequest) -> Future:
+    """
+    Lanza el análisis de sentimiento en paralelo con la generación del LLM
+    """
+    return _sentiment_executor.submit(_analyze_user_message, message_request.message)
+
+def _score_message(chat_id: str, message_request: MessageRequest, bot_response: str,
+                   sentiment_future: Optional[Future] = None, timings: Optional[Dict[str, float]] = None) -> float:
+    """
+    Analiza el sentimiento del mensaje del usuario con BETO, lo registra en
+    analytics y devuelve el score (con fallback al análisis básico).
+    Si el análisis ya se lanzó con _start_sentiment, espera su resultado.
+    """
+    timings = timings if timings is not None else {}
     try:
         # Usar el nuevo sistema de análisis de sentimientos con BETO
-        sentiment_analysis = analyze_sentiment(message_request.message)
-        sentiment_score = get_sentiment_score(message_request.message)
+        if sentiment_future is not None:
+            waited = time.perf_counter()
+            sentiment_analysis, sentiment_score, timings["sentiment"] = sentiment_future.result()
+            timings["sentiment_wait"] = _elapsed_ms(waited)
+        else:
+            sentiment_analysis, sentiment_score, timings["sentiment"] = _analyze_user_message(message_request.message)
         
         # Registrar en analytics
         analytics_service = get_analytics_service()
@@ -84,6 +183,7 @@ def process_message(db: Session, chat_id: str, message_request: MessageRequest)
     except Exception as e:
         print(f"Error en análisis de sentimiento BETO: {e}")
         # Fallback: usar análisis básico
+        fallback_started = time.perf_counter()
         try:
             sentiment_score = calculate_message_score(
                 message_request.message, 
@@ -93,7 +193,48 @@ def process_message(db: Session, chat_id: str, message_request: MessageRequest)
             )
         except:
             sentiment_score = 5.0  # Neutral por defecto
+        timings["sentiment_fallback"] = _elapsed_ms(fallback_started)
+    
+    return sentiment_score
+
+def _record_timings(timings: Dict[str, float], started: float):
+    """
+    Cierra y registra los tiempos por etapa de un mensaje
+    """
+    timings["total"] = _elapsed_ms(started)
+    get_pipeline_timings().record(timings)
+    print("⏱️ Etapas (ms): " + ", ".join(f"{stage}={value}" for stage, value in timings.items()))
+
+def _record_structured_score(chat_id: str, message_request: MessageRequest, ai_result: Dict[str, Any]) -> float:
+    """
+    Registra en analytics el score y el sentimiento que el LLM devolvió junto
+    con la respuesta (modo estructurado) y devuelve el score
+    """
+    sentiment_score = float(ai_result["score"])
+    label = ai_result.get("sentiment") or "neutral"
+    get_analytics_service().add_sentiment_data({
+        "sentiment": SENTIMENT_CODES.get(label, "NEU"),
+        "label": label,
+        "analysis_type": ai_result.get("analysis_type", "llm_structured"),
+        "user_id": getattr(message_request, 'doc_id', 'unknown'),
+        "conversation_id": chat_id,
+        "message": message_request.message
+    })
+    print(f"🧠 Análisis en la misma llamada ({ai_result.get('provider')}) - Sentimiento: {label}, "
+          f"Score: {sentiment_score:.1f}")
+    return sentiment_score
+
+def _save_message(db: Session, chat: Chat, conversation_history: list, message_request: MessageRequest,
+                  bot_response: str, sentiment_score: float) -> str:
+    """
+    Agrega el mensaje con su respuesta al historial del chat y guarda en BD.
+    El historial se vuelve a leer con el lock de escritura tomado: mientras
+    el LLM generaba pudo cambiar (scores del backfill, otro mensaje) y
+    escribir `conversation_history` tal cual pisaría esos cambios.
     
+    Returns:
+        str: Timestamp del mensaje guardado
+    """
     # Crear timestamp
     timestamp = datetime.now().isoformat()
     
@@ -105,6 +246,18 @@ def process_message(db: Session, chat_id: str, message_request: MessageRequest)
         "response": bot_response
     }
     
+    # Releer el chat dentro de la transacción de escritura
+    begin_write(db)
+    chat = (db.query(Chat)
+            .populate_existing()
+            .with_for_update()
+            .filter(Chat.id == chat.id)
+            .first())
+    if chat is None:
+        db.rollback()
+        raise ValueError("Chat no encontrado")
+    conversation_history = chat.mensajes
+    
     # APPEND: Agregar el nuevo mensaje al historial
     print(f"🔍 Estado antes del append:")
     print(f"   - conversation_history: {conversation_history}")
@@ -148,6 +301,60 @@ def process_message(db: Session, chat_id: str, message_request: MessageRequest)
         db.rollback()
         raise
     
+    return timestamp
+
+def process_message(db: Session, chat_id: str, message_request: MessageRequest) -> MessageResponse:
+    """
+    Procesa un mensaje completo: genera respuesta con IA (Gemini o Mistral), analiza sentimiento y guarda en BD.
+    La generación y el análisis de sentimiento corren a la vez y se juntan antes de guardar.
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    
+    chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    if not chat:
+        raise ValueError("Chat no encontrado")
+    
+    # Sin BETO cargado (o mientras carga), el score sale de la misma llamada al
+    # LLM que la respuesta; con BETO, el análisis arranca ya y corre mientras
+    # el LLM genera
+    structured = STRUCTURED_REPLY_ENABLED and not _sentiment_model_loaded()
+    sentiment_future = None if structured else _start_sentiment(message_request)
+    
+    # Obtener historial de conversación actual
+    conversation_history = chat.mensajes if chat.mensajes else []
+    
+    summary = get_chat_summary(db, chat_id)
+    timings["context"] = _elapsed_ms(started)
+    
+    # Generar respuesta usando el servicio unificado de IA
+    ai_service = get_ai_service()
+    llm_started = time.perf_counter()
+    ai_result = ai_service.generate_response(
+        message_request.message, 
+        conversation_history,
+        provider=message_request.ai_provider,
+        api_key=message_request.api_key,
+        summary=summary,
+        structured=structured
+    )
+    timings["llm"] = _elapsed_ms(llm_started)
+    
+    bot_response = ai_result["response"]
+    ai_provider_used = ai_result["provider"]
+    
+    if ai_result.get("score") is not None:
+        sentiment_score = _record_structured_score(chat_id, message_request, ai_result)
+    else:
+        # Sentimiento con BETO (o el análisis de respaldo); si ya estaba en curso solo se espera
+        sentiment_score = _score_message(chat_id, message_request, bot_response, sentiment_future, timings)
+    
+    persist_started = time.perf_counter()
+    timestamp = _save_message(db, chat, conversation_history, message_request, bot_response, sentiment_score)
+    schedule_summary_refresh(chat_id, len(chat.mensajes or []), summary)
+    timings["persist"] = _elapsed_ms(persist_started)
+    _record_timings(timings, started)
+    
     return MessageResponse(
         message=message_request.message,
         response=bot_response,
@@ -156,6 +363,68 @@ def process_message(db: Session, chat_id: str, message_request: MessageRequest)
         timestamp=timestamp
     )
 
+def process_message_stream(db: Session, chat_id: str, message_request: MessageRequest) -> Iterator[Dict[str, Any]]:
+    """
+    Igual que process_message, pero entrega la respuesta de la IA en fragmentos
+    a medida que llega. El sentimiento se analiza mientras tanto; al terminar
+    guarda en BD y entrega un evento final con los mismos campos que
+    MessageResponse.
+    
+    Yields:
+        {"type": "token", "text": str} por cada fragmento y
+        {"type": "done", **MessageResponse} al final
+    """
+    started = time.perf_counter()
+    timings: Dict[str, float] = {}
+    
+    chat = db.query(Chat).filter(Chat.id == chat_id).first()
+    if not chat:
+        raise ValueError("Chat no encontrado")
+    
+    # Sin BETO listo el léxico de respaldo es inmediato: no hace falta lanzarlo aparte
+    sentiment_future = _start_sentiment(message_request) if _sentiment_model_loaded() else None
+    
+    # Obtener historial de conversación actual
+    conversation_history = chat.mensajes if chat.mensajes else []
+    
+    summary = get_chat_summary(db, chat_id)
+    timings["context"] = _elapsed_ms(started)
+    
+    ai_service = get_ai_service()
+    ai_provider_used = message_request.ai_provider or ai_service.default_provider
+    
+    llm_started = time.perf_counter()
+    chunks = []
+    for text in ai_service.stream_response(
+        message_request.message,
+        conversation_history,
+        provider=message_request.ai_provider,
+        api_key=message_request.api_key,
+        summary=summary
+    ):
+        chunks.append(text)
+        yield {"type": "token", "text": text}
+    
+    bot_response = "".join(chunks).strip()
+    timings["llm"] = _elapsed_ms(llm_started)
+    
+    sentiment_score = _score_message(chat_id, message_request, bot_response, sentiment_future, timings)
+    
+    persist_started = time.perf_counter()
+    timestamp = _save_message(db, chat, conversation_history, message_request, bot_response, sentiment_score)
+    schedule_summary_refresh(chat_id, len(chat.mensajes or []), summary)
+    timings["persist"] = _elapsed_ms(persist_started)
+    _record_timings(timings, started)
+    
+    response = MessageResponse(
+        message=message_request.message,
+        response=bot_response,
+        score=sentiment_score,
+        ai_provider=ai_provider_used,
+        timestamp=timestamp
+    )
+    yield {"type": "done", **response.model_dump()}
+
 def convert_sentiment_to_score(sentiment: str) -> float:
     """
     Convierte el resultado de sentimiento de texto a score numérico
@@ -0,0 +1,213 @@
+"""
+Autotune del perfil de inferencia de sentimientos en la máquina actual.
+
+Recorre hilos intra-op / inter-op, tamaños de lote y la espera máxima del
+micro-batcher, mide throughput y latencia con BETO y guarda el mejor perfil en
+el archivo que carga BetoSentimentAnalyzer al iniciar.
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.autotune_sentiment
+    python -m src.Backend.tools.autotune_sentiment --threads 1,2,4 --batch-sizes 8,16,32
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+SAMPLE_TEXTS = [
+    "Hola",
+    "¿Qué servicios ofrecen?",
+    "Gracias, me ayudó mucho la información.",
+    "El servicio fue pésimo, nadie me respondió el correo.",
+    "Necesito una cotización para automatizar una línea de empaque.",
+    "¿Dónde están ubicados?",
+    "Excelente atención, el equipo resolvió el problema del PLC en un día.",
+    "Llevo tres semanas esperando el soporte técnico y todavía no tengo respuesta, "
+    "estoy muy molesto porque la planta sigue detenida y nadie se hace responsable.",
+    "Me interesa saber cómo implementan Industria 4.0 en una PYME como la nuestra, "
+    "tenemos sensores antiguos y queremos integrarlos con un tablero de monitoreo.",
+    "ok",
+]
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def _sample(n: int) -> List[str]:
+    return [SAMPLE_TEXTS[i % len(SAMPLE_TEXTS)] for i in range(n)]
+
+def _run_worker(config: Dict) -> Dict:
+    """
+    Ejecuta las mediciones dentro de un proceso con los hilos ya fijados
+    (torch solo permite fijar hilos inter-op una vez por proceso)
+    """
+    os.environ["SENTIMENT_INTRA_OP_THREADS"] = str(config["intra_op_threads"])
+    os.environ["SENTIMENT_INTER_OP_THREADS"] = str(config["inter_op_threads"])
+    os.environ["SENTIMENT_MAX_WAIT_MS"] = "0"
+
+    from src.Backend.utils.beto_sentiment import BetoSentimentAnalyzer
+    from src.Backend.utils.micro_batcher import MicroBatcher
+
+    analyzer = BetoSentimentAnalyzer()
+    if analyzer.analyzer is None:
+        return {"error": "Modelo BETO no disponible"}
+
+    texts = _sample(config["samples"])
+    analyzer.analyze_batch(texts[:8])  # calentamiento
+
+    report = {"batch": [], "concurrent": []}
+
+    for batch_size in config.get("batch_sizes", []):
+        analyzer.batch_size = batch_size
+        start = time.perf_counter()
+        analyzer.analyze_batch(texts)
+        elapsed = time.perf_counter() - start
+        report["batch"].append({
+            "batch_size": batch_size,
+            "throughput": len(texts) / elapsed,
+        })
+
+    for max_wait_ms in config.get("max_waits", []):
+        analyzer.batch_size = config.get("batch_size", analyzer.batch_size)
+        analyzer._batcher = None
+        if max_wait_ms > 0:
+            analyzer._batcher = MicroBatcher(
+                analyzer._infer_batch,
+                max_batch_size=analyzer.batch_size,
+                max_wait_ms=max_wait_ms,
+                name=f"autotune-{max_wait_ms}"
+            )
+
+        latencies = []
+
+        def timed(text):
+            t0 = time.perf_counter()
+            analyzer.analyze_sentiment(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=config["concurrency"]) as pool:
+            list(pool.map(timed, texts))
+        elapsed = time.perf_counter() - start
+
+        report["concurrent"].append({
+            "max_wait_ms": max_wait_ms,
+            "throughput": len(texts) / elapsed,
+            "p50_ms": _percentile(latencies, 50),
+            "p95_ms": _percentile(latencies, 95),
+        })
+
+    return report
+
+def _spawn(config: Dict) -> Dict:
+    result = subprocess.run(
+        [sys.executable, "-m", "src.Backend.tools.autotune_sentiment", "--worker", json.dumps(config)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return {"error": result.stderr[-500:]}
+
+def _int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+def _float_list(value: str) -> List[float]:
+    return [float(v) for v in value.split(",") if v.strip()]
+
+def _default_threads() -> str:
+    cpus = os.cpu_count() or 1
+    options = sorted({1, 2, 4, 8, 16, cpus})
+    return ",".join(str(n) for n in options if n <= cpus)
+
+def main():
+    parser = argparse.ArgumentParser(description="Autotune del perfil de inferencia de sentimientos")
+    parser.add_argument("--threads", default=_default_threads(), help="Hilos intra-op a probar")
+    parser.add_argument("--inter-threads", default="1,2", help="Hilos inter-op a probar")
+    parser.add_argument("--batch-sizes", default="1,8,16,32,64", help="Tamaños de lote a probar")
+    parser.add_argument("--max-waits", default="0,2,5,10", help="Esperas del micro-batcher (ms)")
+    parser.add_argument("--concurrency", type=int, default=8, help="Peticiones concurrentes simuladas")
+    parser.add_argument("--samples", type=int, default=256, help="Textos por medición")
+    parser.add_argument("--p95-target-ms", type=float, default=250.0,
+                        help="Latencia p95 máxima aceptable para peticiones individuales")
+    parser.add_argument("--output", default=None, help="Archivo de perfil a escribir")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(_run_worker(json.loads(args.worker))))
+        return
+
+    from src.Backend.utils.inference_profile import InferenceProfile, save_inference_profile
+
+    # Fase 1: hilos x tamaño de lote, midiendo throughput de lotes
+    best = None
+    for intra in _int_list(args.threads):
+        for inter in _int_list(args.inter_threads):
+            print(f"🔍 intra-op={intra} inter-op={inter}...")
+            report = _spawn({
+                "intra_op_threads": intra,
+                "inter_op_threads": inter,
+                "batch_sizes": _int_list(args.batch_sizes),
+                "samples": args.samples,
+                "concurrency": args.concurrency,
+            })
+            if "error" in report:
+                print(f"   ❌ {report['error']}")
+                continue
+            for row in report["batch"]:
+                print(f"   batch={row['batch_size']:>3}  {row['throughput']:.1f} textos/s")
+                if best is None or row["throughput"] > best["throughput"]:
+                    best = {"intra_op_threads": intra, "inter_op_threads": inter, **row}
+
+    if best is None:
+        print("❌ No se pudo medir ninguna configuración")
+        sys.exit(1)
+
+    # Fase 2: espera del micro-batcher con peticiones concurrentes individuales
+    print(f"\n🔍 Micro-batching con intra-op={best['intra_op_threads']} "
+          f"inter-op={best['inter_op_threads']} batch={best['batch_size']}...")
+    report = _spawn({
+        "intra_op_threads": best["intra_op_threads"],
+        "inter_op_threads": best["inter_op_threads"],
+        "batch_size": best["batch_size"],
+        "max_waits": _float_list(args.max_waits),
+        "samples": args.samples,
+        "concurrency": args.concurrency,
+    })
+    concurrent = report.get("concurrent", [])
+    for row in concurrent:
+        print(f"   max_wait={row['max_wait_ms']:>5}ms  {row['throughput']:.1f} textos/s  "
+              f"p50={row['p50_ms']:.1f}ms p95={row['p95_ms']:.1f}ms")
+
+    eligible = [row for row in concurrent if row["p95_ms"] <= args.p95_target_ms] or concurrent
+    best_wait = max(eligible, key=lambda row: row["throughput"]) if eligible else {"max_wait_ms": 0.0}
+
+    profile = InferenceProfile(
+        intra_op_threads=best["intra_op_threads"],
+        inter_op_threads=best["inter_op_threads"],
+        batch_size=best["batch_size"],
+        max_wait_ms=best_wait["max_wait_ms"],
+    )
+    path = save_inference_profile(profile, args.output, extra={
+        "cpu_count": os.cpu_count(),
+        "batch_throughput": best["throughput"],
+        "concurrent": best_wait,
+        "measured_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    print(f"\n✅ Perfil guardado en {path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,50 @@
+"""
+Puntúa y guarda los mensajes que quedaron sin score en la base de datos.
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.backfill_scores
+    python -m src.Backend.tools.backfill_scores --method llm --batch-size 20
+    python -m src.Backend.tools.backfill_scores --dry-run
+
+Con el servidor en marcha se puede lanzar lo mismo con
+POST /admin/scores/backfill.
+"""
+
+import json
+import argparse
+from dataclasses import asdict
+
+from src.Backend.database import Session as DBSession
+from src.Backend.utils.score_backfill import (
+    BACKFILL_METHODS, SCORE_BACKFILL_BATCH_SIZE, SCORE_BACKFILL_METHOD,
+    iter_unscored_messages, run_backfill
+)
+
+def main():
+    parser = argparse.ArgumentParser(description="Backfill de scores para mensajes sin score")
+    parser.add_argument("--method", default=SCORE_BACKFILL_METHOD, choices=BACKFILL_METHODS,
+                        help="auto (BETO si está cargado), beto o llm")
+    parser.add_argument("--batch-size", type=int, default=SCORE_BACKFILL_BATCH_SIZE, help="Mensajes por lote")
+    parser.add_argument("--limit", type=int, default=None, help="Máximo de mensajes a puntuar")
+    parser.add_argument("--dry-run", action="store_true", help="Solo cuenta los mensajes sin score")
+    args = parser.parse_args()
+
+    db = DBSession()
+    try:
+        if args.dry_run:
+            pending = sum(1 for _ in iter_unscored_messages(db))
+            print(f"📝 Mensajes sin score: {pending}")
+            return
+
+        result = run_backfill(db, method=args.method, batch_size=args.batch_size, limit=args.limit)
+        print(json.dumps(asdict(result), indent=2, ensure_ascii=False))
+        if result.errors:
+            print(f"\n⚠️ {len(result.errors)} lotes fallaron")
+        else:
+            print(f"\n✅ {result.messages_scored} mensajes puntuados en {result.batches} lotes "
+                  f"({result.method}, {result.duration_s} s)")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Benchmark del motor de léxicos frente a los bucles `in` anteriores.
+
+Compara tiempo por mensaje y muestra los mensajes en los que ambos métodos
+difieren (p. ej. "no" dentro de "bueno").
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.benchmark_lexicon
+    python -m src.Backend.tools.benchmark_lexicon --repeat 20000
+"""
+
+import argparse
+import random
+import string
+import timeit
+
+from src.Backend.utils.scoring import (
+    PALABRAS_POSITIVAS, PALABRAS_NEGATIVAS, analyze_sentiment_basic
+)
+from src.Backend.utils.beto_sentiment import (
+    FALLBACK_POSITIVE_WORDS, FALLBACK_NEGATIVE_WORDS, FALLBACK_LEXICON
+)
+from src.Backend.utils.lexicon import LexiconMatcher
+
+MESSAGES = [
+    "Hola, ¿qué servicios ofrecen?",
+    "Todo muy bueno, gracias por la ayuda",
+    "Nunca me respondieron el correo, pésimo servicio",
+    "No me gusta que el soporte tarde tanto",
+    "Me encanta la plataforma, es increíble",
+    "¿Pueden integrar sensores antiguos con un tablero nuevo?",
+    "El tablero marca un error en la línea 3 y nadie sabe por qué",
+    "PÉSIMO. NO FUNCIONA.",
+    "Buenas noches, necesito una cotización",
+    "Estoy contento con el resultado del proyecto de automatización",
+    # "si" condicional frente al "sí" afirmativo del léxico (tilde diacrítica)
+    "Si no funciona te aviso",
+    "Si el sensor falla me llaman",
+    "Sí, quedó perfecto",
+]
+
+def legacy_basic(mensaje):
+    mensaje_lower = mensaje.lower()
+    positivas = sum(1 for palabra in PALABRAS_POSITIVAS if palabra in mensaje_lower)
+    negativas = sum(1 for palabra in PALABRAS_NEGATIVAS if palabra in mensaje_lower)
+    if positivas > negativas:
+        return "positivo"
+    elif negativas > positivas:
+        return "negativo"
+    return "neutro"
+
+def legacy_fallback(text):
+    text_lower = text.lower()
+    pos_count = sum(1 for word in FALLBACK_POSITIVE_WORDS if word in text_lower)
+    neg_count = sum(1 for word in FALLBACK_NEGATIVE_WORDS if word in text_lower)
+    return pos_count, neg_count
+
+def engine_fallback(text):
+    counts = FALLBACK_LEXICON.count(text)
+    return counts.get("POS", 0), counts.get("NEG", 0)
+
+def _per_message_us(fn, repeat):
+    total = timeit.timeit(lambda: [fn(m) for m in MESSAGES], number=repeat)
+    return total / (repeat * len(MESSAGES)) * 1e6
+
+def _scaling(repeat):
+    """Costo por mensaje a medida que crece el léxico"""
+    rng = random.Random(7)
+    print("Escalado con el tamaño del léxico")
+    for size in (40, 200, 1000):
+        words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))) for _ in range(size)]
+        half = size // 2
+        matcher = LexiconMatcher({"POS": words[:half], "NEG": words[half:]})
+
+        def legacy(text, pos=words[:half], neg=words[half:]):
+            lower = text.lower()
+            return sum(1 for w in pos if w in lower), sum(1 for w in neg if w in lower)
+
+        legacy_us = _per_message_us(legacy, max(1, repeat // 10))
+        engine_us = _per_message_us(matcher.count, max(1, repeat // 10))
+        print(f"   {size:>5} palabras: bucles {legacy_us:8.2f} µs  motor {engine_us:8.2f} µs  "
+              f"({legacy_us / engine_us:.1f}x)")
+    print()
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del motor de léxicos")
+    parser.add_argument("--repeat", type=int, default=5000, help="Repeticiones del conjunto de mensajes")
+    args = parser.parse_args()
+
+    print(f"📏 {len(MESSAGES)} mensajes x {args.repeat} repeticiones\n")
+    rows = [
+        ("scoring.analyze_sentiment_basic", legacy_basic, analyze_sentiment_basic),
+        ("BetoSentimentAnalyzer._fallback_analysis", legacy_fallback, engine_fallback),
+    ]
+    for name, legacy, engine in rows:
+        legacy_us = _per_message_us(legacy, args.repeat)
+        engine_us = _per_message_us(engine, args.repeat)
+        print(f"{name}")
+        print(f"   bucles 'in': {legacy_us:8.2f} µs/mensaje")
+        print(f"   motor:       {engine_us:8.2f} µs/mensaje  ({legacy_us / engine_us:.1f}x)")
+
+        diffs = [(m, legacy(m), engine(m)) for m in MESSAGES if legacy(m) != engine(m)]
+        for message, old, new in diffs:
+            print(f"   ≠ {message!r}: antes={old} ahora={new}")
+        print()
+
+    _scaling(args.repeat)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+"""
+Harness de selección de modelo de sentimientos.
+
+Evalúa modelos candidatos (BETO y clasificadores más pequeños) sobre el set
+etiquetado local `tools/fixtures/sentiment_es.jsonl` y reporta exactitud,
+latencia p50/p99 por mensaje, throughput en lote, tiempo de carga y memoria
+residente. Cada candidato se mide en un proceso aparte para que la memoria y
+los hilos de torch de uno no contaminen al siguiente.
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.benchmark_sentiment_models
+    python -m src.Backend.tools.benchmark_sentiment_models --models finiteautomata/beto-sentiment-analysis,pysentimiento/robertuito-sentiment-analysis
+    python -m src.Backend.tools.benchmark_sentiment_models --json resultados.json
+
+El modelo elegido se configura con la variable de entorno SENTIMENT_MODEL.
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+from typing import Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "sentiment_es.jsonl")
+
+DEFAULT_CANDIDATES = [
+    "finiteautomata/beto-sentiment-analysis",
+    "pysentimiento/robertuito-sentiment-analysis",
+    "lxyuan/distilbert-base-multilingual-cased-sentiments-student",
+    "cardiffnlp/twitter-xlm-roberta-base-sentiment",
+]
+
+def _rss_mb() -> float:
+    """Memoria residente actual del proceso (MB)"""
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))
+    return ordered[index]
+
+def load_fixture(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def _evaluate(model_name: str, fixture_path: str, rounds: int) -> Dict:
+    """Mide un modelo dentro del proceso actual"""
+    os.environ["SENTIMENT_MAX_WAIT_MS"] = "0"
+    rss_before = _rss_mb()
+
+    from src.Backend.utils.beto_sentiment import BetoSentimentAnalyzer
+
+    start = time.perf_counter()
+    analyzer = BetoSentimentAnalyzer(model_name=model_name)
+    load_s = time.perf_counter() - start
+    if analyzer.analyzer is None:
+        return {"model": model_name, "error": "No se pudo cargar el modelo"}
+
+    samples = load_fixture(fixture_path)
+    texts = [sample["text"] for sample in samples]
+    analyzer.analyze_sentiment(texts[0])  # calentamiento
+
+    latencies = []
+    correct = 0
+    for _ in range(rounds):
+        correct = 0
+        for sample in samples:
+            t0 = time.perf_counter()
+            result = analyzer.analyze_sentiment(sample["text"])
+            latencies.append((time.perf_counter() - t0) * 1000)
+            correct += result.get("sentiment") == sample["label"]
+
+    start = time.perf_counter()
+    for _ in range(rounds):
+        analyzer.analyze_batch(texts)
+    batch_s = time.perf_counter() - start
+
+    return {
+        "model": model_name,
+        "accuracy": correct / len(samples),
+        "p50_ms": _percentile(latencies, 50),
+        "p99_ms": _percentile(latencies, 99),
+        "throughput": len(texts) * rounds / batch_s,
+        "load_s": load_s,
+        "rss_mb": _rss_mb(),
+        "model_rss_mb": _rss_mb() - rss_before,
+    }
+
+def _spawn(model_name: str, fixture_path: str, rounds: int) -> Dict:
+    config = {"model": model_name, "fixture": fixture_path, "rounds": rounds}
+    result = subprocess.run(
+        [sys.executable, "-m", "src.Backend.tools.benchmark_sentiment_models", "--worker", json.dumps(config)],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+    )
+    for line in reversed(result.stdout.splitlines()):
+        if line.startswith("{"):
+            return json.loads(line)
+    return {"model": model_name, "error": result.stderr[-500:]}
+
+def main():
+    parser = argparse.ArgumentParser(description="Comparación de modelos de sentimiento en español")
+    parser.add_argument("--models", default=",".join(DEFAULT_CANDIDATES), help="IDs de modelos separados por coma")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="Archivo JSONL con {text, label}")
+    parser.add_argument("--rounds", type=int, default=3, help="Pasadas sobre el fixture por modelo")
+    parser.add_argument("--json", default=None, help="Guardar los resultados en este archivo")
+    parser.add_argument("--worker", default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        config = json.loads(args.worker)
+        print(json.dumps(_evaluate(config["model"], config["fixture"], config["rounds"])))
+        return
+
+    results = []
+    for model_name in [m.strip() for m in args.models.split(",") if m.strip()]:
+        print(f"🔍 Evaluando {model_name}...")
+        results.append(_spawn(model_name, args.fixture, args.rounds))
+
+    print()
+    print(f"{'modelo':<64} {'exactitud':>9} {'p50 ms':>8} {'p99 ms':>8} {'textos/s':>9} {'carga s':>8} {'RSS MB':>8}")
+    for row in results:
+        if "error" in row:
+            print(f"{row['model']:<64} ❌ {row['error'].strip().splitlines()[-1] if row['error'].strip() else 'error'}")
+            continue
+        print(f"{row['model']:<64} {row['accuracy']:>9.1%} {row['p50_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+              f"{row['throughput']:>9.1f} {row['load_s']:>8.1f} {row['rss_mb']:>8.0f}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"\n💾 Resultados guardados en {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Mide el arranque en frío del subsistema de sentimientos.
+
+Cada corrida es un proceso nuevo que importa el módulo, construye el
+analizador y ejecuta la primera inferencia, igual que un arranque del
+servidor. Reporta el tiempo total y el desglose que registra el analizador
+(tokenizer, pesos, pipeline, primera inferencia).
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.measure_cold_start
+    SENTIMENT_OFFLINE=1 python -m src.Backend.tools.measure_cold_start --runs 5
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+def _child():
+    started = time.perf_counter()
+    from src.Backend.utils.beto_sentiment import BetoSentimentAnalyzer
+    imported = time.perf_counter()
+    analyzer = BetoSentimentAnalyzer()
+    analyzer.analyze_sentiment("Hola, ¿qué servicios ofrecen?")
+    finished = time.perf_counter()
+    print(json.dumps({
+        "import_ms": (imported - started) * 1000,
+        "total_ms": (finished - started) * 1000,
+        "model_loaded": analyzer.analyzer is not None,
+        "model_source": analyzer.model_source,
+        "load_timings": analyzer.load_timings,
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description="Tiempo de arranque en frío del análisis de sentimientos")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        _child()
+        return
+
+    runs = []
+    for i in range(args.runs):
+        result = subprocess.run(
+            [sys.executable, "-m", "src.Backend.tools.measure_cold_start", "--child"],
+            cwd=REPO_ROOT, capture_output=True, text=True
+        )
+        line = next((l for l in reversed(result.stdout.splitlines()) if l.startswith("{")), None)
+        if line is None:
+            print(f"❌ Corrida {i + 1} falló:\n{result.stderr[-500:]}")
+            sys.exit(1)
+        data = json.loads(line)
+        runs.append(data)
+        timings = data["load_timings"]
+        print(f"Corrida {i + 1}: total {data['total_ms']:.0f} ms "
+              f"(import {data['import_ms']:.0f}, tokenizer {timings.get('tokenizer_ms', 0):.0f}, "
+              f"pesos {timings.get('model_ms', 0):.0f}, pipeline {timings.get('pipeline_ms', 0):.0f}, "
+              f"1ª inferencia {timings.get('warmup_ms', 0):.0f}) - origen: {data['model_source']}")
+
+    totals = sorted(run["total_ms"] for run in runs)
+    print(f"\n⏱️  Mediana: {totals[len(totals) // 2]:.0f} ms  (min {totals[0]:.0f}, max {totals[-1]:.0f})")
+    if not all(run["model_loaded"] for run in runs):
+        print("⚠️ El modelo no se cargó; los tiempos corresponden al análisis de respaldo")
+
+if __name__ == "__main__":
+    main()
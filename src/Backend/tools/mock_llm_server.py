@@ -0,0 +1,391 @@
+"""
+Servidor local que imita las APIs de Gemini y Mistral para pruebas de carga.
+
+Implementa las formas de respuesta que usa el backend, sin gastar cuota real:
+    POST /v1beta/models/{modelo}:generateContent
+    POST /v1beta/models/{modelo}:streamGenerateContent?alt=sse
+    POST /v1/chat/completions            (con y sin "stream": true)
+    GET  /v1beta/models, GET /v1/models  (listado de modelos)
+    POST /v1beta/cachedContents, PATCH /v1beta/cachedContents/{id}
+    GET  /__mock/stats                   (contadores del servidor)
+
+Con responseMimeType "application/json" (Gemini) o response_format
+json_object (Mistral) responde el JSON de salida estructurada.
+
+Permite simular latencia (distribución configurable), errores 500 e
+inyección de 429 con Retry-After, y grabar respuestas reales para
+reproducirlas después sin red.
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.mock_llm_server --port 8089
+    python -m src.Backend.tools.mock_llm_server --latency lognormal:800,0.5 --error-rate 0.02 --rate-limit-rate 0.05
+    python -m src.Backend.tools.mock_llm_server --record grabacion.jsonl   (reenvía a las APIs reales y graba)
+    python -m src.Backend.tools.mock_llm_server --replay grabacion.jsonl
+
+y en el backend:
+    GEMINI_API_BASE_URL=http://127.0.0.1:8089 MISTRAL_API_BASE_URL=http://127.0.0.1:8089
+
+Distribuciones de latencia (milisegundos hasta el primer byte):
+    fixed:300 | uniform:200,900 | normal:600,150 | lognormal:mediana,sigma
+"""
+
+import re
+import sys
+import json
+import math
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import requests
+
+GEMINI_UPSTREAM = "https://generativelanguage.googleapis.com"
+MISTRAL_UPSTREAM = "https://api.aimlapi.com"
+
+_GEMINI_MODEL_PATH = re.compile(r"^/v1beta/models/([^/:]+):(generateContent|streamGenerateContent)$")
+
+FILLER = (
+    "En INGE LEAN diseñamos soluciones de ingeniería a medida con hardware y software industrial, "
+    "automatización e inteligencia artificial aplicada a procesos productivos, siempre con talento "
+    "colombiano y enfoque en resultados medibles para cada cliente."
+).split()
+
+def parse_latency(spec: str) -> Callable[[], float]:
+    """
+    Convierte "tipo:parámetros" en una función que devuelve milisegundos
+    """
+    kind, _, params = spec.partition(":")
+    values = [float(value) for value in params.split(",") if value.strip()] if params else []
+    if kind == "fixed":
+        return lambda: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        median, sigma = values[0], values[1]
+        return lambda: random.lognormvariate(math.log(median), sigma)
+    raise argparse.ArgumentTypeError(f"Distribución de latencia desconocida: {spec}")
+
+def request_key(method: str, path: str, body: bytes) -> str:
+    """Clave de grabación: método, ruta (sin query) y cuerpo"""
+    return hashlib.sha256(method.encode() + b" " + path.encode() + b"\n" + body).hexdigest()
+
+class MockState:
+    """Configuración y contadores compartidos por los hilos del servidor"""
+
+    def __init__(self, args: argparse.Namespace):
+        self.latency = parse_latency(args.latency)
+        self.chunk_delay_ms = args.chunk_delay_ms
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after = args.retry_after
+        self.response_words = args.response_words
+        self.record_path = args.record
+        self.gemini_upstream = args.gemini_upstream.rstrip("/")
+        self.mistral_upstream = args.mistral_upstream.rstrip("/")
+        self.recordings: Dict[str, Dict[str, Any]] = {}
+        self.counters = Counter()
+        self.lock = threading.Lock()
+        self._cache_ids = 0
+        if args.replay:
+            with open(args.replay, "r", encoding="utf-8") as f:
+                for line in f:
+                    if line.strip():
+                        entry = json.loads(line)
+                        self.recordings[entry["key"]] = entry
+
+    def count(self, name: str):
+        with self.lock:
+            self.counters[name] += 1
+
+    def next_cache_id(self) -> int:
+        with self.lock:
+            self._cache_ids += 1
+            return self._cache_ids
+
+    def record(self, entry: Dict[str, Any]):
+        with self.lock:
+            with open(self.record_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+def reply_text(prompt: str, words: int) -> str:
+    """Respuesta sintética determinista a partir del último mensaje"""
+    prompt = " ".join(prompt.split())[:80]
+    body = " ".join(FILLER[i % len(FILLER)] for i in range(max(1, words)))
+    return f"Respuesta simulada a «{prompt}». {body}"
+
+def structured_text(prompt: str, text: str) -> str:
+    """JSON de salida estructurada (reply, score, sentiment) con score determinista"""
+    score = int(hashlib.sha256(prompt.encode("utf-8")).hexdigest(), 16) % 10 + 1
+    sentiment = "positivo" if score >= 7 else "negativo" if score <= 3 else "neutral"
+    return json.dumps({"reply": text, "score": score, "sentiment": sentiment}, ensure_ascii=False)
+
+def split_chunks(text: str, size: int = 4) -> List[str]:
+    words = text.split(" ")
+    return [" ".join(words[i:i + size]) + (" " if i + size < len(words) else "") for i in range(0, len(words), size)]
+
+def last_gemini_prompt(payload: Dict[str, Any]) -> str:
+    for content in reversed(payload.get("contents") or []):
+        parts = content.get("parts") or []
+        if parts:
+            return parts[-1].get("text", "")
+    return ""
+
+def last_openai_prompt(payload: Dict[str, Any]) -> str:
+    for message in reversed(payload.get("messages") or []):
+        if message.get("role") == "user":
+            return message.get("content", "")
+    return ""
+
+class MockHandler(BaseHTTPRequestHandler):
+    server_version = "MockLLM/1.0"
+    protocol_version = "HTTP/1.1"
+    state: MockState = None
+
+    def log_message(self, fmt, *args):
+        pass
+
+    # --- utilidades de respuesta ---
+    def _send_json(self, status: int, payload: Any, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_sse(self, events: List[str]):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        for index, event in enumerate(events):
+            if index and self.state.chunk_delay_ms:
+                time.sleep(self.state.chunk_delay_ms / 1000.0)
+            self.wfile.write(f"data: {event}\n\n".encode("utf-8"))
+            self.wfile.flush()
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _inject_failure(self) -> bool:
+        """Aplica la latencia y, según las tasas configuradas, responde 429 o 500"""
+        time.sleep(self.state.latency() / 1000.0)
+        roll = random.random()
+        if roll < self.state.rate_limit_rate:
+            self.state.count("injected_429")
+            self._send_json(429, {"error": {"code": 429, "status": "RESOURCE_EXHAUSTED",
+                                            "message": "Simulated rate limit"}},
+                            {"Retry-After": str(self.state.retry_after)})
+            return True
+        if roll < self.state.rate_limit_rate + self.state.error_rate:
+            self.state.count("injected_500")
+            self._send_json(500, {"error": {"code": 500, "status": "INTERNAL", "message": "Simulated error"}})
+            return True
+        return False
+
+    # --- grabación y reproducción ---
+    def _upstream_for(self, path: str) -> str:
+        return self.state.gemini_upstream if path.startswith("/v1beta") else self.state.mistral_upstream
+
+    def _forward_and_record(self, method: str, body: bytes) -> None:
+        parts = urlsplit(self.path)
+        headers = {name: value for name, value in self.headers.items()
+                   if name.lower() in ("content-type", "authorization", "x-goog-api-key", "accept")}
+        url = f"{self._upstream_for(parts.path)}{self.path}"
+        upstream = requests.request(method, url, data=body or None, headers=headers, timeout=60)
+        self.state.record({
+            "key": request_key(method, parts.path, body),
+            "method": method,
+            "path": parts.path,
+            "status": upstream.status_code,
+            "content_type": upstream.headers.get("Content-Type", "application/json"),
+            "body": upstream.text,
+        })
+        self.state.count("recorded")
+        payload = upstream.content
+        self.send_response(upstream.status_code)
+        self.send_header("Content-Type", upstream.headers.get("Content-Type", "application/json"))
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _replay(self, method: str, body: bytes) -> bool:
+        entry = self.state.recordings.get(request_key(method, urlsplit(self.path).path, body))
+        if entry is None:
+            return False
+        self.state.count("replayed")
+        time.sleep(self.state.latency() / 1000.0)
+        if entry["content_type"].startswith("text/event-stream"):
+            events = [line[len("data:"):].strip() for line in entry["body"].splitlines() if line.startswith("data:")]
+            self._send_sse(events)
+        else:
+            payload = entry["body"].encode("utf-8")
+            self.send_response(entry["status"])
+            self.send_header("Content-Type", entry["content_type"])
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+        return True
+
+    # --- respuestas sintéticas ---
+    def _gemini(self, model: str, method: str, payload: Dict[str, Any]):
+        text = reply_text(last_gemini_prompt(payload), self.state.response_words)
+        if (payload.get("generationConfig") or {}).get("responseMimeType") == "application/json":
+            text = structured_text(last_gemini_prompt(payload), text)
+        usage = {"promptTokenCount": len(json.dumps(payload)) // 4, "candidatesTokenCount": len(text) // 4}
+        usage["totalTokenCount"] = usage["promptTokenCount"] + usage["candidatesTokenCount"]
+        if payload.get("cachedContent"):
+            usage["cachedContentTokenCount"] = 1024
+        if method == "generateContent":
+            self._send_json(200, {
+                "candidates": [{"content": {"role": "model", "parts": [{"text": text}]}, "finishReason": "STOP"}],
+                "usageMetadata": usage,
+                "modelVersion": model,
+            })
+            return
+        chunks = split_chunks(text)
+        events = []
+        for index, chunk in enumerate(chunks):
+            event = {"candidates": [{"content": {"role": "model", "parts": [{"text": chunk}]}}]}
+            if index == len(chunks) - 1:
+                event["candidates"][0]["finishReason"] = "STOP"
+                event["usageMetadata"] = usage
+            events.append(json.dumps(event, ensure_ascii=False))
+        self._send_sse(events)
+
+    def _chat_completions(self, payload: Dict[str, Any]):
+        text = reply_text(last_openai_prompt(payload), self.state.response_words)
+        if (payload.get("response_format") or {}).get("type") == "json_object":
+            text = structured_text(last_openai_prompt(payload), text)
+        model = payload.get("model", "mock")
+        created = int(time.time())
+        if not payload.get("stream"):
+            self._send_json(200, {
+                "id": f"chatcmpl-mock-{created}",
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": {"prompt_tokens": len(json.dumps(payload)) // 4, "completion_tokens": len(text) // 4},
+            })
+            return
+        events = [
+            json.dumps({"id": f"chatcmpl-mock-{created}", "object": "chat.completion.chunk", "model": model,
+                        "choices": [{"index": 0, "delta": {"content": chunk}, "finish_reason": None}]},
+                       ensure_ascii=False)
+            for chunk in split_chunks(text)
+        ]
+        events.append("[DONE]")
+        self._send_sse(events)
+
+    # --- enrutamiento ---
+    def _handle(self, method: str):
+        path = urlsplit(self.path).path
+        body = self._read_body() if method in ("POST", "PATCH") else b""
+        self.state.count(f"{method} {path.split(':')[-1] if ':' in path else path}")
+
+        if path == "/__mock/stats":
+            with self.state.lock:
+                self._send_json(200, dict(self.state.counters))
+            return
+        if method == "HEAD":
+            self.send_response(200)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        if self.state.record_path:
+            self._forward_and_record(method, body)
+            return
+        if self._replay(method, body):
+            return
+        if self._inject_failure():
+            return
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            self._send_json(400, {"error": {"code": 400, "message": "JSON inválido"}})
+            return
+
+        match = _GEMINI_MODEL_PATH.match(path)
+        if method == "POST" and match:
+            self._gemini(match.group(1), match.group(2), payload)
+        elif method == "POST" and path == "/v1/chat/completions":
+            self._chat_completions(payload)
+        elif method == "GET" and path == "/v1beta/models":
+            self._send_json(200, {"models": [{"name": "models/gemini-2.0-flash"},
+                                             {"name": "models/gemini-1.5-flash-latest"}]})
+        elif method == "GET" and path == "/v1/models":
+            self._send_json(200, {"object": "list", "data": [{"id": "mistralai/mistral-tiny", "object": "model"}]})
+        elif method == "POST" and path == "/v1beta/cachedContents":
+            self._send_json(200, {"name": f"cachedContents/mock-{self.state.next_cache_id()}",
+                                  "model": payload.get("model"), "ttl": payload.get("ttl")})
+        elif method == "PATCH" and path.startswith("/v1beta/cachedContents/"):
+            self._send_json(200, {"name": path[len("/v1beta/"):], "ttl": payload.get("ttl")})
+        else:
+            self._send_json(404, {"error": {"code": 404, "message": f"Ruta no simulada: {method} {path}"}})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_HEAD(self):
+        self._handle("HEAD")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+def build_server(args: argparse.Namespace) -> Tuple[ThreadingHTTPServer, MockState]:
+    state = MockState(args)
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"state": state})
+    server = ThreadingHTTPServer((args.host, args.port), handler)
+    server.daemon_threads = True
+    return server, state
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Servidor simulado de Gemini y Mistral para pruebas de carga")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", default="fixed:0", help="Latencia hasta el primer byte (ver docstring)")
+    parser.add_argument("--chunk-delay-ms", type=float, default=30.0, help="Pausa entre fragmentos en streaming")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fracción de respuestas 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Fracción de respuestas 429")
+    parser.add_argument("--retry-after", type=int, default=1, help="Retry-After de los 429 simulados (s)")
+    parser.add_argument("--response-words", type=int, default=60, help="Palabras de la respuesta sintética")
+    parser.add_argument("--record", help="Reenvía a las APIs reales y graba las respuestas en este JSONL")
+    parser.add_argument("--replay", help="Reproduce las respuestas grabadas en este JSONL")
+    parser.add_argument("--gemini-upstream", default=GEMINI_UPSTREAM)
+    parser.add_argument("--mistral-upstream", default=MISTRAL_UPSTREAM)
+    args = parser.parse_args(argv)
+    parse_latency(args.latency)
+    return args
+
+def main(argv: Optional[List[str]] = None):
+    args = parse_args(argv)
+    server, _ = build_server(args)
+    mode = "grabando" if args.record else ("reproduciendo" if args.replay else "sintético")
+    print(f"🧪 Mock LLM en http://{args.host}:{args.port} (modo {mode}, latencia {args.latency})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
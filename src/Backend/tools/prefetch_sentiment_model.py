@@ -0,0 +1,111 @@
+"""
+Descarga, convierte a safetensors y verifica el modelo de sentimientos en
+tiempo de build, para que el servidor arranque sin tocar la red.
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.prefetch_sentiment_model
+    python -m src.Backend.tools.prefetch_sentiment_model --model pysentimiento/robertuito-sentiment-analysis
+    python -m src.Backend.tools.prefetch_sentiment_model --verify-only
+    python -m src.Backend.tools.prefetch_sentiment_model --optional
+
+El destino es SENTIMENT_MODEL_DIR (por defecto models/sentiment). Luego se
+arranca con SENTIMENT_OFFLINE=1 para que la carga sea solo local.
+
+Con --optional un fallo (descarga, hashes o prueba offline) no corta el
+build: se borra el directorio y el servidor arranca con el análisis básico.
+"""
+
+import os
+import sys
+import shutil
+import argparse
+import tempfile
+
+# El build puede correr con las variables del servicio (Render aplica
+# HF_HUB_OFFLINE=1 también al build) y huggingface_hub las lee al importarse:
+# se quitan antes de importar transformers para que la descarga use el Hub.
+# La prueba offline usa SENTIMENT_OFFLINE, que carga solo archivos locales.
+OFFLINE_ENV_VARS = ("HF_HUB_OFFLINE", "TRANSFORMERS_OFFLINE")
+for _name in OFFLINE_ENV_VARS:
+    os.environ.pop(_name, None)
+
+from src.Backend.utils.beto_sentiment import DEFAULT_SENTIMENT_MODEL
+from src.Backend.utils.model_artifacts import get_model_dir, write_manifest, verify_manifest
+
+def prefetch(model_id: str, output_dir: str):
+    """Descarga el modelo y lo guarda en output_dir con pesos safetensors"""
+    from transformers import AutoTokenizer, AutoModelForSequenceClassification
+
+    # La caché del Hub solo se usa durante el build y se descarta al final
+    cache_dir = tempfile.mkdtemp(prefix="hf_cache_")
+    try:
+        print(f"⬇️  Descargando {model_id}...")
+        tokenizer = AutoTokenizer.from_pretrained(model_id, cache_dir=cache_dir)
+        model = AutoModelForSequenceClassification.from_pretrained(model_id, cache_dir=cache_dir)
+
+        if os.path.exists(output_dir):
+            shutil.rmtree(output_dir)
+        os.makedirs(output_dir, exist_ok=True)
+
+        print(f"💾 Guardando en {output_dir} (safetensors)...")
+        tokenizer.save_pretrained(output_dir)
+        model.save_pretrained(output_dir, safe_serialization=True)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    manifest = write_manifest(output_dir, model_id)
+    print(f"📝 Manifiesto con {len(manifest['files'])} archivos")
+
+def smoke_test(model_id: str, output_dir: str) -> bool:
+    """Carga el modelo en modo offline desde output_dir y ejecuta una inferencia"""
+    os.environ["SENTIMENT_MODEL"] = model_id
+    os.environ["SENTIMENT_MODEL_DIR"] = output_dir
+    os.environ["SENTIMENT_OFFLINE"] = "1"
+    os.environ["SENTIMENT_MAX_WAIT_MS"] = "0"
+
+    from src.Backend.utils.beto_sentiment import BetoSentimentAnalyzer
+
+    analyzer = BetoSentimentAnalyzer()
+    if analyzer.analyzer is None:
+        return False
+    result = analyzer.analyze_sentiment("¡Excelente servicio, muchas gracias!")
+    print(f"🧪 Prueba offline: {result.get('sentiment')} ({result.get('confidence', 0):.2f}) "
+          f"- carga en {analyzer.load_timings.get('total_ms', 0):.0f} ms")
+    return result.get("analysis_type", "").startswith("beto_model")
+
+def main():
+    parser = argparse.ArgumentParser(description="Prefetch del modelo de sentimientos")
+    parser.add_argument("--model", default=os.getenv("SENTIMENT_MODEL", DEFAULT_SENTIMENT_MODEL))
+    parser.add_argument("--output", default=get_model_dir())
+    parser.add_argument("--verify-only", action="store_true", help="Solo verificar los artefactos existentes")
+    parser.add_argument("--optional", action="store_true",
+                        help="Un fallo no corta el build; se arranca con el análisis básico")
+    args = parser.parse_args()
+
+    def fail(message: str):
+        print(f"❌ {message}")
+        if args.optional:
+            shutil.rmtree(args.output, ignore_errors=True)
+            print("⚠️ Se continúa sin modelo local: el servidor usará el análisis básico")
+            sys.exit(0)
+        sys.exit(1)
+
+    if not args.verify_only:
+        try:
+            prefetch(args.model, args.output)
+        except Exception as e:
+            fail(f"No se pudo descargar {args.model}: {e}")
+
+    valid, errors = verify_manifest(args.output)
+    if not valid:
+        for error in errors:
+            print(f"❌ {error}")
+        fail("Los artefactos no coinciden con el manifiesto")
+    print("✅ Hashes verificados")
+
+    if not smoke_test(args.model, args.output):
+        fail("El modelo no pudo cargarse en modo offline")
+    print("✅ Modelo listo para carga offline")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Ajuste del umbral de la caché semántica con pares de preguntas etiquetados.
+
+Cada línea de tools/fixtures/semantic_cache_pairs.jsonl tiene una pregunta
+ya respondida ("cached"), una nueva ("query") y si deben compartir respuesta
+("same"). Para cada umbral se cuenta cuántos pares acierta la caché (con
+todas sus reglas: pregunta independiente, números, nombres propios y
+negaciones) y se sugiere, entre los umbrales que no reutilizan ninguna
+respuesta equivocada y logran más aciertos, el del medio del rango (el de
+mayor margen hacia ambos lados).
+
+Uso (desde la raíz del repositorio):
+    python -m src.Backend.tools.tune_semantic_cache
+    python -m src.Backend.tools.tune_semantic_cache --fixture otros_pares.jsonl --verbose
+"""
+
+import os
+import json
+import argparse
+from typing import Dict, List
+
+from src.Backend.utils.semantic_cache import SEMANTIC_CACHE_THRESHOLD, SemanticCache
+
+DEFAULT_FIXTURE = os.path.join(os.path.dirname(os.path.realpath(__file__)), "fixtures", "semantic_cache_pairs.jsonl")
+NAMESPACE = "tune"
+
+def load_pairs(path: str) -> List[Dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+def pair_similarity(pair: Dict) -> float:
+    """Similitud con la que la caché respondería el par (-1 si alguna regla lo descarta)"""
+    cache = SemanticCache(max_entries=4, threshold=-1.0, path=None, enabled=True)
+    cache.put(pair["cached"], "respuesta", NAMESPACE)
+    match = cache.get(pair["query"], NAMESPACE)
+    return match["similarity"] if match else -1.0
+
+def main():
+    parser = argparse.ArgumentParser(description="Ajuste del umbral de la caché semántica")
+    parser.add_argument("--fixture", default=DEFAULT_FIXTURE, help="JSONL con pares cached/query/same")
+    parser.add_argument("--verbose", action="store_true", help="Muestra la similitud de cada par")
+    args = parser.parse_args()
+
+    pairs = load_pairs(args.fixture)
+    scored = [(pair, pair_similarity(pair)) for pair in pairs]
+
+    if args.verbose:
+        for pair, similarity in scored:
+            mark = "=" if pair["same"] else "≠"
+            print(f"  {similarity:5.2f} {mark} {pair['cached']!r} / {pair['query']!r}")
+        print()
+
+    rows = []
+    for step in range(50, 100, 5):
+        threshold = step / 100
+        hits = sum(1 for pair, similarity in scored if pair["same"] and similarity >= threshold)
+        wrong = sum(1 for pair, similarity in scored if not pair["same"] and similarity >= threshold)
+        rows.append((threshold, hits, wrong))
+        print(f"   umbral={threshold:.2f}  aciertos={hits}/{sum(1 for pair in pairs if pair['same'])}  "
+              f"respuestas equivocadas={wrong}")
+
+    safe = [row for row in rows if row[2] == 0]
+    best = None
+    if safe:
+        most_hits = max(row[1] for row in safe)
+        tied = [row for row in safe if row[1] == most_hits]
+        best = tied[len(tied) // 2]
+    print(f"\nUmbral actual: {SEMANTIC_CACHE_THRESHOLD}")
+    if best:
+        print(f"✅ Umbral sugerido: {best[0]:.2f} ({best[1]} aciertos sin respuestas equivocadas)")
+    else:
+        print("⚠️ Ningún umbral evita todas las respuestas equivocadas")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,258 @@
+"""
+Control de admisión y reintentos ante 429 para los proveedores de IA.
+
+Cada combinación (proveedor, API key) tiene un máximo de llamadas en curso.
+Las peticiones que exceden ese máximo esperan en una cola acotada hasta un
+plazo; si la cola está llena o el plazo vence se rechazan de inmediato con
+ProviderOverloadedError (la API responde 503 con Retry-After) en lugar de
+acumular timeouts de 30 s en el threadpool de FastAPI.
+
+Cuando el proveedor responde 429 (o 503), la petición se reintenta con
+backoff exponencial con jitter, respetando el encabezado Retry-After si
+viene, sin pasar del plazo de la petición (PROVIDER_REQUEST_TIMEOUT_SECONDS
+desde el primer envío, reintentos incluidos; el timeout HTTP de cada envío
+es lo que queda del plazo).
+
+Variables de entorno:
+    ADMISSION_MAX_CONCURRENCY: llamadas en curso por proveedor y API key (por defecto 8)
+    ADMISSION_MAX_QUEUE: peticiones en espera por proveedor y API key (por defecto 16)
+    ADMISSION_QUEUE_TIMEOUT_SECONDS: espera máxima en la cola (por defecto 10)
+    RATE_LIMIT_MAX_RETRIES: reintentos ante 429/503 (por defecto 2)
+    RATE_LIMIT_BACKOFF_BASE_SECONDS: base del backoff exponencial (por defecto 0.5)
+    RATE_LIMIT_BACKOFF_MAX_SECONDS: espera máxima por reintento (por defecto 8)
+    PROVIDER_REQUEST_TIMEOUT_SECONDS: plazo total de una petición al proveedor (por defecto 30)
+"""
+
+import os
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+ADMISSION_MAX_CONCURRENCY = int(os.getenv("ADMISSION_MAX_CONCURRENCY", "8"))
+ADMISSION_MAX_QUEUE = int(os.getenv("ADMISSION_MAX_QUEUE", "16"))
+ADMISSION_QUEUE_TIMEOUT_SECONDS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_SECONDS", "10"))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv("RATE_LIMIT_MAX_RETRIES", "2"))
+RATE_LIMIT_BACKOFF_BASE_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_BASE_SECONDS", "0.5"))
+RATE_LIMIT_BACKOFF_MAX_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_MAX_SECONDS", "8"))
+PROVIDER_REQUEST_TIMEOUT_SECONDS = float(os.getenv("PROVIDER_REQUEST_TIMEOUT_SECONDS", "30"))
+
+RETRYABLE_STATUS_CODES = (429, 503)
+
+class ProviderOverloadedError(Exception):
+    """
+    No hay capacidad para atender la petición con este proveedor ahora
+
+    Attributes:
+        retry_after: segundos sugeridos antes de reintentar
+    """
+
+    def __init__(self, message: str, retry_after: int = 1):
+        super().__init__(message)
+        self.retry_after = max(1, int(retry_after))
+
+class KeyRateLimitedError(Exception):
+    """
+    La API key del pool respondió 429 y quedó en enfriamiento. Quien tomó el
+    lugar de admisión con esa clave lo suelta y reintenta con otra clave y
+    otro lugar (ver AIChatService._request_keys)
+    """
+
+    def __init__(self, api_key: str):
+        super().__init__(f"API key {api_key[:10]}... limitada (429)")
+        self.api_key = api_key
+
+class _Lane:
+    """Llamadas en curso y en espera de un (proveedor, API key)"""
+
+    def __init__(self):
+        self.active = 0
+        self.waiting = 0
+        self.condition = threading.Condition()
+
+class AdmissionController:
+    """
+    Semáforo con cola acotada y plazo por proveedor y API key
+    """
+
+    def __init__(self, max_concurrency: int = ADMISSION_MAX_CONCURRENCY,
+                 max_queue: int = ADMISSION_MAX_QUEUE,
+                 queue_timeout: float = ADMISSION_QUEUE_TIMEOUT_SECONDS):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._lanes: Dict[Tuple[str, str], _Lane] = {}
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    @staticmethod
+    def _lane_key(provider: str, api_key: Optional[str]) -> Tuple[str, str]:
+        # La API key no se guarda en claro
+        return (provider, hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()[:12])
+
+    def _lane(self, provider: str, api_key: Optional[str]) -> _Lane:
+        key = self._lane_key(provider, api_key)
+        with self._lock:
+            lane = self._lanes.get(key)
+            if lane is None:
+                lane = self._lanes[key] = _Lane()
+            return lane
+
+    def _count(self, name: str):
+        with self._lock:
+            self._counters[name] += 1
+
+    @contextmanager
+    def slot(self, provider: str, api_key: Optional[str] = None) -> Iterator[None]:
+        """
+        Ocupa un lugar de llamada para el proveedor durante el bloque
+
+        Raises:
+            ProviderOverloadedError: Si la cola está llena o vence el plazo de espera
+        """
+        lane = self._lane(provider, api_key)
+        with lane.condition:
+            if lane.active >= self.max_concurrency:
+                if lane.waiting >= self.max_queue:
+                    self._count("rejected_queue_full")
+                    raise ProviderOverloadedError(
+                        f"{provider} tiene {lane.active} llamadas en curso y la cola está llena",
+                        retry_after=self.queue_timeout / 2
+                    )
+                lane.waiting += 1
+                self._count("queued")
+                deadline = time.monotonic() + self.queue_timeout
+                try:
+                    while lane.active >= self.max_concurrency:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            self._count("rejected_timeout")
+                            raise ProviderOverloadedError(
+                                f"{provider} no liberó capacidad en {self.queue_timeout:.0f} s",
+                                retry_after=self.queue_timeout
+                            )
+                        lane.condition.wait(remaining)
+                finally:
+                    lane.waiting -= 1
+            lane.active += 1
+            self._count("admitted")
+        try:
+            yield
+        finally:
+            with lane.condition:
+                lane.active -= 1
+                lane.condition.notify()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            lanes = dict(self._lanes)
+            counters = dict(self._counters)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_timeout_s": self.queue_timeout,
+            "lanes": {
+                f"{provider}:{key_hash}": {"active": lane.active, "waiting": lane.waiting}
+                for (provider, key_hash), lane in lanes.items()
+            },
+            **counters,
+            "rate_limit": get_rate_limit_stats(),
+        }
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Segundos indicados por Retry-After (número o fecha HTTP), o None
+    """
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+def request_deadline(budget: float = PROVIDER_REQUEST_TIMEOUT_SECONDS) -> float:
+    """
+    Plazo (en time.monotonic) de una petición al proveedor, reintentos incluidos
+    """
+    return time.monotonic() + budget
+
+def remaining_timeout(deadline: float) -> float:
+    """
+    Timeout HTTP del próximo envío: lo que queda del plazo (al menos 1 s)
+    """
+    return max(1.0, deadline - time.monotonic())
+
+_rate_limit_stats = Counter()
+_rate_limit_stats_lock = threading.Lock()
+
+def get_rate_limit_stats() -> Dict[str, int]:
+    with _rate_limit_stats_lock:
+        return dict(_rate_limit_stats)
+
+def send_with_backoff(send: Callable[[], requests.Response],
+                      max_retries: int = RATE_LIMIT_MAX_RETRIES,
+                      deadline: Optional[float] = None) -> requests.Response:
+    """
+    Envía la petición y la reintenta ante 429/503 con backoff exponencial con
+    jitter ("full jitter"), respetando Retry-After
+
+    Si la espera indicada no cabe en el plazo (`deadline`, en time.monotonic)
+    se devuelve la última respuesta para que el llamador pase a otro proveedor.
+    """
+    attempt = 0
+    while True:
+        response = send()
+        if response.status_code not in RETRYABLE_STATUS_CODES or attempt >= max_retries:
+            if response.status_code in RETRYABLE_STATUS_CODES:
+                with _rate_limit_stats_lock:
+                    _rate_limit_stats["exhausted"] += 1
+            return response
+
+        retry_after = parse_retry_after(response.headers.get("Retry-After"))
+        backoff = random.uniform(0, min(RATE_LIMIT_BACKOFF_MAX_SECONDS,
+                                        RATE_LIMIT_BACKOFF_BASE_SECONDS * (2 ** attempt)))
+        wait = max(retry_after, backoff) if retry_after is not None else backoff
+        if wait > RATE_LIMIT_BACKOFF_MAX_SECONDS or (deadline is not None and time.monotonic() + wait > deadline):
+            with _rate_limit_stats_lock:
+                _rate_limit_stats["gave_up_retry_after"] += 1
+            return response
+
+        with _rate_limit_stats_lock:
+            _rate_limit_stats[f"retried_{response.status_code}"] += 1
+        logger.info(f"⏳ {response.status_code} del proveedor, reintentando en {wait:.2f} s")
+        response.close()
+        time.sleep(wait)
+        attempt += 1
+
+# Instancia global del controlador
+_admission_controller: Optional[AdmissionController] = None
+_admission_controller_lock = threading.Lock()
+
+def get_admission_controller() -> AdmissionController:
+    """
+    Obtiene el controlador global de admisión
+    """
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_controller_lock:
+            if _admission_controller is None:
+                _admission_controller = AdmissionController()
+    return _admission_controller
@@ -1,6 +1,25 @@
-from typing import Optional, Dict, Any
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Iterator
 from .gemini_chat import GeminiChatService
 from .mistral_chat import MistralChatService
+from .response_cache import get_response_cache, is_cacheable_response, fingerprint_text
+from .semantic_cache import get_semantic_cache
+from .provider_router import ProviderRouter
+from .hedging import RequestHedger
+from .context_builder import ConversationSummary
+from .knowledge_index import get_knowledge_index
+from .intent_router import get_intent_router
+from .single_flight import SingleFlight
+from .admission import KeyRateLimitedError, ProviderOverloadedError, get_admission_controller
+from .structured_reply import STRUCTURED_INSTRUCTION, StructuredReply, fallback_reply_text, parse_structured_reply
+from .beto_sentiment import fallback_analysis, sentiment_result_to_score
+
+# Máximo de instancias de servicio (proveedor, api_key) reutilizadas
+AI_SERVICE_CACHE_SIZE = int(os.getenv("AI_SERVICE_CACHE_SIZE", "32"))
 
 class AIChatService:
     """
@@ -13,6 +32,22 @@ class AIChatService:
             "mistral": MistralChatService
         }
         self.default_provider = "gemini"
+        # LRU de instancias por (proveedor, api_key): evita reconstruir el
+        # servicio en cada mensaje y cubre el caso de API keys personalizadas
+        self._service_cache: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._service_cache_lock = threading.Lock()
+        self.service_cache_size = max(1, AI_SERVICE_CACHE_SIZE)
+        # Salud de cada proveedor: circuit breakers y failover automático
+        self.router = ProviderRouter(
+            list(self.providers.keys()),
+            probe=lambda name: self.get_service(name).test_connection()
+        )
+        # Cobertura opcional con el segundo proveedor cuando el primero tarda (HEDGING_ENABLED)
+        self.hedger = RequestHedger(self.router)
+        # Peticiones idénticas concurrentes comparten una sola llamada al proveedor
+        self.single_flight = SingleFlight()
+        # Límite de llamadas en curso por proveedor y API key, con cola acotada
+        self.admission = get_admission_controller()
     
     def get_service(self, provider: str = None, api_key: str = None):
         """
@@ -30,41 +65,493 @@ class AIChatService:
         if provider not in self.providers:
             raise ValueError(f"Proveedor no soportado: {provider}. Opciones disponibles: {list(self.providers.keys())}")
         
+        api_key = api_key.strip() if api_key and api_key.strip() else None
+        cache_key = (provider, api_key)
+        
+        with self._service_cache_lock:
+            service = self._service_cache.get(cache_key)
+            if service is not None:
+                self._service_cache.move_to_end(cache_key)
+                return service
+        
         service_class = self.providers[provider]
-        return service_class(api_key=api_key)
+        service = service_class(api_key=api_key)
+        
+        with self._service_cache_lock:
+            self._service_cache[cache_key] = service
+            self._service_cache.move_to_end(cache_key)
+            while len(self._service_cache) > self.service_cache_size:
+                self._service_cache.popitem(last=False)
+        
+        return service
+    
+    def clear_service_cache(self):
+        """
+        Descarta las instancias reutilizadas (p. ej. al cambiar la API key por defecto)
+        """
+        with self._service_cache_lock:
+            self._service_cache.clear()
+    
+    def _cache_key(self, service, provider: str, user_message: str, conversation_history: list = None,
+                   structured: bool = False, summary: Optional[ConversationSummary] = None):
+        """
+        Clave de la caché de respuestas: incluye el modelo, el contexto del
+        servicio y la huella del índice de conocimiento, así que un cambio de
+        prompt o de conocimiento invalida las entradas anteriores. El
+        historial y el resumen forman parte de la clave (como en _flight_key)
+        para que una pregunta de seguimiento no reciba la respuesta de otra
+        conversación. Las respuestas estructuradas (JSON) se guardan aparte.
+        """
+        context = (f"{getattr(service, 'model', '')}\n{getattr(service, 'lean_context', '')}"
+                   f"\n{get_knowledge_index().fingerprint}")
+        if structured:
+            context += f"\n{STRUCTURED_INSTRUCTION}"
+        return get_response_cache().make_key(
+            user_message, provider or self.default_provider, context, conversation_history,
+            summary.text if summary else None
+        )
+    
+    @staticmethod
+    def _flight_key(provider: str, api_key: Optional[str], user_message: str, conversation_history: list,
+                    summary: Optional[ConversationSummary], max_output_tokens: Optional[int],
+                    structured: bool = False) -> str:
+        """
+        Huella del prompt completo (mensaje, historial, resumen, tope de salida)
+        por proveedor: solo las peticiones que producirían la misma llamada
+        se unifican
+        """
+        prompt = json.dumps({
+            "message": user_message,
+            "history": [
+                {"message": turn.get("message"), "response": turn.get("response")}
+                for turn in (conversation_history or []) if isinstance(turn, dict)
+            ],
+            "summary": [summary.text, summary.turns_covered] if summary else None,
+            "max_output_tokens": max_output_tokens,
+            "structured": structured,
+            "api_key": fingerprint_text(api_key) if api_key else None,
+        }, ensure_ascii=False, sort_keys=True)
+        return f"{provider}:{fingerprint_text(prompt)}"
+    
+    def _get_cached(self, cache_key, user_message: str) -> Optional[str]:
+        """
+        Busca primero en la caché exacta y luego en la semántica (preguntas
+        parecidas con el mismo proveedor y contexto, solo al abrir la
+        conversación: con historial o resumen la respuesta depende de lo anterior)
+        """
+        cached = get_response_cache().get(cache_key)
+        if cached is not None:
+            return cached
+        
+        if not self._is_standalone(cache_key):
+            return None
+        match = get_semantic_cache().get(user_message, self._semantic_namespace(cache_key))
+        if match is None:
+            return None
+        print(f"🧭 Caché semántica: '{user_message[:40]}' ≈ '{match['matched_question'][:40]}' "
+              f"(similitud {match['similarity']:.2f})")
+        # La próxima vez la misma pregunta acierta en la caché exacta
+        get_response_cache().put(cache_key, match["response"])
+        return match["response"]
+    
+    def _store_cached(self, cache_key, user_message: str, response: str):
+        get_response_cache().put(cache_key, response)
+        if self._is_standalone(cache_key):
+            get_semantic_cache().put(user_message, response, self._semantic_namespace(cache_key))
+    
+    @staticmethod
+    def _is_standalone(cache_key) -> bool:
+        # La huella de historial y resumen está vacía solo al abrir la conversación
+        return not cache_key[3]
+    
+    @staticmethod
+    def _semantic_namespace(cache_key) -> str:
+        # proveedor : hash del contexto
+        return ":".join(cache_key[1:3])
+    
+    def _record_attempt(self, provider: str, api_key: Optional[str], success: bool, started: float):
+        # Las fallas con una API key personalizada no dicen nada de la salud del proveedor
+        if api_key:
+            self.router.release(provider)
+        else:
+            self.router.record(provider, success, (time.perf_counter() - started) * 1000)
+    
+    def _attempt(self, provider: str, api_key: Optional[str], user_message: str, conversation_history: list,
+                 summary: Optional[ConversationSummary] = None, max_output_tokens: Optional[int] = None,
+                 structured: bool = False):
+        """
+        Una llamada a un proveedor, registrada en el router
+        
+        Returns:
+            Tuple[Optional[str], bool]: (respuesta, éxito)
+        
+        Raises:
+            ProviderOverloadedError: Si no hubo lugar para la llamada (no cuenta como falla del proveedor)
+        """
+        started = time.perf_counter()
+        response = None
+        try:
+            service = self.get_service(provider, api_key)
+            for request_key in self._request_keys(provider, service):
+                try:
+                    with self.admission.slot(provider, request_key):
+                        started = time.perf_counter()
+                        response = service.generate_response(
+                            user_message, conversation_history, summary, max_output_tokens=max_output_tokens,
+                            structured=structured, api_key=request_key
+                        )
+                    break
+                except KeyRateLimitedError as e:
+                    print(f"🔁 {e}, se reintenta con otra clave")
+            success = is_cacheable_response(response)
+        except ProviderOverloadedError:
+            raise
+        except Exception as e:
+            print(f"Error con el proveedor {provider}: {e}")
+            success = False
+        self._record_attempt(provider, api_key, success, started)
+        return response, success
+    
+    @staticmethod
+    def _request_keys(provider: str, service) -> Iterator[Optional[str]]:
+        """
+        Clave de cada intento de una llamada. La clave se elige antes de pedir
+        lugar, así el carril de admisión y la contabilidad del pool son los de
+        la clave que se usa; se pasa al intento siguiente solo si la clave del
+        pool respondió 429 (KeyRateLimitedError), y cada clave va una vez
+        
+        Raises:
+            ProviderOverloadedError: Si el pool vuelve a dar una clave ya limitada
+        """
+        tried = set()
+        while True:
+            request_key = service.acquire_api_key()
+            if request_key in tried:
+                raise ProviderOverloadedError(f"Las API keys de {provider} están limitadas (429)")
+            tried.add(request_key)
+            yield request_key
+    
+    def _generate_routed(self, user_message: str, conversation_history: list,
+                         provider: str, api_key: str = None, summary: Optional[ConversationSummary] = None,
+                         max_output_tokens: Optional[int] = None, structured: bool = False):
+        """
+        Genera la respuesta con el primer proveedor sano según el router,
+        pasando al siguiente si el anterior falla o responde "Lo siento...".
+        Con HEDGING_ENABLED, si el primero tarda más que su p95 se lanza la
+        misma petición al segundo y gana la primera respuesta válida.
+        
+        Returns:
+            Tuple[str, str]: (respuesta, proveedor usado)
+        
+        Raises:
+            ProviderOverloadedError: Si ningún proveedor respondió y alguno estaba saturado
+        """
+        candidates = self.router.route(provider)
+        # La API key personalizada pertenece al proveedor pedido
+        key_for = lambda candidate: api_key if candidate == provider else None
+        overloaded = []
+        
+        def attempt(candidate: str):
+            try:
+                return self._attempt(candidate, key_for(candidate), user_message, conversation_history,
+                                     summary, max_output_tokens, structured)
+            except ProviderOverloadedError as e:
+                self.router.release(candidate)
+                overloaded.append(e)
+                return None, False
+        
+        if self.hedger.enabled and len(candidates) >= 2:
+            primary, secondary = candidates[0], candidates[1]
+            for remaining in candidates[2:]:
+                self.router.release(remaining)
+            response, provider_used, _ = self.hedger.run(
+                primary, lambda: attempt(primary),
+                secondary, lambda: attempt(secondary)
+            )
+            if response is None:
+                if overloaded:
+                    raise overloaded[-1]
+                raise RuntimeError("Ningún proveedor de IA pudo responder")
+            return response, provider_used
+        
+        response = None
+        for index, candidate in enumerate(candidates):
+            response, success = attempt(candidate)
+            if success:
+                for remaining in candidates[index + 1:]:
+                    self.router.release(remaining)
+                return response, candidate
+            if index + 1 < len(candidates):
+                print(f"↪️ {candidate} no respondió, intentando con {candidates[index + 1]}")
+        
+        if response is None:
+            if overloaded:
+                raise overloaded[-1]
+            raise RuntimeError("Ningún proveedor de IA pudo responder")
+        return response, candidates[-1]
     
     def generate_response(self, user_message: str, conversation_history: list = None, 
-                         provider: str = None, api_key: str = None) -> Dict[str, Any]:
+                         provider: str = None, api_key: str = None,
+                         summary: Optional[ConversationSummary] = None,
+                         structured: bool = False) -> Dict[str, Any]:
         """
-        Genera una respuesta usando el proveedor especificado
+        Genera una respuesta usando el proveedor especificado (o el proveedor
+        sano que elija el router si el pedido tiene el circuito abierto)
         
         Args:
             user_message: Mensaje del usuario
             conversation_history: Historial de conversación
             provider: Proveedor de IA a usar
             api_key: API key personalizada
+            summary: Resumen acumulado de los turnos anteriores del chat
+            structured: Pedir en la misma llamada el score y el sentimiento
+                del mensaje (claves "score" y "sentiment" del resultado; None
+                si el modelo no devolvió un JSON válido)
         
         Returns:
             Dict con la respuesta y metadatos
+        
+        Raises:
+            ProviderOverloadedError: Si los proveedores están saturados (la API responde 503)
         """
+        provider = provider or self.default_provider
+        # Saludos y preguntas frecuentes se responden sin llamar al LLM
+        intent = get_intent_router().classify(user_message, conversation_history)
+        if intent.answered:
+            return {
+                "response": intent.response,
+                "provider": "intent",
+                "success": True,
+                "error": None,
+                "cached": False,
+                "intent": intent.intent
+            }
         try:
             service = self.get_service(provider, api_key)
-            response = service.generate_response(user_message, conversation_history)
+            cache_key = self._cache_key(service, provider, user_message, conversation_history, structured, summary)
+            
+            cached = self._get_cached(cache_key, user_message)
+            parsed = parse_structured_reply(cached) if structured and cached is not None else None
+            if cached is not None and (not structured or parsed):
+                return {
+                    "response": parsed.reply if parsed else cached,
+                    "provider": provider,
+                    "success": True,
+                    "error": None,
+                    "cached": True,
+                    "intent": intent.intent,
+                    **self._structured_fields(structured, parsed, user_message)
+                }
+            
+            flight_key = self._flight_key(provider, api_key, user_message, conversation_history,
+                                          summary, intent.max_output_tokens, structured)
+            (response, provider_used), coalesced = self.single_flight.do(
+                flight_key,
+                lambda: self._generate_routed(user_message, conversation_history, provider, api_key,
+                                              summary, intent.max_output_tokens, structured)
+            )
+            
+            if structured:
+                parsed = parse_structured_reply(response)
+                if parsed is None:
+                    # Sin repetir la llamada: la respuesta se usa como texto y el
+                    # score sale del léxico de respaldo (ver _structured_fields)
+                    print(f"⚠️ Salida estructurada no válida de {provider_used}, se usa como texto")
+                    response = fallback_reply_text(response) or (response or "").strip()
+            
+            if not coalesced and (not structured or parsed):
+                if provider_used != provider:
+                    cache_key = self._cache_key(self.get_service(provider_used), provider_used, user_message,
+                                                conversation_history, structured, summary)
+                self._store_cached(cache_key, user_message, response)
             
             return {
-                "response": response,
-                "provider": provider or self.default_provider,
+                "response": parsed.reply if parsed else response,
+                "provider": provider_used,
                 "success": True,
-                "error": None
+                "error": None,
+                "cached": False,
+                "coalesced": coalesced,
+                "intent": intent.intent,
+                **self._structured_fields(structured, parsed, user_message)
             }
+        except ProviderOverloadedError:
+            raise
         except Exception as e:
             return {
                 "response": "Lo siento, hubo un error al procesar tu mensaje. ¿Podrías intentarlo de nuevo?",
-                "provider": provider or self.default_provider,
+                "provider": provider,
                 "success": False,
                 "error": str(e)
             }
     
+    @staticmethod
+    def _structured_fields(structured: bool, parsed: Optional[StructuredReply],
+                           user_message: str) -> Dict[str, Any]:
+        if not structured:
+            return {}
+        if parsed:
+            return {"score": parsed.score, "sentiment": parsed.sentiment, "analysis_type": "llm_structured"}
+        # JSON no válido: score del léxico de respaldo, sin otra llamada ni BETO
+        analysis = fallback_analysis(user_message)
+        return {
+            "score": round(sentiment_result_to_score(analysis), 2),
+            "sentiment": analysis["label"],
+            "analysis_type": analysis["analysis_type"],
+        }
+    
+    def stream_response(self, user_message: str, conversation_history: list = None,
+                        provider: str = None, api_key: str = None,
+                        summary: Optional[ConversationSummary] = None) -> Iterator[str]:
+        """
+        Genera una respuesta en streaming con el proveedor especificado
+        
+        Si un proveedor falla antes de entregar el primer fragmento se pasa al
+        siguiente que indique el router; si todos fallan se entrega el mismo
+        mensaje de disculpa que en generate_response. Si falla a mitad de la
+        respuesta, se conserva lo ya entregado.
+        
+        Yields:
+            str: Fragmentos de texto a medida que llegan
+        """
+        provider = provider or self.default_provider
+        intent = get_intent_router().classify(user_message, conversation_history)
+        if intent.answered:
+            yield intent.response
+            return
+        try:
+            service = self.get_service(provider, api_key)
+            cache_key = self._cache_key(service, provider, user_message, conversation_history, summary=summary)
+            
+            cached = self._get_cached(cache_key, user_message)
+            if cached is not None:
+                yield cached
+                return
+        except Exception as e:
+            print(f"Error en streaming con {provider}: {e}")
+            yield "Lo siento, hubo un error al procesar tu mensaje. ¿Podrías intentarlo de nuevo?"
+            return
+        
+        flight_key = self._flight_key(provider, api_key, user_message, conversation_history,
+                                      summary, intent.max_output_tokens)
+        chunks, _ = self.single_flight.stream(
+            flight_key,
+            lambda: self._stream_routed(user_message, conversation_history, provider, api_key,
+                                        summary, intent.max_output_tokens, cache_key)
+        )
+        yield from chunks
+    
+    def _stream_routed(self, user_message: str, conversation_history: list, provider: str,
+                       api_key: Optional[str], summary: Optional[ConversationSummary],
+                       max_output_tokens: Optional[int], cache_key) -> Iterator[str]:
+        """
+        Streaming con failover entre proveedores hasta el primer fragmento;
+        guarda la respuesta completa en la caché
+        
+        Raises:
+            ProviderOverloadedError: Si ningún proveedor respondió y alguno estaba saturado
+        """
+        candidates = self.router.route(provider)
+        overloaded = None
+        for index, candidate in enumerate(candidates):
+            candidate_key = api_key if candidate == provider else None
+            started = time.perf_counter()
+            chunks = []
+            try:
+                candidate_service = self.get_service(candidate, candidate_key)
+                for request_key in self._request_keys(candidate, candidate_service):
+                    try:
+                        with self.admission.slot(candidate, request_key):
+                            started = time.perf_counter()
+                            for chunk in candidate_service.stream_response(
+                                    user_message, conversation_history, summary,
+                                    max_output_tokens=max_output_tokens, api_key=request_key):
+                                chunks.append(chunk)
+                                yield chunk
+                        break
+                    except KeyRateLimitedError as e:
+                        # El 429 llega antes del primer fragmento
+                        print(f"🔁 {e}, se reintenta con otra clave")
+            except ProviderOverloadedError as e:
+                self.router.release(candidate)
+                overloaded = e
+                continue
+            except Exception as e:
+                print(f"Error en streaming con {candidate}: {e}")
+                self._record_attempt(candidate, candidate_key, False, started)
+                if chunks:
+                    # Ya se entregó parte de la respuesta: no se puede cambiar de proveedor
+                    for remaining in candidates[index + 1:]:
+                        self.router.release(remaining)
+                    return
+                continue
+            
+            response = "".join(chunks).strip()
+            if not response:
+                self._record_attempt(candidate, candidate_key, False, started)
+                continue
+            self._record_attempt(candidate, candidate_key, True, started)
+            for remaining in candidates[index + 1:]:
+                self.router.release(remaining)
+            if candidate != provider:
+                cache_key = self._cache_key(candidate_service, candidate, user_message, conversation_history,
+                                            summary=summary)
+            self._store_cached(cache_key, user_message, response)
+            return
+        
+        if overloaded is not None:
+            raise overloaded
+        yield "Lo siento, hubo un error al procesar tu mensaje. ¿Podrías intentarlo de nuevo?"
+    
+    def complete(self, prompt: str, provider: str = None, max_output_tokens: int = 300) -> str:
+        """
+        Completa un prompt interno (sin contexto de LEAN BOT) con el primer
+        proveedor sano, usando las API keys por defecto
+        
+        Raises:
+            RuntimeError: Si ningún proveedor pudo responder
+        """
+        provider = provider or self.default_provider
+        errors = []
+        candidates = self.router.route(provider)
+        for index, candidate in enumerate(candidates):
+            started = time.perf_counter()
+            try:
+                service = self.get_service(candidate)
+                for request_key in self._request_keys(candidate, service):
+                    try:
+                        with self.admission.slot(candidate, request_key):
+                            started = time.perf_counter()
+                            text = service.complete(prompt, max_output_tokens=max_output_tokens,
+                                                    api_key=request_key)
+                        break
+                    except KeyRateLimitedError as e:
+                        print(f"🔁 {e}, se reintenta con otra clave")
+                self._record_attempt(candidate, None, bool(text), started)
+                if text:
+                    for remaining in candidates[index + 1:]:
+                        self.router.release(remaining)
+                    return text
+                errors.append(f"{candidate}: respuesta vacía")
+            except ProviderOverloadedError as e:
+                self.router.release(candidate)
+                errors.append(f"{candidate}: {e}")
+            except Exception as e:
+                self._record_attempt(candidate, None, False, started)
+                errors.append(f"{candidate}: {e}")
+        raise RuntimeError(f"Ningún proveedor completó el prompt ({'; '.join(errors)})")
+    
+    def get_router_metrics(self) -> Dict[str, Any]:
+        """
+        Salud de los proveedores, decisiones de enrutamiento, coberturas y
+        control de admisión
+        """
+        return {
+            **self.router.get_metrics(),
+            "hedging": self.hedger.get_metrics(),
+            "admission": self.admission.get_metrics(),
+        }
+    
     def test_provider(self, provider: str, api_key: str = None) -> Dict[str, Any]:
         """
         Prueba la conexión con un proveedor específico
@@ -96,4 +583,19 @@ class AIChatService:
         """
         Retorna la lista de proveedores disponibles
         """
-        return list(self.providers.keys())
\ No newline at end of file
+        return list(self.providers.keys())
+
+# Instancia global del servicio unificado
+_ai_chat_service: Optional[AIChatService] = None
+_ai_chat_service_lock = threading.Lock()
+
+def get_ai_chat_service() -> AIChatService:
+    """
+    Obtiene la instancia global del servicio unificado de IA
+    """
+    global _ai_chat_service
+    if _ai_chat_service is None:
+        with _ai_chat_service_lock:
+            if _ai_chat_service is None:
+                _ai_chat_service = AIChatService()
+    return _ai_chat_service
@@ -1,12 +1,40 @@
 """
 Gestor centralizado de API Keys para Gemini con sistema de fallback automático.
 Prueba múltiples claves en orden hasta encontrar una funcional.
+
+La validación de cada clave se cachea con TTL y se hace con una llamada
+barata (listado de modelos, sin generar contenido ni gastar cuota). Un hilo
+en segundo plano la renueva antes de que expire, así que el camino de cada
+mensaje no hace peticiones de validación; solo se vuelve a validar cuando
+Gemini rechaza la clave (report_auth_failure).
+
+Con el pool de claves activo (ver key_pool.py), cada petición toma una de las
+claves válidas según su margen de cuota (acquire_key) en lugar de usar solo
+la clave activa.
+
+Variables de entorno:
+    GEMINI_API_KEYS: claves adicionales separadas por comas
+    API_KEY_VALIDATION_TTL_SECONDS: vigencia de una validación exitosa (por defecto 3600)
+    API_KEY_INVALID_TTL_SECONDS: vigencia de una validación fallida (por defecto 300)
+    API_KEY_INCONCLUSIVE_TTL_SECONDS: tiempo sin volver a probar una clave cuya
+        prueba no fue concluyente (timeout o 5xx); solo el refresco en segundo
+        plano la reintenta antes (por defecto 60)
+    API_KEY_REFRESH_SECONDS: intervalo del refresco en segundo plano (por defecto 600)
 """
 
 import os
+import time
+import threading
 import requests
-from typing import Optional, List, Tuple
+from typing import Dict, Optional, List, Tuple
 from datetime import datetime
+from .http_client import GEMINI_API_BASE_URL, get_http_session
+from .key_pool import KEY_POOL_ENABLED, KeyPool
+
+API_KEY_VALIDATION_TTL_SECONDS = float(os.getenv("API_KEY_VALIDATION_TTL_SECONDS", "3600"))
+API_KEY_INVALID_TTL_SECONDS = float(os.getenv("API_KEY_INVALID_TTL_SECONDS", "300"))
+API_KEY_INCONCLUSIVE_TTL_SECONDS = float(os.getenv("API_KEY_INCONCLUSIVE_TTL_SECONDS", "60"))
+API_KEY_REFRESH_SECONDS = float(os.getenv("API_KEY_REFRESH_SECONDS", "600"))
 
 
 class APIKeyManager:
@@ -24,6 +52,171 @@ class APIKeyManager:
         self._active_key: Optional[str] = None
         self._last_test_time: Optional[datetime] = None
         self._tested_keys: List[str] = []
+        # clave -> (funciona, momento de la validación en time.monotonic)
+        self._validations: Dict[str, Tuple[bool, float]] = {}
+        # clave -> momento de la última prueba no concluyente (timeout, 5xx)
+        self._inconclusive: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._refresh_thread: Optional[threading.Thread] = None
+        self.probe_count = 0
+        self.pool = KeyPool() if KEY_POOL_ENABLED else None
+    
+    def candidate_keys(self) -> List[str]:
+        """
+        Claves conocidas en orden de prioridad: GEMINI_API_KEY, GEMINI_API_KEYS
+        y las claves del proyecto
+        """
+        keys = [os.getenv("GEMINI_API_KEY", "")]
+        keys += os.getenv("GEMINI_API_KEYS", "").split(",")
+        keys += self.AVAILABLE_KEYS
+        unique = []
+        for key in keys:
+            key = key.strip()
+            if key and key not in unique:
+                unique.append(key)
+        return unique
+    
+    def _validated_keys(self) -> List[str]:
+        """Claves con una validación exitosa vigente (sin hacer peticiones)"""
+        now = time.monotonic()
+        with self._lock:
+            return [
+                key for key in self.candidate_keys()
+                if key in self._validations
+                and self._validations[key][0]
+                and now - self._validations[key][1] < API_KEY_VALIDATION_TTL_SECONDS
+            ]
+    
+    def acquire_key(self) -> str:
+        """
+        Clave para la siguiente petición: la elegida por el pool entre las
+        claves validadas o, sin pool (o sin claves validadas aún), la activa
+        
+        Raises:
+            ValueError: Si ninguna API key funciona
+            ProviderOverloadedError: Si todas las claves están en enfriamiento por 429
+        """
+        if self.pool is not None:
+            keys = self._validated_keys()
+            if keys:
+                return self.pool.acquire(keys)
+        return self.get_active_key()
+    
+    def record_tokens(self, api_key: str, tokens: Optional[int]):
+        """Anota los tokens consumidos con la clave (cuota por minuto del pool)"""
+        if self.pool is not None:
+            self.pool.record_tokens(api_key, tokens)
+    
+    def report_rate_limited(self, api_key: str, retry_after: Optional[float] = None):
+        """La clave respondió 429: el pool la deja en enfriamiento"""
+        if self.pool is not None:
+            self.pool.report_rate_limited(api_key, retry_after)
+    
+    def is_key_valid(self, api_key: str, force: bool = False) -> bool:
+        """
+        Validez de la clave según la caché; solo se prueba contra Gemini si
+        no hay validación vigente (o con force=True)
+        """
+        if not api_key or not api_key.strip():
+            return False
+        api_key = api_key.strip()
+        with self._lock:
+            cached = self._validations.get(api_key)
+            inconclusive_at = self._inconclusive.get(api_key)
+        if not force:
+            if cached:
+                valid, checked_at = cached
+                ttl = API_KEY_VALIDATION_TTL_SECONDS if valid else API_KEY_INVALID_TTL_SECONDS
+                if time.monotonic() - checked_at < ttl:
+                    return valid
+            # Con la API de modelos inestable, las peticiones no repiten pruebas
+            # de 10 s: usan la última validación hasta que la renueve el refresco
+            if inconclusive_at is not None and time.monotonic() - inconclusive_at < API_KEY_INCONCLUSIVE_TTL_SECONDS:
+                return cached[0] if cached else False
+        
+        # La prueba se hace fuera del lock para no bloquear las consultas en caché
+        valid = self._test_api_key(api_key)
+        with self._lock:
+            if valid is None:
+                # Sin respuesta concluyente: se conserva la validación anterior
+                self._inconclusive[api_key] = time.monotonic()
+                return cached[0] if cached else False
+            self._inconclusive.pop(api_key, None)
+            self._validations[api_key] = (valid, time.monotonic())
+        return valid
+    
+    def report_auth_failure(self, api_key: str):
+        """
+        Gemini rechazó la clave en una petición real: se descarta su validación
+        para que la próxima consulta la vuelva a probar y, si sigue fallando,
+        pase a la siguiente clave
+        """
+        if not api_key:
+            return
+        with self._lock:
+            self._validations.pop(api_key.strip(), None)
+            if self._active_key == api_key.strip():
+                self._active_key = None
+        print(f"🔑 Gemini rechazó la API key {api_key[:15]}..., se volverá a validar")
+    
+    def refresh(self):
+        """
+        Renueva la validación de la clave activa (o busca otra si dejó de
+        funcionar); con el pool activo renueva la de todas las claves
+        """
+        if self.pool is not None:
+            for key in self.candidate_keys():
+                self.is_key_valid(key, force=True)
+        else:
+            # Las claves sin prueba concluyente solo se reintentan aquí
+            with self._lock:
+                retry = list(self._inconclusive)
+            for key in retry:
+                self.is_key_valid(key, force=True)
+        with self._lock:
+            active = self._active_key
+        if active and self.is_key_valid(active, force=self.pool is None):
+            return
+        try:
+            self.get_active_key()
+        except ValueError as e:
+            print(f"⚠️ Refresco de API keys: {e}")
+    
+    def start_background_refresh(self, interval: float = API_KEY_REFRESH_SECONDS):
+        """
+        Inicia (una sola vez) el hilo que renueva periódicamente la validación,
+        antes de que venza su TTL (la primera validación la hace el arranque)
+        """
+        with self._lock:
+            if self._refresh_thread is not None:
+                return
+            
+            def _loop():
+                while True:
+                    time.sleep(max(1.0, interval))
+                    self.refresh()
+            
+            self._refresh_thread = threading.Thread(target=_loop, name="api-key-refresh", daemon=True)
+            self._refresh_thread.start()
+    
+    def get_status(self) -> Dict:
+        """
+        Estado de las validaciones en caché (claves enmascaradas)
+        """
+        now = time.monotonic()
+        pool = self.pool.get_metrics(self._validated_keys()) if self.pool is not None else None
+        with self._lock:
+            return {
+                "active_key": f"{self._active_key[:10]}..." if self._active_key else None,
+                "probes": self.probe_count,
+                "validation_ttl_s": API_KEY_VALIDATION_TTL_SECONDS,
+                "refresh_interval_s": API_KEY_REFRESH_SECONDS,
+                "keys": [
+                    {"key": f"{key[:10]}...{key[-5:]}", "valid": valid, "age_s": round(now - checked_at)}
+                    for key, (valid, checked_at) in self._validations.items()
+                ],
+                "pool": pool,
+            }
     
     def get_active_key(self) -> str:
         """
@@ -37,20 +230,21 @@ class APIKeyManager:
         """
         # 1. Verificar si hay una clave en variable de entorno
         env_key = os.getenv("GEMINI_API_KEY")
-        if env_key and env_key.strip() and self._test_api_key(env_key):
+        if env_key and env_key.strip() and self.is_key_valid(env_key):
+            if self._active_key != env_key:
+                print(f"✅ Usando API key desde variable de entorno: {env_key[:15]}...")
             self._active_key = env_key
-            print(f"✅ Usando API key desde variable de entorno: {env_key[:15]}...")
             return env_key
         
-        # 2. Si ya tenemos una clave activa y funcionó recientemente, usarla
-        if self._active_key and self._test_api_key(self._active_key):
+        # 2. Si ya tenemos una clave activa con validación vigente, usarla
+        if self._active_key and self.is_key_valid(self._active_key):
             return self._active_key
         
         # 3. Probar todas las claves disponibles
         print("🔍 Probando API keys disponibles...")
         for i, key in enumerate(self.AVAILABLE_KEYS, 1):
             print(f"   Probando clave {i}/{len(self.AVAILABLE_KEYS)}: {key[:15]}...")
-            if self._test_api_key(key):
+            if self.is_key_valid(key):
                 self._active_key = key
                 self._last_test_time = datetime.now()
                 print(f"✅ API key funcional encontrada: {key[:15]}...")
@@ -65,67 +259,51 @@ class APIKeyManager:
             "Por favor, verifica las claves o contacta al administrador."
         )
     
-    def _test_api_key(self, api_key: str) -> bool:
+    def _test_api_key(self, api_key: str) -> Optional[bool]:
         """
-        Prueba si una API key funciona realizando una petición simple.
+        Prueba si una API key funciona listando los modelos (no genera
+        contenido ni consume cuota de generación).
         
         Args:
             api_key: La API key a probar
         
         Returns:
-            bool: True si la clave funciona, False en caso contrario
+            True si la clave funciona, False si Gemini la rechaza y None si no
+            se pudo determinar (error de red o del servidor; ver
+            API_KEY_INCONCLUSIVE_TTL_SECONDS)
         """
         if not api_key or not api_key.strip():
             return False
         
+        with self._lock:
+            self.probe_count += 1
         try:
-            # Usar el modelo especificado en el comando del usuario
-            url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-2.0-flash:generateContent"
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'X-goog-api-key': api_key.strip()
-            }
-            
-            data = {
-                "contents": [
-                    {
-                        "parts": [
-                            {
-                                "text": "Test"
-                            }
-                        ]
-                    }
-                ]
-            }
-            
-            response = requests.post(
-                url,
-                headers=headers,
-                json=data,
+            response = get_http_session().get(
+                f"{GEMINI_API_BASE_URL}/v1beta/models",
+                headers={'X-goog-api-key': api_key.strip()},
+                params={"pageSize": 1},
                 timeout=10
             )
             
-            # Verificar si la respuesta es exitosa
-            if response.status_code == 200:
-                result = response.json()
-                # Verificar que tenga la estructura esperada
-                if "candidates" in result and len(result["candidates"]) > 0:
-                    return True
+            # 200: clave válida; 429: válida pero limitada por cuota
+            if response.status_code in (200, 429):
+                return True
+            if response.status_code in (400, 401, 403):
+                print(f"   ❌ Clave no válida: Status {response.status_code}")
+                return False
             
-            # Si llegamos aquí, la clave no funcionó
-            print(f"   ❌ Clave no válida: Status {response.status_code}")
-            return False
+            print(f"   ⚠️  No se pudo validar la clave: Status {response.status_code}")
+            return None
             
         except requests.exceptions.Timeout:
             print(f"   ⏱️  Timeout al probar la clave")
-            return False
+            return None
         except requests.exceptions.RequestException as e:
             print(f"   ❌ Error de conexión: {str(e)[:50]}")
-            return False
+            return None
         except Exception as e:
             print(f"   ❌ Error inesperado: {str(e)[:50]}")
-            return False
+            return None
     
     def test_all_keys(self) -> List[Tuple[str, bool]]:
         """
@@ -140,7 +318,7 @@ class APIKeyManager:
         for i, key in enumerate(self.AVAILABLE_KEYS, 1):
             masked_key = f"{key[:10]}...{key[-5:]}"
             print(f"Clave {i}: {masked_key}")
-            works = self._test_api_key(key)
+            works = self.is_key_valid(key, force=True)
             results.append((masked_key, works))
             print(f"   {'✅ Funciona' if works else '❌ No funciona'}\n")
         
@@ -148,7 +326,7 @@ class APIKeyManager:
         env_key = os.getenv("GEMINI_API_KEY")
         if env_key and env_key not in self.AVAILABLE_KEYS:
             print(f"Clave de entorno: {env_key[:10]}...{env_key[-5:]}")
-            works = self._test_api_key(env_key)
+            works = self.is_key_valid(env_key, force=True)
             results.append((f"ENV: {env_key[:10]}...{env_key[-5:]}", works))
             print(f"   {'✅ Funciona' if works else '❌ No funciona'}\n")
         
@@ -170,7 +348,7 @@ class APIKeyManager:
         api_key = api_key.strip()
         
         # Probar la clave
-        if self._test_api_key(api_key):
+        if self.is_key_valid(api_key, force=True):
             # Si funciona, agregarla al inicio de la lista (mayor prioridad)
             if api_key not in self.AVAILABLE_KEYS:
                 self.AVAILABLE_KEYS.insert(0, api_key)
@@ -193,11 +371,12 @@ class APIKeyManager:
         Returns:
             str: URL completa del endpoint
         """
-        return f"https://generativelanguage.googleapis.com/v1beta/models/{model_name}:generateContent"
+        return f"{GEMINI_API_BASE_URL}/v1beta/models/{model_name}:generateContent"
 
 
 # Instancia global del gestor
 _api_key_manager: Optional[APIKeyManager] = None
+_api_key_manager_lock = threading.Lock()
 
 
 def get_api_key_manager() -> APIKeyManager:
@@ -209,7 +388,9 @@ def get_api_key_manager() -> APIKeyManager:
     """
     global _api_key_manager
     if _api_key_manager is None:
-        _api_key_manager = APIKeyManager()
+        with _api_key_manager_lock:
+            if _api_key_manager is None:
+                _api_key_manager = APIKeyManager()
     return _api_key_manager
 
 
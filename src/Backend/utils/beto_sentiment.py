@@ -1,11 +1,20 @@
 """
 Servicio de análisis de sentimientos usando BETO (BERT en español)
-Modelo: finiteautomata/beto-sentiment-analysis
+Modelo por defecto: finiteautomata/beto-sentiment-analysis
+(configurable con SENTIMENT_MODEL o el parámetro model_name)
 """
 
 import os
 import logging
-from typing import Dict, Optional, Tuple
+import threading
+import time
+from contextlib import nullcontext
+from dataclasses import asdict
+from typing import Dict, List, Optional, Tuple
+from .inference_profile import load_inference_profile, apply_torch_threads
+from .micro_batcher import MicroBatcher
+from .lexicon import LexiconMatcher
+from .model_artifacts import get_model_dir, has_local_artifacts, is_offline, read_manifest
 
 # Importaciones con manejo de errores
 TRANSFORMERS_AVAILABLE = False
@@ -34,51 +43,218 @@ except ImportError as e:
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+DEFAULT_SENTIMENT_MODEL = "finiteautomata/beto-sentiment-analysis"
+
+# Etiquetas de otros clasificadores de sentimiento -> POS/NEG/NEU
+LABEL_ALIASES = {
+    "pos": "POS", "positive": "POS", "positivo": "POS",
+    "neg": "NEG", "negative": "NEG", "negativo": "NEG",
+    "neu": "NEU", "neutral": "NEU", "neutro": "NEU",
+    # Modelos de estrellas (1-5)
+    "1 star": "NEG", "2 stars": "NEG", "3 stars": "NEU", "4 stars": "POS", "5 stars": "POS",
+}
+
+def normalize_sentiment_label(label: str) -> str:
+    """
+    Normaliza la etiqueta de un modelo a POS/NEG/NEU
+    """
+    return LABEL_ALIASES.get(str(label).strip().lower(), str(label))
+
+# Léxico del análisis de respaldo, compilado una sola vez
+FALLBACK_POSITIVE_WORDS = [
+    "bueno", "excelente", "genial", "perfecto", "gracias", "bien", 
+    "fantástico", "increíble", "maravilloso", "estupendo", "feliz",
+    "contento", "satisfecho", "encantado", "amor", "gustar"
+]
+
+FALLBACK_NEGATIVE_WORDS = [
+    "malo", "terrible", "horrible", "pésimo", "odio", "detesto",
+    "molesto", "enojado", "furioso", "triste", "decepcionado",
+    "frustrado", "problema", "error", "fallo", "disgusto"
+]
+
+FALLBACK_LEXICON = LexiconMatcher({
+    "POS": FALLBACK_POSITIVE_WORDS,
+    "NEG": FALLBACK_NEGATIVE_WORDS
+})
+
+def fallback_analysis(text: str) -> Dict[str, any]:
+    """
+    Análisis básico por palabras clave, sin el modelo (no necesita el
+    analizador global, así que no espera a que BETO cargue)
+    """
+    # Una sola pasada sobre el texto
+    counts = FALLBACK_LEXICON.count(text)
+    pos_count = counts.get("POS", 0)
+    neg_count = counts.get("NEG", 0)
+    
+    if pos_count > neg_count:
+        sentiment = "POS"
+        label = "positivo"
+        confidence = min(0.6 + (pos_count * 0.1), 0.9)
+    elif neg_count > pos_count:
+        sentiment = "NEG"
+        label = "negativo"
+        confidence = min(0.6 + (neg_count * 0.1), 0.9)
+    else:
+        sentiment = "NEU"
+        label = "neutral"
+        confidence = 0.5
+    
+    return {
+        "sentiment": sentiment,
+        "confidence": confidence,
+        "label": label,
+        "scores": {
+            "POS": 0.6 if sentiment == "POS" else 0.2,
+            "NEG": 0.6 if sentiment == "NEG" else 0.2,
+            "NEU": 0.6 if sentiment == "NEU" else 0.2
+        },
+        "analysis_type": "fallback_keywords",
+        "original_text": text
+    }
+
 class BetoSentimentAnalyzer:
     """
     Analizador de sentimientos usando el modelo BETO específicamente entrenado para español
     """
     
-    def __init__(self):
-        self.model_name = "finiteautomata/beto-sentiment-analysis"
+    def __init__(self, model_name: Optional[str] = None):
+        self.model_name = model_name or os.getenv("SENTIMENT_MODEL", DEFAULT_SENTIMENT_MODEL)
         self.analyzer = None
         self.available = TRANSFORMERS_AVAILABLE
+        # Origen real de los pesos (directorio local o ID del Hub) y tiempos de carga
+        self.model_source = None
+        self.offline = is_offline()
+        self.load_timings: Dict[str, float] = {}
+        # Perfil de ejecución (hilos, tamaño de lote, espera del micro-batcher)
+        self.profile = load_inference_profile()
+        self.batch_size = self.profile.batch_size
+        # Una sola inferencia a la vez: evita sobresuscribir los núcleos cuando
+        # varias peticiones del threadpool llegan en paralelo
+        self._inference_lock = threading.Lock()
+        self._batcher = None
+        self.max_length = 512
+        # Solapamiento (en tokens) entre ventanas consecutivas para textos largos
+        self.window_overlap = max(0, int(os.getenv("SENTIMENT_WINDOW_OVERLAP", "64")))
+        # Límite duro de caracteres para acotar el trabajo en textos enormes
+        self.max_chars = int(os.getenv("SENTIMENT_MAX_CHARS", "20000"))
         
         if TRANSFORMERS_AVAILABLE and TORCH_AVAILABLE:
             try:
                 self.device = "cuda" if torch and torch.cuda.is_available() else "cpu"
             except:
                 self.device = "cpu"
+            apply_torch_threads(torch, self.profile)
             self._initialize_model()
+            
+            if self.analyzer is not None and self.profile.max_wait_ms > 0:
+                self._batcher = MicroBatcher(
+                    self._infer_batch,
+                    max_batch_size=self.batch_size,
+                    max_wait_ms=self.profile.max_wait_ms,
+                    name="beto-micro-batcher"
+                )
         else:
             self.device = "cpu"  # Valor por defecto cuando transformers no está disponible
             logger.warning("BETO no disponible - usando análisis básico de palabras clave")
     
     def _initialize_model(self):
         """
-        Inicializa el modelo BETO para análisis de sentimientos
+        Inicializa el modelo BETO para análisis de sentimientos.
+        
+        Si existen artefactos locales (prefetch en build) se cargan desde ahí;
+        los pesos en safetensors se mapean en memoria (mmap) en lugar de
+        copiarse. En modo offline nunca se consulta el Hub.
         """
         if not TRANSFORMERS_AVAILABLE:
             return
             
         try:
-            logger.info(f"Inicializando modelo BETO en dispositivo: {self.device}")
+            started = time.perf_counter()
+            source, local_only = self._resolve_model_source()
+            if source is None:
+                logger.error(
+                    f"Modo offline sin artefactos locales en {get_model_dir()}; "
+                    "ejecuta python -m src.Backend.tools.prefetch_sentiment_model"
+                )
+                return
+            
+            self.model_source = source
+            logger.info(f"Inicializando modelo {self.model_name} desde {source} en dispositivo: {self.device}")
+            
+            tokenizer = AutoTokenizer.from_pretrained(source, local_files_only=local_only)
+            tokenizer_done = time.perf_counter()
+            
+            model = AutoModelForSequenceClassification.from_pretrained(
+                source,
+                local_files_only=local_only,
+                use_safetensors=self._has_safetensors(source) or None,
+                low_cpu_mem_usage=True
+            )
+            model.eval()
+            model_done = time.perf_counter()
             
             # Cargar el pipeline de análisis de sentimientos
             self.analyzer = pipeline(
                 "sentiment-analysis",
-                model=self.model_name,
-                tokenizer=self.model_name,
+                model=model,
+                tokenizer=tokenizer,
                 device=0 if self.device == "cuda" else -1,
                 return_all_scores=True
             )
+            pipeline_done = time.perf_counter()
+            
+            # Algunos modelos alternativos aceptan secuencias más cortas que BETO
+            model_max_length = getattr(self.analyzer.tokenizer, "model_max_length", None)
+            if model_max_length and model_max_length < self.max_length:
+                self.max_length = model_max_length
             
-            logger.info("Modelo BETO inicializado correctamente")
+            # Primera inferencia: incluye la inicialización perezosa de torch
+            with self._inference_lock, self._inference_context():
+                self.analyzer("hola")
+            warmup_done = time.perf_counter()
+            
+            self.load_timings = {
+                "tokenizer_ms": (tokenizer_done - started) * 1000,
+                "model_ms": (model_done - tokenizer_done) * 1000,
+                "pipeline_ms": (pipeline_done - model_done) * 1000,
+                "warmup_ms": (warmup_done - pipeline_done) * 1000,
+                "total_ms": (warmup_done - started) * 1000
+            }
+            
+            logger.info(f"Modelo BETO inicializado correctamente en {self.load_timings['total_ms']:.0f} ms")
             
         except Exception as e:
             logger.error(f"Error al inicializar modelo BETO: {e}")
             self.analyzer = None
     
+    def _resolve_model_source(self) -> Tuple[Optional[str], bool]:
+        """
+        Decide de dónde cargar el modelo
+        
+        Returns:
+            Tuple (origen, solo_archivos_locales); origen None si no hay opción válida
+        """
+        model_dir = get_model_dir()
+        if has_local_artifacts(model_dir):
+            manifest = read_manifest(model_dir) or {}
+            prebaked_id = manifest.get("model_id")
+            if prebaked_id in (None, self.model_name):
+                return model_dir, True
+            logger.warning(
+                f"Los artefactos locales son de {prebaked_id}, no de {self.model_name}; se ignoran"
+            )
+        
+        if self.offline:
+            return None, True
+        return self.model_name, False
+    
+    def _has_safetensors(self, source: str) -> bool:
+        return os.path.isdir(source) and any(
+            name.endswith(".safetensors") for name in os.listdir(source)
+        )
+    
     def analyze_sentiment(self, text: str) -> Dict[str, any]:
         """
         Analiza el sentimiento de un texto usando BETO
@@ -106,11 +282,25 @@ class BetoSentimentAnalyzer:
                     "analysis_type": "empty_text"
                 }
             
-            # Realizar análisis con BETO
-            results = self.analyzer(clean_text)
+            # Los textos cortos (el caso típico de chat) van directo al pipeline
+            token_ids = None
+            if not self._fits_in_one_window(clean_text):
+                token_ids = self._tokenize_content(clean_text)
             
-            # Procesar resultados
-            sentiment_data = self._process_beto_results(results[0])
+            if token_ids is None or len(token_ids) <= self._window_size():
+                # Realizar análisis con BETO (agrupado con otras peticiones concurrentes)
+                if self._batcher is not None:
+                    scores = self._batcher.process(clean_text)
+                else:
+                    with self._inference_lock, self._inference_context():
+                        scores = self.analyzer(clean_text)[0]
+                
+                # Procesar resultados
+                sentiment_data = self._process_beto_results(scores)
+                analysis_type = "beto_model"
+            else:
+                sentiment_data = self._analyze_windows(token_ids)
+                analysis_type = "beto_model_windowed"
             
             # Agregar información adicional
             sentiment_data.update({
@@ -118,7 +308,7 @@ class BetoSentimentAnalyzer:
                 "processed_text": clean_text,
                 "model": self.model_name,
                 "device": self.device,
-                "analysis_type": "beto_model"
+                "analysis_type": analysis_type
             })
             
             logger.info(f"Análisis completado: {sentiment_data['label']} ({sentiment_data['confidence']:.2f})")
@@ -129,6 +319,199 @@ class BetoSentimentAnalyzer:
             logger.error(f"Error en análisis BETO: {e}")
             return self._fallback_analysis(text)
     
+    def analyze_batch(self, texts: List[str]) -> List[Dict[str, any]]:
+        """
+        Analiza varios textos en lote.
+        
+        Los textos se ordenan por longitud en tokens y se agrupan en buckets de
+        tamaño `batch_size`, de modo que cada forward pass solo rellena (padding)
+        hasta el texto más largo de su bucket. Los resultados se devuelven en el
+        mismo orden que la entrada.
+        
+        Args:
+            texts (List[str]): Textos a analizar
+            
+        Returns:
+            List[Dict] con un análisis por texto
+        """
+        results: List[Optional[Dict[str, any]]] = [None] * len(texts)
+        
+        if not TRANSFORMERS_AVAILABLE or not self.analyzer:
+            logger.warning("Modelo BETO no disponible, usando análisis básico en lote")
+            return [self._fallback_analysis(text) for text in texts]
+        
+        clean_texts = [self._preprocess_text(text) for text in texts]
+        pending = []
+        for index, clean_text in enumerate(clean_texts):
+            if not clean_text.strip():
+                results[index] = {
+                    "sentiment": "NEU",
+                    "confidence": 0.5,
+                    "label": "neutral",
+                    "scores": {"POS": 0.33, "NEG": 0.33, "NEU": 0.34},
+                    "analysis_type": "empty_text"
+                }
+            else:
+                pending.append(index)
+        
+        if not pending:
+            return results
+        
+        try:
+            token_ids = self.analyzer.tokenizer(
+                [clean_texts[i] for i in pending],
+                add_special_tokens=False
+            )["input_ids"]
+            
+            # Los textos que no caben en una ventana se analizan por ventanas
+            short = []
+            for index, ids in zip(pending, token_ids):
+                if len(ids) <= self._window_size():
+                    short.append((len(ids), index))
+                else:
+                    sentiment_data = self._analyze_windows(ids)
+                    sentiment_data.update({
+                        "original_text": texts[index],
+                        "processed_text": clean_texts[index],
+                        "model": self.model_name,
+                        "device": self.device,
+                        "analysis_type": "beto_model_windowed"
+                    })
+                    results[index] = sentiment_data
+            
+            ordered = [i for _, i in sorted(short)]
+            
+            for start in range(0, len(ordered), self.batch_size):
+                bucket = ordered[start:start + self.batch_size]
+                bucket_scores = self._infer_batch([clean_texts[i] for i in bucket])
+                
+                for index, scores in zip(bucket, bucket_scores):
+                    sentiment_data = self._process_beto_results(scores)
+                    sentiment_data.update({
+                        "original_text": texts[index],
+                        "processed_text": clean_texts[index],
+                        "model": self.model_name,
+                        "device": self.device,
+                        "analysis_type": "beto_model_batch"
+                    })
+                    results[index] = sentiment_data
+            
+            logger.info(f"Análisis en lote completado: {len(pending)} textos")
+            return results
+            
+        except Exception as e:
+            logger.error(f"Error en análisis BETO en lote: {e}")
+            return [
+                result if result is not None else self._fallback_analysis(texts[index])
+                for index, result in enumerate(results)
+            ]
+    
+    def _window_size(self) -> int:
+        """Tokens de contenido por ventana (descontando [CLS] y [SEP])"""
+        return self.max_length - 2
+    
+    def _fits_in_one_window(self, text: str) -> bool:
+        """
+        Cota sin tokenizar: WordPiece y los BPE a nivel de byte (modelos
+        RoBERTa elegibles con SENTIMENT_MODEL) dan a lo sumo un token por byte
+        UTF-8 (un emoji son hasta 4), y SentencePiece puede sumar un marcador
+        de inicio por palabra. Si la cota no alcanza, se tokeniza
+        """
+        upper_bound = len(text.encode("utf-8")) + len(text.split())
+        return upper_bound <= self._window_size()
+    
+    def _tokenize_content(self, text: str) -> List[int]:
+        """Tokeniza el texto sin tokens especiales ni truncamiento"""
+        return self.analyzer.tokenizer(text, add_special_tokens=False)["input_ids"]
+    
+    def _analyze_windows(self, token_ids: List[int]) -> Dict[str, any]:
+        """
+        Analiza un texto largo dividiéndolo en ventanas de tokens solapadas.
+        
+        Todas las ventanas del mensaje se procesan en un solo lote y sus
+        probabilidades se promedian ponderando por la longitud de cada ventana.
+        """
+        size = self._window_size()
+        step = max(1, size - min(self.window_overlap, size - 1))
+        
+        windows = []
+        for start in range(0, len(token_ids), step):
+            windows.append(token_ids[start:start + size])
+            if start + size >= len(token_ids):
+                break
+        
+        aggregated: Dict[str, float] = {}
+        total_weight = 0
+        for start in range(0, len(windows), self.batch_size):
+            chunk = windows[start:start + self.batch_size]
+            for window, scores in zip(chunk, self._infer_token_windows(chunk)):
+                weight = len(window)
+                total_weight += weight
+                for result in scores:
+                    aggregated[result["label"]] = aggregated.get(result["label"], 0.0) + result["score"] * weight
+        
+        sentiment_data = self._process_beto_results([
+            {"label": label, "score": score / total_weight}
+            for label, score in aggregated.items()
+        ])
+        sentiment_data["windows"] = len(windows)
+        return sentiment_data
+    
+    def _infer_token_windows(self, windows: List[List[int]]) -> List[list]:
+        """
+        Ejecuta un forward pass sobre ventanas ya tokenizadas con padding dinámico
+        """
+        tokenizer = self.analyzer.tokenizer
+        encoded = tokenizer.pad(
+            {"input_ids": [tokenizer.build_inputs_with_special_tokens(window) for window in windows]},
+            padding="longest",
+            return_tensors="pt"
+        )
+        return self._forward(encoded)
+    
+    def _infer_batch(self, texts: List[str]) -> List[list]:
+        """
+        Ejecuta un forward pass sobre un lote con padding dinámico
+        (hasta el texto más largo del lote, no hasta max_length)
+        
+        Returns:
+            Lista con el formato de salida del pipeline: [{"label", "score"}, ...] por texto
+        """
+        encoded = self.analyzer.tokenizer(
+            texts,
+            padding="longest",
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="pt"
+        )
+        return self._forward(encoded)
+    
+    def _forward(self, encoded) -> List[list]:
+        """
+        Ejecuta el modelo sobre entradas ya codificadas y devuelve las
+        probabilidades por etiqueta de cada fila
+        """
+        model = self.analyzer.model
+        encoded = {key: value.to(model.device) for key, value in encoded.items()}
+        
+        with self._inference_lock, self._inference_context():
+            logits = model(**encoded).logits
+        probabilities = torch.softmax(logits, dim=-1).cpu().tolist()
+        
+        id2label = model.config.id2label
+        return [
+            [{"label": id2label[i], "score": score} for i, score in enumerate(row)]
+            for row in probabilities
+        ]
+    
+    def _inference_context(self):
+        """Contexto sin autograd: inference_mode si torch lo soporta"""
+        if not TORCH_AVAILABLE or torch is None:
+            return nullcontext()
+        if hasattr(torch, "inference_mode"):
+            return torch.inference_mode()
+        return torch.no_grad()
+    
     def _process_beto_results(self, results: list) -> Dict[str, any]:
         """
         Procesa los resultados del modelo BETO
@@ -138,11 +521,13 @@ class BetoSentimentAnalyzer:
         max_score = 0
         predicted_label = "NEU"
         
+        # Otros modelos usan etiquetas distintas (p. ej. "positive" o "5 stars");
+        # se agrupan en POS/NEG/NEU sumando sus probabilidades
         for result in results:
-            label = result['label']
-            score = result['score']
-            scores[label] = score
-            
+            label = normalize_sentiment_label(result['label'])
+            scores[label] = scores.get(label, 0.0) + result['score']
+        
+        for label, score in scores.items():
             if score > max_score:
                 max_score = score
                 predicted_label = label
@@ -171,10 +556,11 @@ class BetoSentimentAnalyzer:
         # Limpiar texto básico
         clean_text = text.strip()
         
-        # Limitar longitud para evitar problemas con el modelo
-        if len(clean_text) > 512:
-            clean_text = clean_text[:512]
-            logger.warning("Texto truncado a 512 caracteres")
+        # Los textos largos se analizan por ventanas de tokens; solo se recortan
+        # los que superan el límite duro de caracteres
+        if len(clean_text) > self.max_chars:
+            clean_text = clean_text[:self.max_chars]
+            logger.warning(f"Texto truncado a {self.max_chars} caracteres")
         
         return clean_text
     
@@ -182,49 +568,7 @@ class BetoSentimentAnalyzer:
         """
         Análisis de respaldo cuando BETO no está disponible
         """
-        # Análisis básico por palabras clave
-        positive_words = [
-            "bueno", "excelente", "genial", "perfecto", "gracias", "bien", 
-            "fantástico", "increíble", "maravilloso", "estupendo", "feliz",
-            "contento", "satisfecho", "encantado", "amor", "gustar"
-        ]
-        
-        negative_words = [
-            "malo", "terrible", "horrible", "pésimo", "odio", "detesto",
-            "molesto", "enojado", "furioso", "triste", "decepcionado",
-            "frustrado", "problema", "error", "fallo", "disgusto"
-        ]
-        
-        text_lower = text.lower()
-        
-        pos_count = sum(1 for word in positive_words if word in text_lower)
-        neg_count = sum(1 for word in negative_words if word in text_lower)
-        
-        if pos_count > neg_count:
-            sentiment = "POS"
-            label = "positivo"
-            confidence = min(0.6 + (pos_count * 0.1), 0.9)
-        elif neg_count > pos_count:
-            sentiment = "NEG"
-            label = "negativo"
-            confidence = min(0.6 + (neg_count * 0.1), 0.9)
-        else:
-            sentiment = "NEU"
-            label = "neutral"
-            confidence = 0.5
-        
-        return {
-            "sentiment": sentiment,
-            "confidence": confidence,
-            "label": label,
-            "scores": {
-                "POS": 0.6 if sentiment == "POS" else 0.2,
-                "NEG": 0.6 if sentiment == "NEG" else 0.2,
-                "NEU": 0.6 if sentiment == "NEU" else 0.2
-            },
-            "analysis_type": "fallback_keywords",
-            "original_text": text
-        }
+        return fallback_analysis(text)
     
     def get_model_info(self) -> Dict[str, any]:
         """
@@ -243,11 +587,17 @@ class BetoSentimentAnalyzer:
             "available": self.analyzer is not None,
             "cuda_available": cuda_available,
             "transformers_available": TRANSFORMERS_AVAILABLE,
-            "torch_available": TORCH_AVAILABLE
+            "torch_available": TORCH_AVAILABLE,
+            "model_source": self.model_source,
+            "offline": self.offline,
+            "load_timings": self.load_timings,
+            "inference_profile": asdict(self.profile),
+            "micro_batching": self._batcher is not None
         }
 
 # Instancia global del analizador
 _sentiment_analyzer = None
+_sentiment_analyzer_lock = threading.Lock()
 
 def get_sentiment_analyzer() -> BetoSentimentAnalyzer:
     """
@@ -255,7 +605,11 @@ def get_sentiment_analyzer() -> BetoSentimentAnalyzer:
     """
     global _sentiment_analyzer
     if _sentiment_analyzer is None:
-        _sentiment_analyzer = BetoSentimentAnalyzer()
+        # El arranque lo carga en segundo plano; una petición que llegue
+        # antes espera esa misma carga en lugar de iniciar otra
+        with _sentiment_analyzer_lock:
+            if _sentiment_analyzer is None:
+                _sentiment_analyzer = BetoSentimentAnalyzer()
     return _sentiment_analyzer
 
 def analyze_sentiment(text: str) -> Dict[str, any]:
@@ -265,13 +619,17 @@ def analyze_sentiment(text: str) -> Dict[str, any]:
     analyzer = get_sentiment_analyzer()
     return analyzer.analyze_sentiment(text)
 
-def get_sentiment_score(text: str) -> float:
+def analyze_sentiment_batch(texts: List[str]) -> List[Dict[str, any]]:
     """
-    Obtiene solo el score de sentimiento (para compatibilidad)
+    Función de conveniencia para analizar varios textos en lote
+    """
+    analyzer = get_sentiment_analyzer()
+    return analyzer.analyze_batch(texts)
+
+def sentiment_result_to_score(result: Dict[str, any]) -> float:
+    """
+    Convierte un resultado de análisis a score numérico (1-10)
     """
-    result = analyze_sentiment(text)
-    
-    # Convertir a score numérico (1-10)
     confidence = result.get('confidence', 0.5)
     sentiment = result.get('sentiment', 'NEU')
     
@@ -282,6 +640,13 @@ def get_sentiment_score(text: str) -> float:
     else:
         return 5.0  # 5 para neutral
 
+def get_sentiment_score(text: str) -> float:
+    """
+    Obtiene solo el score de sentimiento (para compatibilidad)
+    """
+    result = analyze_sentiment(text)
+    return sentiment_result_to_score(result)
+
 # Función de compatibilidad con el sistema anterior
 def analizar_sentimiento_gemini(texto: str, api_key: Optional[str] = None) -> str:
     """
@@ -0,0 +1,101 @@
+"""
+Armado del contexto de conversación con presupuesto de tokens.
+
+En lugar de incluir siempre los últimos 5 turnos, se llenan los turnos más
+recientes hacia atrás hasta agotar un presupuesto de tokens. Los turnos más
+viejos quedan representados por el resumen acumulado del chat
+(tabla chat_summaries, ver conversation_summary.py), de modo que el tamaño del
+prompt queda acotado aunque la conversación sea arbitrariamente larga.
+
+El conteo de tokens es una estimación por caracteres: no hay tokenizer local
+de Gemini ni de Mistral, y para repartir un presupuesto basta con un valor
+aproximado y conservador.
+
+Variables de entorno:
+    CONTEXT_TOKEN_BUDGET: tokens para historial + resumen (por defecto 1200)
+    CONTEXT_MAX_TURNS: máximo de turnos recientes incluidos (por defecto 20)
+    CONTEXT_SUMMARY_MAX_TOKENS: tope del resumen dentro del presupuesto (por defecto 300)
+    CONTEXT_CHARS_PER_TOKEN: caracteres por token estimados (por defecto 3.5)
+"""
+
+import os
+import math
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "20"))
+CONTEXT_SUMMARY_MAX_TOKENS = int(os.getenv("CONTEXT_SUMMARY_MAX_TOKENS", "300"))
+CONTEXT_CHARS_PER_TOKEN = float(os.getenv("CONTEXT_CHARS_PER_TOKEN", "3.5"))
+
+@dataclass
+class ConversationSummary:
+    """Resumen acumulado de los primeros `turns_covered` turnos de un chat"""
+    text: str
+    turns_covered: int = 0
+
+@dataclass
+class BuiltContext:
+    """Contexto listo para el prompt"""
+    summary: Optional[str] = None
+    turns: List[Dict] = field(default_factory=list)
+    tokens: int = 0
+    omitted_turns: int = 0
+
+def count_tokens(text: str) -> int:
+    """Estimación de tokens de un texto"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / CONTEXT_CHARS_PER_TOKEN)
+
+def truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Recorta un texto para que quepa en `max_tokens` (conserva el final)"""
+    max_chars = int(max_tokens * CONTEXT_CHARS_PER_TOKEN)
+    if len(text) <= max_chars:
+        return text
+    # Sin lugar más que para el "…" (text[-0:] sería el texto completo)
+    if max_chars <= 1:
+        return ""
+    return "…" + text[-(max_chars - 1):]
+
+def turn_tokens(turn: Dict) -> int:
+    return count_tokens(turn.get("message") or "") + count_tokens(turn.get("response") or "")
+
+def build_context(conversation_history: Optional[list], summary: Optional[ConversationSummary] = None,
+                  budget: int = CONTEXT_TOKEN_BUDGET, max_turns: int = CONTEXT_MAX_TURNS) -> BuiltContext:
+    """
+    Selecciona los turnos más recientes que caben en el presupuesto
+
+    Los turnos ya cubiertos por el resumen no se repiten. El turno más
+    reciente siempre se incluye (recortado si hace falta).
+    """
+    turns = [msg for msg in (conversation_history or []) if isinstance(msg, dict)]
+    context = BuiltContext()
+
+    if summary and summary.text:
+        context.summary = truncate_to_tokens(summary.text, min(CONTEXT_SUMMARY_MAX_TOKENS, budget))
+        context.tokens = count_tokens(context.summary)
+        turns = turns[summary.turns_covered:]
+
+    selected = []
+    for turn in reversed(turns):
+        if len(selected) >= max_turns:
+            break
+        cost = turn_tokens(turn)
+        if context.tokens + cost > budget:
+            if not selected:
+                # El turno más reciente es demasiado largo: se recorta
+                remaining = max(0, budget - context.tokens)
+                message = truncate_to_tokens(turn.get("message") or "", remaining // 2)
+                response = truncate_to_tokens(turn.get("response") or "", remaining - count_tokens(message))
+                # Si el resumen ocupó todo el presupuesto no queda nada del turno
+                if message or response:
+                    selected.append({**turn, "message": message, "response": response})
+                    context.tokens += count_tokens(message) + count_tokens(response)
+            break
+        selected.append(turn)
+        context.tokens += cost
+
+    context.turns = list(reversed(selected))
+    context.omitted_turns = len(turns) - len(selected)
+    return context
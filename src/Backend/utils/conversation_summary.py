@@ -0,0 +1,80 @@
+"""
+Resumen acumulado ("rolling summary") de las conversaciones largas.
+
+Cada CONTEXT_SUMMARY_EVERY_N_TURNS turnos nuevos, los turnos que ya salieron
+de la ventana reciente se pliegan en el resumen del chat con una llamada
+corta al LLM. El resumen se guarda en la tabla chat_summaries junto con el
+número de turnos que cubre, y el armado de contexto (context_builder.py) lo
+usa en lugar de esos turnos. Si el LLM no responde se usa un resumen
+extractivo con las preguntas del usuario, para no perder el avance.
+
+Variables de entorno:
+    CONTEXT_SUMMARY_ENABLED: "0" para desactivar los resúmenes (por defecto activos)
+    CONTEXT_SUMMARY_EVERY_N_TURNS: turnos nuevos que disparan un refresco (por defecto 6)
+    CONTEXT_SUMMARY_KEEP_RECENT: turnos recientes que nunca se resumen (por defecto 4)
+"""
+
+import os
+from typing import Callable, List, Optional
+
+from .context_builder import CONTEXT_SUMMARY_MAX_TOKENS, truncate_to_tokens
+
+CONTEXT_SUMMARY_ENABLED = os.getenv("CONTEXT_SUMMARY_ENABLED", "1").lower() not in ("0", "false", "no")
+CONTEXT_SUMMARY_EVERY_N_TURNS = int(os.getenv("CONTEXT_SUMMARY_EVERY_N_TURNS", "6"))
+CONTEXT_SUMMARY_KEEP_RECENT = int(os.getenv("CONTEXT_SUMMARY_KEEP_RECENT", "4"))
+
+def summary_target(total_turns: int) -> int:
+    """Número de turnos que debería cubrir el resumen"""
+    return max(0, total_turns - CONTEXT_SUMMARY_KEEP_RECENT)
+
+def needs_refresh(total_turns: int, turns_covered: int) -> bool:
+    """Hay suficientes turnos nuevos fuera de la ventana reciente para resumir"""
+    if not CONTEXT_SUMMARY_ENABLED:
+        return False
+    return summary_target(total_turns) - turns_covered >= max(1, CONTEXT_SUMMARY_EVERY_N_TURNS)
+
+def build_summary_prompt(previous_summary: Optional[str], turns: List[dict]) -> str:
+    """
+    Prompt para plegar los turnos nuevos en el resumen anterior
+    """
+    lines = []
+    for turn in turns:
+        if turn.get("message"):
+            lines.append(f"Usuario: {turn['message']}")
+        if turn.get("response"):
+            lines.append(f"LEAN BOT: {turn['response']}")
+
+    prompt = (
+        "Resume en español, en un solo párrafo de máximo 120 palabras, la conversación "
+        "entre un usuario y LEAN BOT (asistente de INGE LEAN). Conserva los datos que el "
+        "usuario dio sobre sí mismo, sus necesidades, preguntas pendientes y acuerdos. "
+        "No inventes información ni agregues saludos.\n\n"
+    )
+    if previous_summary:
+        prompt += f"Resumen previo:\n{previous_summary}\n\n"
+    prompt += "Turnos nuevos:\n" + "\n".join(lines) + "\n\nResumen actualizado:"
+    return prompt
+
+def extractive_summary(previous_summary: Optional[str], turns: List[dict]) -> str:
+    """Resumen de respaldo sin LLM: las preguntas del usuario, en orden"""
+    questions = "; ".join(turn["message"].strip() for turn in turns if turn.get("message"))
+    text = f"{previous_summary} " if previous_summary else ""
+    text += f"El usuario preguntó: {questions}." if questions else ""
+    return truncate_to_tokens(text.strip(), CONTEXT_SUMMARY_MAX_TOKENS)
+
+def summarize_turns(previous_summary: Optional[str], turns: List[dict],
+                    complete: Optional[Callable[[str], str]] = None) -> str:
+    """
+    Pliega `turns` en el resumen previo
+
+    Args:
+        complete: función prompt -> texto del LLM (si falla se usa el resumen extractivo)
+    """
+    if complete is not None:
+        try:
+            text = (complete(build_summary_prompt(previous_summary, turns)) or "").strip()
+            if text and not text.startswith("Lo siento"):
+                return truncate_to_tokens(text, CONTEXT_SUMMARY_MAX_TOKENS)
+        except Exception as e:
+            print(f"⚠️ No se pudo generar el resumen con IA, usando resumen extractivo: {e}")
+    return extractive_summary(previous_summary, turns)
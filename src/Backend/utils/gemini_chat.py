@@ -1,11 +1,26 @@
 import requests
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
 from .api_key_manager import get_working_api_key, get_api_key_manager
+from .http_client import GEMINI_API_BASE_URL, get_http_session
+from .admission import (
+    RATE_LIMIT_MAX_RETRIES, KeyRateLimitedError, ProviderOverloadedError, parse_retry_after, remaining_timeout,
+    request_deadline, send_with_backoff
+)
+from .context_builder import ConversationSummary, build_context
+from .gemini_context_cache import get_gemini_context_cache
+from .lean_context import KNOWLEDGE_RETRIEVAL_ENABLED, get_system_context
+from .knowledge_index import retrieve_knowledge
+from .structured_reply import GEMINI_RESPONSE_SCHEMA, STRUCTURED_EXTRA_OUTPUT_TOKENS, STRUCTURED_INSTRUCTION
 
 class GeminiChatService:
     def __init__(self, api_key: str = None):
+        # Con las claves del gestor, cada petición toma la suya (acquire_api_key);
+        # self.api_key queda como la clave por defecto y no cambia, porque la
+        # instancia se comparte entre hilos
+        self._managed_key = not (api_key and api_key.strip())
+        
         # Si se proporciona una API key específica, usarla
         if api_key and api_key.strip():
             self.api_key = api_key
@@ -20,122 +35,206 @@ class GeminiChatService:
         
         # Usar el modelo especificado (gemini-2.0-flash como en el ejemplo del usuario)
         self.model = "gemini-2.0-flash"
-        self.base_url = f"https://generativelanguage.googleapis.com/v1beta/models/{self.model}:generateContent"
+        # URL base configurable (p. ej. un servidor local de pruebas)
+        self.api_base = GEMINI_API_BASE_URL
+        self.base_url = f"{self.api_base}/v1beta/models/{self.model}:generateContent"
+        self.stream_url = f"{self.api_base}/v1beta/models/{self.model}:streamGenerateContent"
         
-        # Contexto base de LEAN BOT
-        self.lean_context = """
-        Eres **LEAN BOT**, el asistente conversacional oficial de **INGE LEAN S.A.S**, una empresa tecnológica colombiana con sede en Pereira (Risaralda, Colombia). Tu propósito es representar la identidad de la marca y comunicar claramente quiénes son, qué hacen, cómo trabajan, y qué limitaciones tienen. Usa un tono profesional, cercano, centrado en la innovación, la eficiencia y el sello "Hecho en Colombia".
-
-### 1. Información corporativa básica
-- **Nombre legal**: INGE LEAN S.A.S (Sociedad por Acciones Simplificada), NIT 9006141198
-- **Fundación**: Desde 2013 en Pereira, Risaralda, Colombia
-- **Ubicación física**: Calle 29 No. 10‑23, barrio La Victoria, Pereira, Risaralda, Colombia
-- **Tamaño estimado**: Entre 11 y 50 empleados
-
-### 2. Misión y enfoque
-- Aliado estratégico de empresas que buscan optimizar sus procesos industriales y comerciales mediante tecnología de vanguardia: automatización industrial, inteligencia artificial, ingeniería de software y hardware a la medida y mantenimiento predictivo
-- Compromiso con soluciones 100 % diseñadas, desarrolladas y fabricadas con talento colombiano ("Hecho en Colombia") para promover innovación local
-
-### 3. Productos, servicios y capacidades
-- **Hardware industrial personalizado**: diseño y fabricación de tarjetas electrónicas, PCB, controladores PLC hechos a medida para retos específicos de cada planta industrial
-- **Software a la medida**: sistemas industriales, automatización, telemetría, análisis y dashboards para toma de decisiones basada en datos
-- **Automatización e Industria 4.0**: integración de IoT, IA, RPA y mejoras continuas para eficiencia operativa
-- **Mantenimiento industrial y soporte**: incluyendo seguimiento, calibración y atención técnica especializada
-
-### 4. Audiencia objetivo y posicionamiento
-- Empresas industriales y PYMEs en sectores de manufactura, producción, logística, contabilidad operativa, que buscan digitalizar y optimizar sus procesos sin necesidad de grandes inversiones iniciales
-- Posicionamiento como el socio ideal para implementar transformación digital accesible, escalable y con retorno tangible.
-
-### 5. Comunicación de marca y mensajes frecuentes
-- Mensajes centrales: "Innovación práctica", "Tecnología con propósito", "Digitalización con enfoque estratégico"
-- Frecuentes publicaciones sobre transformación digital, cultura de datos, automatización accesible para PYMEs, desarrollo local de hardware
-
-### 6. Limitaciones y ámbito de actuación
-- No eres un asistente general de IA; tus respuestas se limitan a información sobre INGE LEAN, sus productos y servicios, su filosofía y preguntas frecuentes relacionadas.
-- No tienes acceso a sistemas internos ni información financiera detallada más allá de lo público.
-- No realizas ventas ni trámites legales; puedes sugerir contacto al área comercial para cotizaciones o soporte técnico (correo: comercial@ingelean.com, WhatsApp: +57 311 419 6803)
-
-### 7. Tono y estilo de interacción
-- Elegante, técnico pero amigable. Evita jerga innecesaria, pero no sacrifiques claridad o humanidad en la respuesta.
-- Muestras orgullo por "ingeniería colombiana", enfatizas la personalización, eficiencia y enfoque en resultados.
-
-### 8. Preguntas frecuentes que puedes responder
-- ¿Qué servicios ofrecen?
-- ¿Cómo funciona su desarrollo de hardware a medida?
-- ¿Qué es Ingelean Plus y qué incluye su plataforma?
-- ¿Cómo implementan Industry 4.0 en PYMEs?
-- ¿Qué ejemplos de proyectos han desarrollado en Colombia? (sin información privada)
-
-### Ejemplo de inicio de conversación
-Usuario: "¿Qué hace INGE LEAN?"
-LEAN BOT: "Somos INGE LEAN S.A.S, una empresa colombiana con sede en Pereira especializada en ingeniería a medida: desarrollamos hardware y software industrial, automatización e inteligencia artificial aplicada a procesos productivos. Desde 2013 hemos sido el aliado de PYMEs e industrias que buscan digitalizar sus operaciones con talento 100 % colombiano..."
-
-Responde exclusivamente como LEAN BOT de acuerdo a esta información.
+        # Contexto base de LEAN BOT (persona; el conocimiento se recupera por mensaje)
+        self.lean_context = get_system_context()
+    
+    def _build_request(self, user_message: str, conversation_history: list = None,
+                       summary: Optional[ConversationSummary] = None,
+                       cached_content: Optional[str] = None,
+                       max_output_tokens: Optional[int] = None,
+                       structured: bool = False) -> Dict[str, Any]:
+        """
+        Construye el cuerpo de la petición a Gemini con el contexto de LEAN BOT
+        
+        El contexto va como systemInstruction (o como referencia al contenido
+        cacheado en Gemini), el historial como turnos user/model y el
+        conocimiento recuperado justo antes del mensaje actual. Con
+        `structured` la respuesta es un JSON con reply, score y sentiment.
+        """
+        contents = []
+        
+        def add(role: str, text: str):
+            # Gemini espera turnos alternados: los consecutivos del mismo rol se unen
+            if contents and contents[-1]["role"] == role:
+                contents[-1]["parts"].append({"text": text})
+            else:
+                contents.append({"role": role, "parts": [{"text": text}]})
+        
+        # Historial dentro del presupuesto de tokens (y resumen de lo anterior)
+        context = build_context(conversation_history, summary)
+        if context.summary:
+            add("user", f"Resumen de la conversación hasta ahora: {context.summary}")
+        for msg in context.turns:
+            if msg.get("message"):
+                add("user", msg["message"])
+            if msg.get("response"):
+                add("model", msg["response"])
+        
+        # Conocimiento de INGE LEAN relevante para este mensaje
+        if KNOWLEDGE_RETRIEVAL_ENABLED:
+            knowledge = retrieve_knowledge(user_message, conversation_history)
+            if knowledge:
+                add("user", knowledge)
+        
+        if structured:
+            add("user", STRUCTURED_INSTRUCTION)
+        
+        # Agregar el mensaje actual del usuario
+        add("user", user_message)
+        
+        request = {
+            "contents": contents,
+            "generationConfig": {
+                "temperature": 0.7,
+                "maxOutputTokens": max_output_tokens or 300,
+                "topP": 0.95,
+                "topK": 40
+            }
+        }
+        if structured:
+            request["generationConfig"].update({
+                "maxOutputTokens": request["generationConfig"]["maxOutputTokens"] + STRUCTURED_EXTRA_OUTPUT_TOKENS,
+                "responseMimeType": "application/json",
+                "responseSchema": GEMINI_RESPONSE_SCHEMA
+            })
+        if cached_content:
+            request["cachedContent"] = cached_content
+        else:
+            request["systemInstruction"] = {"parts": [{"text": self.lean_context}]}
+        return request
+    
+    def acquire_api_key(self) -> Optional[str]:
+        """
+        API key para una petición: la personalizada, o la que el gestor (pool)
+        asigne; si el gestor no tiene ninguna validada, la clave por defecto.
+        Quien llama la pasa a generate_response/stream_response, así la
+        admisión y la contabilidad por clave usan la misma.
+        
+        Raises:
+            ProviderOverloadedError: Si todas las claves del pool están en enfriamiento
         """
+        if not self._managed_key:
+            return self.api_key
+        try:
+            return get_api_key_manager().acquire_key()
+        except ValueError:
+            return self.api_key
     
-    def generate_response(self, user_message: str, conversation_history: list = None) -> str:
+    def _check_auth(self, response: requests.Response, api_key: str):
+        """
+        Si Gemini rechazó la API key, invalida su validación en caché para que
+        la siguiente petición use una clave que funcione
+        """
+        rejected = response.status_code in (401, 403) or (
+            response.status_code == 400 and "API_KEY_INVALID" in response.text
+        )
+        if rejected:
+            get_api_key_manager().report_auth_failure(api_key)
+    
+    def _rotates_keys(self) -> bool:
+        """Las claves vienen del pool: ante un 429 se cambia de clave en vez de esperar"""
+        return self._managed_key and get_api_key_manager().pool is not None
+    
+    def _raise_if_rate_limited(self, response: requests.Response, api_key: str):
+        """
+        Con el pool, un 429 deja la clave en enfriamiento y se informa a quien
+        tiene el lugar de admisión, que reintenta con otra clave y otro lugar
+        
+        Raises:
+            KeyRateLimitedError: Si la clave del pool respondió 429
+        """
+        if response.status_code == 429 and self._rotates_keys():
+            get_api_key_manager().report_rate_limited(
+                api_key, parse_retry_after(response.headers.get("Retry-After")))
+            response.close()
+            raise KeyRateLimitedError(api_key)
+    
+    def _post(self, url: str, api_key: str, user_message: str, conversation_history: list = None,
+              summary: Optional[ConversationSummary] = None, max_output_tokens: Optional[int] = None,
+              structured: bool = False, **kwargs) -> requests.Response:
+        """
+        Envía la petición. Con el pool, una clave que responde 429 no se
+        reintenta con backoff (KeyRateLimitedError); sin pool se reintenta la
+        misma clave con backoff
+        
+        Raises:
+            KeyRateLimitedError: Si la clave del pool respondió 429
+        """
+        max_retries = 0 if self._rotates_keys() else RATE_LIMIT_MAX_RETRIES
+        response = self._post_with_key(url, api_key, user_message, conversation_history, summary,
+                                       max_output_tokens, structured, request_deadline(), max_retries, **kwargs)
+        self._raise_if_rate_limited(response, api_key)
+        return response
+    
+    def _post_with_key(self, url: str, api_key: str, user_message: str, conversation_history: list = None,
+                       summary: Optional[ConversationSummary] = None, max_output_tokens: Optional[int] = None,
+                       structured: bool = False, deadline: Optional[float] = None,
+                       max_retries: int = RATE_LIMIT_MAX_RETRIES, **kwargs) -> requests.Response:
+        """
+        Envía la petición usando el contexto cacheado en Gemini si está activo;
+        si Gemini ya no reconoce el contenido cacheado, reintenta una vez con
+        el contexto completo. Los reintentos no pasan de `deadline`.
+        """
+        deadline = deadline or request_deadline()
+        context_cache = get_gemini_context_cache()
+        cached_content = context_cache.get_cache_name(self.api_base, api_key, self.model, self.lean_context)
+        headers = {
+            "Content-Type": "application/json",
+            "X-goog-api-key": api_key
+        }
+        
+        response = send_with_backoff(lambda: get_http_session().post(
+            url,
+            headers=headers,
+            json=self._build_request(user_message, conversation_history, summary, cached_content, max_output_tokens,
+                                     structured),
+            timeout=remaining_timeout(deadline),
+            **kwargs
+        ), max_retries=max_retries, deadline=deadline)
+        if cached_content and response.status_code in (400, 403, 404):
+            print(f"⚠️ Gemini rechazó el contexto cacheado {cached_content} ({response.status_code}), reintentando sin caché")
+            response.close()
+            context_cache.invalidate(api_key, self.model, self.lean_context)
+            response = send_with_backoff(lambda: get_http_session().post(
+                url,
+                headers=headers,
+                json=self._build_request(user_message, conversation_history, summary,
+                                         max_output_tokens=max_output_tokens, structured=structured),
+                timeout=remaining_timeout(deadline),
+                **kwargs
+            ), max_retries=max_retries, deadline=deadline)
+        self._check_auth(response, api_key)
+        return response
+    
+    def generate_response(self, user_message: str, conversation_history: list = None,
+                          summary: Optional[ConversationSummary] = None,
+                          max_output_tokens: Optional[int] = None, structured: bool = False,
+                          api_key: Optional[str] = None) -> str:
         """
         Genera una respuesta usando Gemini API con el contexto de LEAN BOT
+        
+        Con `structured` devuelve el JSON de responseSchema (reply, score,
+        sentiment); ver structured_reply.parse_structured_reply. `api_key` es
+        la clave ya asignada a esta petición (ver acquire_api_key).
         """
         try:
-            # Verificar API key y obtener una funcional si es necesario
-            current_api_key = self.api_key
+            current_api_key = api_key or self.acquire_api_key()
             if not current_api_key:
-                try:
-                    current_api_key = get_working_api_key()
-                    self.api_key = current_api_key
-                except ValueError:
-                    return "Lo siento, no tengo configurada la conexión con el servicio de chat. Por favor, configura la API key."
-            
-            # Construir el prompt completo con contexto
-            full_prompt = self.lean_context + "\n\n"
-            
-            # Agregar historial de conversación si existe
-            if conversation_history:
-                for msg in conversation_history[-5:]:  # Últimos 5 mensajes para contexto
-                    if isinstance(msg, dict):
-                        if msg.get("message"):
-                            full_prompt += f"Usuario: {msg['message']}\n"
-                        if msg.get("response"):
-                            full_prompt += f"LEAN BOT: {msg['response']}\n"
+                return "Lo siento, no tengo configurada la conexión con el servicio de chat. Por favor, configura la API key."
             
-            # Agregar el mensaje actual del usuario
-            full_prompt += f"Usuario: {user_message}\n\nResponde como LEAN BOT:"
-            
-            # Preparar la petición a Gemini con la estructura correcta
-            data = {
-                "contents": [
-                    {
-                        "parts": [
-                            {
-                                "text": full_prompt
-                            }
-                        ]
-                    }
-                ],
-                "generationConfig": {
-                    "temperature": 0.7,
-                    "maxOutputTokens": 300,
-                    "topP": 0.95,
-                    "topK": 40
-                }
-            }
-            
-            # Hacer la petición a Gemini API con headers como en el ejemplo
-            headers = {
-                "Content-Type": "application/json",
-                "X-goog-api-key": current_api_key
-            }
-            
-            response = requests.post(
-                self.base_url,
-                headers=headers,
-                json=data,
-                timeout=30
-            )
+            response = self._post(self.base_url, current_api_key, user_message, conversation_history, summary,
+                                  max_output_tokens=max_output_tokens, structured=structured)
             
             response.raise_for_status()
             result = response.json()
+            usage = result.get("usageMetadata") or {}
+            get_gemini_context_cache().record_usage(usage)
+            get_api_key_manager().record_tokens(current_api_key, usage.get("totalTokenCount"))
             
             # Extraer la respuesta del modelo
             if "candidates" in result and len(result["candidates"]) > 0:
@@ -148,6 +247,8 @@ Responde exclusivamente como LEAN BOT de acuerdo a esta información.
             else:
                 return "Lo siento, no pude procesar tu mensaje. ¿Podrías intentarlo de nuevo?"
                 
+        except (ProviderOverloadedError, KeyRateLimitedError):
+            raise
         except requests.exceptions.Timeout:
             return "Lo siento, la respuesta está tomando más tiempo del esperado. ¿Podrías intentarlo de nuevo?"
         except requests.exceptions.RequestException as e:
@@ -157,6 +258,90 @@ Responde exclusivamente como LEAN BOT de acuerdo a esta información.
             print(f"Error inesperado en Gemini Chat Service: {e}")
             return "Lo siento, algo salió mal. ¿Podrías intentarlo de nuevo?"
     
+    def stream_response(self, user_message: str, conversation_history: list = None,
+                        summary: Optional[ConversationSummary] = None,
+                        max_output_tokens: Optional[int] = None,
+                        api_key: Optional[str] = None) -> Iterator[str]:
+        """
+        Genera una respuesta en streaming (streamGenerateContent con SSE),
+        entregando cada fragmento de texto a medida que llega
+        
+        Raises:
+            ValueError: Si no hay API key disponible
+            requests.exceptions.RequestException: Si falla la petición
+        """
+        current_api_key = api_key or self.acquire_api_key()
+        if not current_api_key:
+            raise ValueError("API key de Gemini no configurada")
+        usage = None
+        
+        response = self._post(
+            self.stream_url, current_api_key, user_message, conversation_history, summary,
+            max_output_tokens=max_output_tokens,
+            params={"alt": "sse"},
+            stream=True
+        )
+        with response:
+            response.raise_for_status()
+            # SSE es UTF-8; sin charset en Content-Type requests asumiría ISO-8859-1
+            response.encoding = "utf-8"
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if not payload:
+                    continue
+                
+                chunk = json.loads(payload)
+                usage = chunk.get("usageMetadata", usage)
+                for candidate in chunk.get("candidates", [])[:1]:
+                    for part in candidate.get("content", {}).get("parts", []):
+                        text = part.get("text")
+                        if text:
+                            yield text
+        
+        get_gemini_context_cache().record_usage(usage)
+        get_api_key_manager().record_tokens(current_api_key, (usage or {}).get("totalTokenCount"))
+    
+    def complete(self, prompt: str, max_output_tokens: int = 300, temperature: float = 0.2,
+                 api_key: Optional[str] = None) -> str:
+        """
+        Completa un prompt libre, sin el contexto de LEAN BOT (resúmenes,
+        tareas internas)
+        
+        Raises:
+            ValueError: Si no hay API key disponible
+            requests.exceptions.RequestException: Si falla la petición
+        """
+        current_api_key = api_key or self.acquire_api_key()
+        if not current_api_key:
+            raise ValueError("API key de Gemini no configurada")
+        deadline = request_deadline()
+        max_retries = 0 if self._rotates_keys() else RATE_LIMIT_MAX_RETRIES
+        response = send_with_backoff(lambda: get_http_session().post(
+            self.base_url,
+            headers={
+                "Content-Type": "application/json",
+                "X-goog-api-key": current_api_key
+            },
+            json={
+                "contents": [{"parts": [{"text": prompt}]}],
+                "generationConfig": {
+                    "temperature": temperature,
+                    "maxOutputTokens": max_output_tokens
+                }
+            },
+            timeout=remaining_timeout(deadline)
+        ), max_retries=max_retries, deadline=deadline)
+        self._check_auth(response, current_api_key)
+        self._raise_if_rate_limited(response, current_api_key)
+        response.raise_for_status()
+        result = response.json()
+        get_api_key_manager().record_tokens(current_api_key, result.get("usageMetadata", {}).get("totalTokenCount"))
+        parts = result["candidates"][0]["content"]["parts"]
+        return "".join(part.get("text", "") for part in parts).strip()
+    
     def test_connection(self) -> bool:
         """
         Prueba la conexión con Gemini API
@@ -0,0 +1,171 @@
+"""
+Caché del contexto de LEAN BOT en Gemini (API cachedContents).
+
+El contexto del sistema pesa varios KB y es idéntico en cada petición. Con
+GEMINI_CONTEXT_CACHE_ENABLED=1 se registra una vez como contenido cacheado
+(`POST /v1beta/cachedContents`) y las peticiones siguientes lo referencian
+por su nombre (`cachedContent`), así Gemini no vuelve a procesar ni cobrar
+esos tokens de entrada a precio completo.
+
+La caché de Gemini pertenece al proyecto de la API key y tiene un TTL: aquí
+se guarda un registro por (API key, modelo, hash del contexto), se renueva el
+TTL (`PATCH ...?updateMask=ttl`) cuando le queda poco y se vuelve a crear si
+Gemini ya no la encuentra. Si la creación falla (por ejemplo, el contexto no
+alcanza el mínimo de tokens del modelo) se sigue sin caché y se reintenta más
+tarde.
+
+Variables de entorno:
+    GEMINI_CONTEXT_CACHE_ENABLED: "1" para activarla (por defecto desactivada)
+    GEMINI_CONTEXT_CACHE_TTL_SECONDS: TTL pedido a Gemini (por defecto 3600)
+    GEMINI_CONTEXT_CACHE_RENEW_SECONDS: renovar cuando falte menos que esto (por defecto 300)
+    GEMINI_CONTEXT_CACHE_RETRY_SECONDS: espera tras una creación fallida (por defecto 600)
+"""
+
+import os
+import time
+import hashlib
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Tuple
+
+import requests
+
+from .http_client import get_http_session
+
+logger = logging.getLogger(__name__)
+
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "").lower() in ("1", "true", "yes")
+GEMINI_CONTEXT_CACHE_TTL_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL_SECONDS", "3600"))
+GEMINI_CONTEXT_CACHE_RENEW_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RENEW_SECONDS", "300"))
+GEMINI_CONTEXT_CACHE_RETRY_SECONDS = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_SECONDS", "600"))
+
+class GeminiContextCache:
+    """
+    Registro de contenidos cacheados en Gemini, con renovación automática
+    """
+
+    def __init__(self, enabled: bool = GEMINI_CONTEXT_CACHE_ENABLED,
+                 ttl_seconds: int = GEMINI_CONTEXT_CACHE_TTL_SECONDS,
+                 renew_seconds: int = GEMINI_CONTEXT_CACHE_RENEW_SECONDS,
+                 retry_seconds: int = GEMINI_CONTEXT_CACHE_RETRY_SECONDS):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.renew_seconds = renew_seconds
+        self.retry_seconds = retry_seconds
+        # (api_key, modelo, hash del contexto) -> {"name", "expires_at"} o {"retry_at"}
+        self._entries: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stats = Counter()
+
+    @staticmethod
+    def _key(api_key: str, model: str, context: str) -> Tuple[str, str, str]:
+        return (api_key, model, hashlib.sha256(context.encode("utf-8")).hexdigest()[:16])
+
+    def _create(self, api_base: str, api_key: str, model: str, context: str) -> Dict[str, Any]:
+        response = get_http_session().post(
+            f"{api_base}/v1beta/cachedContents",
+            headers={"Content-Type": "application/json", "X-goog-api-key": api_key},
+            json={
+                "model": f"models/{model}",
+                "systemInstruction": {"parts": [{"text": context}]},
+                "ttl": f"{self.ttl_seconds}s",
+            },
+            timeout=30
+        )
+        response.raise_for_status()
+        name = response.json()["name"]
+        self._stats["created"] += 1
+        logger.info(f"🗂️ Contexto de LEAN BOT cacheado en Gemini como {name}")
+        return {"name": name, "expires_at": time.time() + self.ttl_seconds}
+
+    def _renew(self, api_base: str, api_key: str, entry: Dict[str, Any]) -> Dict[str, Any]:
+        response = get_http_session().patch(
+            f"{api_base}/v1beta/{entry['name']}",
+            params={"updateMask": "ttl"},
+            headers={"Content-Type": "application/json", "X-goog-api-key": api_key},
+            json={"ttl": f"{self.ttl_seconds}s"},
+            timeout=15
+        )
+        response.raise_for_status()
+        self._stats["renewed"] += 1
+        return {"name": entry["name"], "expires_at": time.time() + self.ttl_seconds}
+
+    def get_cache_name(self, api_base: str, api_key: str, model: str, context: str) -> Optional[str]:
+        """
+        Nombre del contenido cacheado a referenciar (lo crea o renueva si hace
+        falta), o None para enviar el contexto como systemInstruction
+        """
+        if not self.enabled or not api_key:
+            return None
+        key = self._key(api_key, model, context)
+        now = time.time()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and "retry_at" in entry and now < entry["retry_at"]:
+                return None
+            if entry and "name" in entry and entry["expires_at"] - now > self.renew_seconds:
+                return entry["name"]
+
+            try:
+                if entry and "name" in entry and entry["expires_at"] > now:
+                    try:
+                        entry = self._renew(api_base, api_key, entry)
+                    except requests.exceptions.RequestException as e:
+                        logger.warning(f"No se pudo renovar {entry['name']}, se crea otro: {e}")
+                        entry = self._create(api_base, api_key, model, context)
+                else:
+                    entry = self._create(api_base, api_key, model, context)
+            except (requests.exceptions.RequestException, KeyError, ValueError) as e:
+                self._stats["failures"] += 1
+                logger.warning(f"No se pudo cachear el contexto en Gemini, se envía completo: {e}")
+                self._entries[key] = {"retry_at": now + self.retry_seconds}
+                return None
+
+            self._entries[key] = entry
+            return entry["name"]
+
+    def invalidate(self, api_key: str, model: str, context: str):
+        """Olvida el contenido cacheado (p. ej. si Gemini respondió que ya no existe)"""
+        with self._lock:
+            self._entries.pop(self._key(api_key, model, context), None)
+            self._stats["invalidated"] += 1
+
+    def record_usage(self, usage: Optional[Dict[str, Any]]):
+        """Acumula los tokens servidos desde la caché según usageMetadata"""
+        if usage and usage.get("cachedContentTokenCount"):
+            with self._lock:
+                self._stats["cached_requests"] += 1
+                self._stats["cached_tokens"] += int(usage["cachedContentTokenCount"])
+
+    def get_metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            active = [
+                {"name": entry["name"], "model": key[1], "expires_in_s": round(entry["expires_at"] - now)}
+                for key, entry in self._entries.items() if "name" in entry
+            ]
+            stats = dict(self._stats)
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "renew_seconds": self.renew_seconds,
+            "active": active,
+            **stats,
+        }
+
+# Instancia global del registro
+_gemini_context_cache: Optional[GeminiContextCache] = None
+_gemini_context_cache_lock = threading.Lock()
+
+def get_gemini_context_cache() -> GeminiContextCache:
+    """
+    Obtiene el registro global de contenidos cacheados en Gemini
+    """
+    global _gemini_context_cache
+    if _gemini_context_cache is None:
+        with _gemini_context_cache_lock:
+            if _gemini_context_cache is None:
+                _gemini_context_cache = GeminiContextCache()
+    return _gemini_context_cache
@@ -1,5 +1,6 @@
 import os
 import requests
+from .http_client import GEMINI_API_BASE_URL, get_http_session
 
 def analizar_sentimiento_gemini(texto, api_key=None):
     """
@@ -13,7 +14,7 @@ def analizar_sentimiento_gemini(texto, api_key=None):
         print("Warning: API key de Gemini no configurada, usando sentimiento neutral")
         return "neutro"
     
-    url = f"https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
+    url = f"{GEMINI_API_BASE_URL}/v1beta/models/gemini-1.5-flash-latest:generateContent?key={api_key}"
     
     prompt = (
         "Eres un analizador de sentimientos profesional para LEAN BOT de INGE LEAN. "
@@ -35,7 +36,7 @@ def analizar_sentimiento_gemini(texto, api_key=None):
     }
     
     try:
-        response = requests.post(url, json=data, timeout=30)
+        response = get_http_session().post(url, json=data, timeout=30)
         response.raise_for_status()
         result = response.json()
         
@@ -0,0 +1,169 @@
+"""
+Peticiones con cobertura ("hedged requests") entre proveedores de IA.
+
+Si el proveedor principal no respondió dentro de un retraso basado en su p95
+reciente de latencia, se lanza la misma petición al secundario y se usa la
+primera respuesta válida. La respuesta perdedora se descarta (requests no
+permite abortar una petición en curso, así que la llamada termina en su
+hilo y solo alimenta las estadísticas del router).
+
+Un presupuesto por minuto limita cuántas peticiones de cobertura se lanzan,
+para que el costo quede acotado aunque un proveedor esté lento mucho tiempo.
+
+Variables de entorno:
+    HEDGING_ENABLED: "1" para activarlo (por defecto desactivado)
+    HEDGE_PERCENTILE: percentil de latencia del principal que dispara la cobertura (por defecto 95)
+    HEDGE_DEFAULT_DELAY_MS: retraso sin datos de latencia suficientes (por defecto 3000)
+    HEDGE_MIN_DELAY_MS: retraso mínimo (por defecto 300)
+    HEDGE_MIN_SAMPLES: latencias necesarias para usar el percentil (por defecto 20)
+    HEDGE_MAX_PER_MINUTE: peticiones de cobertura permitidas por minuto (por defecto 20)
+    HEDGE_MAX_WORKERS: hilos para las llamadas concurrentes (por defecto 8)
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from .provider_router import ProviderRouter
+
+logger = logging.getLogger(__name__)
+
+HEDGING_ENABLED = os.getenv("HEDGING_ENABLED", "").lower() in ("1", "true", "yes")
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_DEFAULT_DELAY_MS = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "3000"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("HEDGE_MIN_DELAY_MS", "300"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HEDGE_MAX_PER_MINUTE = int(os.getenv("HEDGE_MAX_PER_MINUTE", "20"))
+HEDGE_MAX_WORKERS = int(os.getenv("HEDGE_MAX_WORKERS", "8"))
+
+# Una llamada devuelve (respuesta, éxito)
+Attempt = Callable[[], Tuple[Optional[str], bool]]
+
+class HedgeBudget:
+    """
+    Ventana deslizante de un minuto con el número máximo de coberturas
+    """
+
+    def __init__(self, max_per_minute: int = HEDGE_MAX_PER_MINUTE):
+        self.max_per_minute = max(0, max_per_minute)
+        self._fired = deque()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> bool:
+        now = time.monotonic()
+        with self._lock:
+            while self._fired and now - self._fired[0] >= 60.0:
+                self._fired.popleft()
+            if len(self._fired) >= self.max_per_minute:
+                return False
+            self._fired.append(now)
+            return True
+
+    def used(self) -> int:
+        now = time.monotonic()
+        with self._lock:
+            return sum(1 for fired in self._fired if now - fired < 60.0)
+
+class RequestHedger:
+    """
+    Ejecuta una llamada principal y, si tarda más que el retraso calculado,
+    una secundaria en paralelo; gana la primera respuesta válida
+    """
+
+    def __init__(self, router: ProviderRouter, enabled: bool = HEDGING_ENABLED,
+                 budget: Optional[HedgeBudget] = None):
+        self.router = router
+        self.enabled = enabled
+        self.budget = budget or HedgeBudget()
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._executor_lock = threading.Lock()
+        self._counters = Counter()
+        self._counters_lock = threading.Lock()
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=max(2, HEDGE_MAX_WORKERS),
+                                                        thread_name_prefix="hedge")
+        return self._executor
+
+    def _count(self, name: str):
+        with self._counters_lock:
+            self._counters[name] += 1
+
+    def hedge_delay_ms(self, provider: str) -> float:
+        """Retraso antes de cubrir: p95 reciente del proveedor (o el valor por defecto)"""
+        health = self.router.health.get(provider)
+        if health is None or len(health.latencies) < HEDGE_MIN_SAMPLES:
+            return max(HEDGE_MIN_DELAY_MS, HEDGE_DEFAULT_DELAY_MS)
+        delay = self.router.latency_percentile(provider, HEDGE_PERCENTILE)
+        return max(HEDGE_MIN_DELAY_MS, delay if delay is not None else HEDGE_DEFAULT_DELAY_MS)
+
+    def run(self, primary: str, primary_call: Attempt,
+            secondary: str, secondary_call: Attempt) -> Tuple[Optional[str], str, bool]:
+        """
+        Returns:
+            Tuple[respuesta, proveedor que respondió, éxito]
+        """
+        executor = self._get_executor()
+        delay_s = self.hedge_delay_ms(primary) / 1000.0
+
+        primary_future = executor.submit(primary_call)
+        done, _ = wait([primary_future], timeout=delay_s)
+
+        if done:
+            response, success = primary_future.result()
+            if success:
+                self._count("primary_fast")
+                return response, primary, True
+            # Falló rápido: no es un caso de latencia, se pasa al secundario sin cobertura
+            self._count("primary_failed_fast")
+            response, success = secondary_call()
+            return response, secondary, success
+
+        if not self.budget.try_acquire():
+            self._count("budget_exhausted")
+            response, success = primary_future.result()
+            if success:
+                return response, primary, True
+            response, success = secondary_call()
+            return response, secondary, success
+
+        self._count("hedged")
+        logger.info(f"⏱️ {primary} tarda más de {delay_s * 1000:.0f} ms, cubriendo con {secondary}")
+        secondary_future = executor.submit(secondary_call)
+        futures = {primary_future: primary, secondary_future: secondary}
+        pending = set(futures)
+        last_response = None
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                response, success = future.result()
+                last_response = response if response is not None else last_response
+                if success:
+                    # El perdedor se descarta; si aún no empezó, se cancela
+                    for loser in pending:
+                        loser.cancel()
+                    self._count(f"won_{'primary' if futures[future] == primary else 'secondary'}")
+                    return response, futures[future], True
+
+        self._count("both_failed")
+        return last_response, secondary, False
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._counters_lock:
+            counters = dict(self._counters)
+        return {
+            "enabled": self.enabled,
+            "percentile": HEDGE_PERCENTILE,
+            "max_per_minute": self.budget.max_per_minute,
+            "used_last_minute": self.budget.used(),
+            "delays_ms": {name: round(self.hedge_delay_ms(name), 1) for name in self.router.health},
+            **counters,
+        }
@@ -0,0 +1,99 @@
+"""
+Cliente HTTP compartido para las llamadas a los proveedores de IA.
+
+Una sola `requests.Session` de larga vida con pool de conexiones y keep-alive:
+las llamadas a Gemini y Mistral reutilizan conexiones TCP/TLS abiertas en
+lugar de pagar un handshake nuevo en cada petición.
+
+Variables de entorno:
+    HTTP_POOL_CONNECTIONS: número de hosts con pool propio (por defecto 10)
+    HTTP_POOL_MAXSIZE: conexiones persistentes por host (por defecto 20)
+    HTTP_POOL_BLOCK: "1" para esperar una conexión libre en lugar de abrir extras
+    GEMINI_API_BASE_URL: URL base de Gemini (p. ej. tools/mock_llm_server.py en local)
+    MISTRAL_API_BASE_URL: URL base de la API compatible con OpenAI de Mistral
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Dict, Iterable, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_CONNECTIONS = int(os.getenv("HTTP_POOL_CONNECTIONS", "10"))
+HTTP_POOL_MAXSIZE = int(os.getenv("HTTP_POOL_MAXSIZE", "20"))
+HTTP_POOL_BLOCK = os.getenv("HTTP_POOL_BLOCK", "").lower() in ("1", "true", "yes")
+
+# URLs base de los proveedores, configurables para apuntar a un servidor de pruebas
+GEMINI_API_BASE_URL = os.getenv("GEMINI_API_BASE_URL", "https://generativelanguage.googleapis.com").rstrip("/")
+MISTRAL_API_BASE_URL = os.getenv("MISTRAL_API_BASE_URL", "https://api.aimlapi.com").rstrip("/")
+
+# Hosts que se pre-calientan al iniciar el servidor
+WARMUP_URLS = [
+    f"{GEMINI_API_BASE_URL}/",
+    f"{MISTRAL_API_BASE_URL}/",
+]
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        pool_block=HTTP_POOL_BLOCK,
+        max_retries=0
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+def get_http_session() -> requests.Session:
+    """
+    Obtiene la sesión HTTP global (se crea la primera vez)
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+def warm_up_connections(urls: Optional[Iterable[str]] = None, timeout: float = 5.0) -> Dict[str, Optional[float]]:
+    """
+    Abre una conexión (TCP + TLS) a cada host para que la primera petición
+    real la encuentre ya establecida en el pool
+
+    Returns:
+        Dict host -> milisegundos del handshake (None si falló)
+    """
+    session = get_http_session()
+    results: Dict[str, Optional[float]] = {}
+
+    for url in urls or WARMUP_URLS:
+        host = urlsplit(url).netloc
+        started = time.perf_counter()
+        try:
+            # Cualquier respuesta (incluso 404) deja la conexión en el pool
+            session.head(url, timeout=timeout, allow_redirects=False)
+            results[host] = (time.perf_counter() - started) * 1000
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"No se pudo pre-calentar la conexión a {host}: {e}")
+            results[host] = None
+
+    return results
+
+def get_pool_config() -> Dict[str, object]:
+    """Configuración actual del pool (para diagnóstico)"""
+    return {
+        "pool_connections": HTTP_POOL_CONNECTIONS,
+        "pool_maxsize": HTTP_POOL_MAXSIZE,
+        "pool_block": HTTP_POOL_BLOCK,
+    }
@@ -0,0 +1,128 @@
+"""
+Perfil de ejecución para la inferencia de sentimientos en CPU.
+
+Define hilos intra-op / inter-op de torch, tamaño de lote y espera máxima del
+micro-batcher. El perfil se carga desde un archivo JSON (generado por
+`python -m src.Backend.tools.autotune_sentiment`) y cada valor puede
+sobrescribirse con variables de entorno.
+"""
+
+import os
+import json
+import logging
+from dataclasses import dataclass, asdict
+from typing import Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PROFILE_PATH = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.realpath(__file__))),
+    "sentiment_profile.json"
+)
+
+# Variable de entorno -> campo del perfil
+ENV_OVERRIDES = {
+    "SENTIMENT_INTRA_OP_THREADS": "intra_op_threads",
+    "SENTIMENT_INTER_OP_THREADS": "inter_op_threads",
+    "SENTIMENT_BATCH_SIZE": "batch_size",
+    "SENTIMENT_MAX_WAIT_MS": "max_wait_ms",
+}
+
+@dataclass
+class InferenceProfile:
+    """Parámetros de ejecución del modelo de sentimientos"""
+    intra_op_threads: int
+    inter_op_threads: int
+    batch_size: int
+    max_wait_ms: float
+    source: str = "default"
+
+def get_profile_path() -> str:
+    """Ruta del archivo de perfil (SENTIMENT_PROFILE_PATH o la ruta por defecto)"""
+    return os.getenv("SENTIMENT_PROFILE_PATH", DEFAULT_PROFILE_PATH)
+
+def default_profile() -> InferenceProfile:
+    """Perfil conservador: todos los núcleos para una sola inferencia a la vez"""
+    return InferenceProfile(
+        intra_op_threads=max(1, os.cpu_count() or 1),
+        inter_op_threads=1,
+        batch_size=32,
+        max_wait_ms=5.0,
+    )
+
+def load_inference_profile(path: Optional[str] = None) -> InferenceProfile:
+    """
+    Carga el perfil: valores por defecto, luego el archivo (si existe) y
+    finalmente las variables de entorno
+    """
+    profile = default_profile()
+    path = path or get_profile_path()
+
+    if os.path.exists(path):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for field in ("intra_op_threads", "inter_op_threads", "batch_size", "max_wait_ms"):
+                if field in data:
+                    setattr(profile, field, data[field])
+            profile.source = path
+        except Exception as e:
+            logger.warning(f"No se pudo leer el perfil de inferencia {path}: {e}")
+
+    overridden = False
+    for env_name, field in ENV_OVERRIDES.items():
+        value = os.getenv(env_name)
+        if value:
+            setattr(profile, field, float(value) if field == "max_wait_ms" else int(value))
+            overridden = True
+    if overridden:
+        profile.source = f"{profile.source}+env"
+
+    profile.intra_op_threads = max(1, int(profile.intra_op_threads))
+    profile.inter_op_threads = max(1, int(profile.inter_op_threads))
+    profile.batch_size = max(1, int(profile.batch_size))
+    profile.max_wait_ms = max(0.0, float(profile.max_wait_ms))
+    return profile
+
+def save_inference_profile(profile: InferenceProfile, path: Optional[str] = None,
+                           extra: Optional[Dict] = None) -> str:
+    """
+    Guarda el perfil en JSON (con métricas opcionales del benchmark)
+
+    Returns:
+        str: Ruta del archivo escrito
+    """
+    path = path or get_profile_path()
+    data = asdict(profile)
+    data.pop("source", None)
+    if extra:
+        data["benchmark"] = extra
+
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+    return path
+
+_torch_threads_configured = False
+
+def apply_torch_threads(torch_module, profile: InferenceProfile):
+    """
+    Configura los hilos de torch una sola vez por proceso.
+
+    torch solo permite fijar los hilos inter-op antes de ejecutar trabajo en
+    paralelo, por lo que se ignora el error si ya se configuraron.
+    """
+    global _torch_threads_configured
+    if _torch_threads_configured or torch_module is None:
+        return
+
+    torch_module.set_num_threads(profile.intra_op_threads)
+    try:
+        torch_module.set_num_interop_threads(profile.inter_op_threads)
+    except RuntimeError as e:
+        logger.warning(f"No se pudieron fijar los hilos inter-op: {e}")
+
+    _torch_threads_configured = True
+    logger.info(
+        f"Torch configurado: intra-op={profile.intra_op_threads}, "
+        f"inter-op={profile.inter_op_threads} (perfil: {profile.source})"
+    )
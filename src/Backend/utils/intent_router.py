@@ -0,0 +1,239 @@
+"""
+Enrutador de intenciones previo a los proveedores de IA.
+
+Antes de llamar al LLM se clasifica el mensaje:
+- Saludos, despedidas y agradecimientos: todas las palabras del mensaje
+  pertenecen al vocabulario de la intención, así que "hola" o "gracias,
+  adiós" se responden al instante; "hola, ¿qué servicios ofrecen?" se
+  evalúa como pregunta. Si el último turno del bot terminó en pregunta
+  ("¿quieres la cotización?"), un "perfecto" es una respuesta y sigue al LLM.
+- Preguntas frecuentes: TF-IDF con la misma normalización y recorte que
+  knowledge_index.tokenize sobre las preguntas curadas de
+  public/data/data.json. Se responde con la respuesta curada si el coseno
+  supera INTENT_FAQ_THRESHOLD o si la pregunta curada cubre todo el
+  mensaje ("donde estan ubicados" dentro de "¿Dónde están ubicados y a qué
+  regiones atienden?").
+- Seguimientos casi sin contenido ("¿y el precio?", "¿por qué?"): siguen al
+  LLM, pero con un tope menor de tokens de salida. Una pregunta directa
+  de una sola palabra de contenido ("cual es el whatsapp") no se recorta.
+
+La clasificación no hace E/S y tarda microsegundos; lo que no se reconoce
+con confianza sigue al LLM como siempre.
+
+Variables de entorno:
+    INTENT_ROUTER_ENABLED: "0" para desactivarlo (por defecto activo)
+    INTENT_FAQ_THRESHOLD: similitud mínima para responder desde las FAQ (por defecto 0.8)
+    INTENT_SHORT_MAX_TERMS: términos de contenido hasta los que un mensaje es corto (por defecto 1)
+    INTENT_SHORT_MAX_OUTPUT_TOKENS: tope de tokens de salida para mensajes cortos (por defecto 120)
+"""
+
+import os
+import re
+import math
+import random
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .response_cache import normalize_message
+from .knowledge_index import load_faq, tokenize
+
+INTENT_ROUTER_ENABLED = os.getenv("INTENT_ROUTER_ENABLED", "1").lower() not in ("0", "false", "no")
+INTENT_FAQ_THRESHOLD = float(os.getenv("INTENT_FAQ_THRESHOLD", "0.8"))
+INTENT_SHORT_MAX_TERMS = int(os.getenv("INTENT_SHORT_MAX_TERMS", "1"))
+INTENT_SHORT_MAX_OUTPUT_TOKENS = int(os.getenv("INTENT_SHORT_MAX_OUTPUT_TOKENS", "120"))
+
+# Palabras que pueden acompañar a cualquier intención conversacional
+_FILLER = {"lean", "bot", "leanbot", "ingelean", "inge", "y", "muy", "pues", "bueno", "oye"}
+
+# (intención, palabras clave: al menos una, vocabulario permitido, respuestas)
+# Mismas respuestas que el respaldo local de chatbot.js
+CONVERSATIONAL_INTENTS = [
+    (
+        "farewell",
+        {"adios", "chao", "bye", "salir", "hasta", "vemos"},
+        {"adios", "chao", "bye", "salir", "hasta", "luego", "pronto", "manana", "nos", "vemos",
+         "gracias", "muchas", "feliz", "dia", "tarde", "noche", "buen", "buena"},
+        [
+            "¡Hasta pronto! Fue un placer ayudarte. Soy LEAN BOT de INGE LEAN, ¡cuídate!",
+            "¡Nos vemos! Espero haberte ayudado. LEAN BOT siempre a tu servicio.",
+            "¡Chao! Que tengas un excelente día. LEAN BOT de INGE LEAN estará aquí cuando me necesites.",
+        ],
+    ),
+    (
+        "thanks",
+        {"gracias", "agradezco", "perfecto", "entendido", "listo", "genial", "excelente"},
+        {"gracias", "muchas", "mil", "te", "lo", "agradezco", "ok", "okay", "vale", "perfecto",
+         "entendido", "listo", "genial", "excelente", "super", "claro"},
+        [
+            "De nada, para eso estoy aquí. Soy LEAN BOT, el asistente de INGE LEAN. ¿Hay algo más en lo que pueda ayudarte?",
+        ],
+    ),
+    (
+        "greeting",
+        {"hola", "buenas", "buenos", "saludos", "hey", "holi"},
+        {"hola", "holi", "buenas", "buenos", "dias", "tardes", "noches", "saludos", "hey",
+         "que", "tal", "como", "estas", "esta", "va", "todo", "bien"},
+        [
+            "¡Hola! Soy LEAN BOT, el asistente virtual de INGE LEAN. ¿Cómo puedo ayudarte?",
+            "¡Hola! Soy LEAN BOT de INGE LEAN. ¿En qué puedo asistirte?",
+            "¡Saludos! Soy LEAN BOT, tu asistente virtual de INGE LEAN. Dime, ¿cómo puedo ayudarte?",
+        ],
+    ),
+]
+
+_GREETING_WORDS = {"hola", "holi", "buenas", "buenos", "dias", "tardes", "noches", "saludos", "hey"}
+
+# Un mensaje corto que empieza así retoma lo anterior ("¿y el precio?")
+_FOLLOW_UP_WORDS = {"y", "pero", "entonces", "o"}
+
+# Términos que deben coincidir para responder una FAQ por cobertura
+FAQ_MIN_COVERED_TERMS = 2
+
+# Pregunta al final de la respuesta, aunque la sigan emojis o espacios
+_ENDS_WITH_QUESTION = re.compile(r"\?[^\w.!?]*$")
+
+def bot_asked_question(conversation_history: Optional[list]) -> bool:
+    """
+    El último turno del bot terminó en pregunta
+    """
+    if not conversation_history or not isinstance(conversation_history[-1], dict):
+        return False
+    return bool(_ENDS_WITH_QUESTION.search((conversation_history[-1].get("response") or "").strip()))
+
+@dataclass
+class IntentResult:
+    """Resultado de la clasificación de un mensaje"""
+    intent: str
+    response: Optional[str] = None
+    confidence: float = 0.0
+    max_output_tokens: Optional[int] = None
+
+    @property
+    def answered(self) -> bool:
+        """El mensaje se responde sin llamar al LLM"""
+        return self.response is not None
+
+class IntentRouter:
+    """
+    Clasificador ligero de intenciones (vocabulario + TF-IDF sobre las FAQ)
+    """
+
+    def __init__(self, faq: Optional[List[Dict[str, str]]] = None, enabled: bool = INTENT_ROUTER_ENABLED,
+                 faq_threshold: float = INTENT_FAQ_THRESHOLD):
+        self.enabled = enabled
+        self.faq_threshold = faq_threshold
+        self.faq = faq if faq is not None else load_faq()
+
+        term_counts = [Counter(tokenize(item["question"])) for item in self.faq]
+        document_freq = Counter(term for counts in term_counts for term in counts)
+        n = len(self.faq)
+        self._idf = {term: math.log((1 + n) / (1 + df)) + 1 for term, df in document_freq.items()}
+        # IDF de un término que no aparece en ninguna pregunta (penaliza el coseno)
+        self._unknown_idf = math.log(1 + n) + 1
+        self._vectors = [self._weigh(counts) for counts in term_counts]
+
+        self._counters = Counter()
+        self._classify_seconds = 0.0
+        self._lock = threading.Lock()
+
+    def _weigh(self, counts: Counter) -> Dict[str, float]:
+        vector = {term: count * self._idf.get(term, self._unknown_idf) for term, count in counts.items()}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values())) or 1.0
+        return {term: weight / norm for term, weight in vector.items()}
+
+    def _match_conversational(self, words: List[str]) -> Optional[IntentResult]:
+        if not words:
+            return None
+        present = set(words)
+        for intent, keywords, vocabulary, replies in CONVERSATIONAL_INTENTS:
+            if present & keywords and present <= (vocabulary | _FILLER):
+                return IntentResult(intent=intent, response=random.choice(replies), confidence=1.0)
+        return None
+
+    def _coverage(self, counts: Counter, vector: Dict[str, float]) -> float:
+        """Fracción del peso IDF del mensaje que aparece en la pregunta curada"""
+        covered = [term for term in counts if term in vector]
+        if len(covered) < FAQ_MIN_COVERED_TERMS:
+            return 0.0
+        total = sum(self._idf.get(term, self._unknown_idf) for term in counts)
+        return sum(self._idf[term] for term in covered) / total
+
+    def _match_faq(self, terms: List[str]) -> Optional[IntentResult]:
+        counts = Counter(terms)
+        if not counts or not self._vectors:
+            return None
+        query = self._weigh(counts)
+        best_index, best_score = -1, 0.0
+        for index, vector in enumerate(self._vectors):
+            cosine = sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+            # Las preguntas curadas a veces juntan dos ("¿Dónde están ubicados y a qué
+            # regiones atienden?"): un mensaje que pregunta solo una parte no llega
+            # al umbral por coseno, pero queda cubierto por completo
+            score = max(cosine, self._coverage(counts, vector))
+            if score > best_score:
+                best_index, best_score = index, score
+        if best_score >= self.faq_threshold:
+            return IntentResult(intent="faq", response=self.faq[best_index]["answer"],
+                                confidence=round(best_score, 3))
+        return None
+
+    def classify(self, message: str, conversation_history: Optional[list] = None) -> IntentResult:
+        """
+        Clasifica el mensaje; si `answered`, `response` es la respuesta final
+        """
+        if not self.enabled:
+            return IntentResult(intent="disabled")
+
+        started = time.perf_counter()
+        words = normalize_message(message).split()
+        # Un saludo al inicio ("hola, ¿qué servicios ofrecen?") no cuenta para las FAQ
+        terms = tokenize(" ".join(word for word in words if word not in _GREETING_WORDS))
+        result = None
+        if not bot_asked_question(conversation_history):
+            result = self._match_conversational(words)
+        result = result or self._match_faq(terms)
+        if result is None:
+            if len(terms) <= INTENT_SHORT_MAX_TERMS and (not terms or words[0] in _FOLLOW_UP_WORDS):
+                result = IntentResult(intent="short", max_output_tokens=INTENT_SHORT_MAX_OUTPUT_TOKENS)
+            else:
+                result = IntentResult(intent="llm")
+
+        with self._lock:
+            self._counters[result.intent] += 1
+            self._classify_seconds += time.perf_counter() - started
+        return result
+
+    def get_metrics(self) -> Dict:
+        with self._lock:
+            counters = dict(self._counters)
+            classify_seconds = self._classify_seconds
+        total = sum(counters.values())
+        answered = sum(count for intent, count in counters.items() if intent not in ("short", "llm", "disabled"))
+        return {
+            "enabled": self.enabled,
+            "faq_entries": len(self.faq),
+            "faq_threshold": self.faq_threshold,
+            "total": total,
+            "answered_without_llm": answered,
+            "hit_rate": round(answered / total, 4) if total else 0.0,
+            "avg_classify_us": round(classify_seconds / total * 1e6, 1) if total else 0.0,
+            "intents": counters,
+        }
+
+# Instancia global del enrutador
+_intent_router: Optional[IntentRouter] = None
+_intent_router_lock = threading.Lock()
+
+def get_intent_router() -> IntentRouter:
+    """
+    Obtiene el enrutador global de intenciones
+    """
+    global _intent_router
+    if _intent_router is None:
+        with _intent_router_lock:
+            if _intent_router is None:
+                _intent_router = IntentRouter()
+    return _intent_router
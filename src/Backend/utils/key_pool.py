@@ -0,0 +1,261 @@
+"""
+Pool de API keys de Gemini con reparto por cuota.
+
+En lugar de usar una sola clave hasta que falle, cada petición toma una de
+las claves válidas por round-robin ponderado ("smooth weighted round-robin",
+como nginx). El peso de cada clave es el margen que le queda de su cuota por
+minuto (peticiones y tokens), así que las claves con más margen reciben más
+tráfico; las que superaron su cuota solo se usan si ninguna tiene margen.
+Una clave que responde 429 queda en enfriamiento (Retry-After o
+KEY_POOL_COOLDOWN_SECONDS) y no se usa hasta que termina; si todas están en
+enfriamiento se responde con ProviderOverloadedError.
+
+El uso por minuto y los enfriamientos se guardan en memoria; con
+KEY_POOL_STATE_PATH se comparten entre workers en un archivo SQLite (solo se
+guarda un hash de cada clave).
+
+Variables de entorno:
+    KEY_POOL_ENABLED: "0" para usar una sola clave como antes (por defecto activo)
+    KEY_POOL_RPM: peticiones por minuto permitidas por clave (por defecto 15)
+    KEY_POOL_TPM: tokens por minuto permitidos por clave (por defecto 1000000)
+    KEY_POOL_COOLDOWN_SECONDS: enfriamiento tras un 429 sin Retry-After (por defecto 60)
+    KEY_POOL_STATE_PATH: archivo SQLite para compartir el estado entre workers (opcional)
+"""
+
+import os
+import time
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from .admission import ProviderOverloadedError
+
+logger = logging.getLogger(__name__)
+
+KEY_POOL_ENABLED = os.getenv("KEY_POOL_ENABLED", "1").lower() not in ("0", "false", "no")
+KEY_POOL_RPM = int(os.getenv("KEY_POOL_RPM", "15"))
+KEY_POOL_TPM = int(os.getenv("KEY_POOL_TPM", "1000000"))
+KEY_POOL_COOLDOWN_SECONDS = float(os.getenv("KEY_POOL_COOLDOWN_SECONDS", "60"))
+KEY_POOL_STATE_PATH = os.getenv("KEY_POOL_STATE_PATH", "")
+
+WINDOW_SECONDS = 60.0
+
+def key_hash(api_key: str) -> str:
+    """Identificador de la clave que no la expone"""
+    return hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+
+class _MemoryUsageStore:
+    """Uso por minuto y enfriamientos de cada clave, dentro del proceso"""
+
+    def __init__(self):
+        self._requests: Dict[str, Deque[float]] = {}
+        self._tokens: Dict[str, Deque[Tuple[float, int]]] = {}
+        self._cooldowns: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def _prune(self, h: str, now: float):
+        requests = self._requests.setdefault(h, deque())
+        while requests and requests[0] <= now - WINDOW_SECONDS:
+            requests.popleft()
+        tokens = self._tokens.setdefault(h, deque())
+        while tokens and tokens[0][0] <= now - WINDOW_SECONDS:
+            tokens.popleft()
+
+    def add_request(self, h: str, now: float):
+        with self._lock:
+            self._prune(h, now)
+            self._requests[h].append(now)
+
+    def add_tokens(self, h: str, tokens: int, now: float):
+        with self._lock:
+            self._prune(h, now)
+            self._tokens[h].append((now, tokens))
+
+    def usage(self, hashes: Sequence[str], now: float) -> Dict[str, Tuple[int, int, float]]:
+        """(peticiones, tokens) del último minuto y fin del enfriamiento de cada clave"""
+        with self._lock:
+            result = {}
+            for h in hashes:
+                self._prune(h, now)
+                result[h] = (
+                    len(self._requests[h]),
+                    sum(tokens for _, tokens in self._tokens[h]),
+                    self._cooldowns.get(h, 0.0),
+                )
+            return result
+
+    def set_cooldown(self, h: str, until: float):
+        with self._lock:
+            self._cooldowns[h] = max(until, self._cooldowns.get(h, 0.0))
+
+class _SqliteUsageStore:
+    """Mismo estado en un archivo SQLite, compartido por todos los workers"""
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("CREATE TABLE IF NOT EXISTS key_usage (key_hash TEXT, ts REAL, requests INTEGER, tokens INTEGER)")
+            conn.execute("CREATE INDEX IF NOT EXISTS key_usage_ts ON key_usage (key_hash, ts)")
+            conn.execute("CREATE TABLE IF NOT EXISTS key_cooldown (key_hash TEXT PRIMARY KEY, until REAL)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    def add_request(self, h: str, now: float):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO key_usage VALUES (?, ?, 1, 0)", (h, now))
+            conn.execute("DELETE FROM key_usage WHERE ts <= ?", (now - WINDOW_SECONDS,))
+
+    def add_tokens(self, h: str, tokens: int, now: float):
+        with self._connect() as conn:
+            conn.execute("INSERT INTO key_usage VALUES (?, ?, 0, ?)", (h, now, tokens))
+
+    def usage(self, hashes: Sequence[str], now: float) -> Dict[str, Tuple[int, int, float]]:
+        result = {h: (0, 0, 0.0) for h in hashes}
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key_hash, SUM(requests), SUM(tokens) "
+                "FROM key_usage WHERE ts > ? GROUP BY key_hash",
+                (now - WINDOW_SECONDS,)
+            ).fetchall()
+            cooldowns = dict(conn.execute("SELECT key_hash, until FROM key_cooldown").fetchall())
+        for h, requests, tokens in rows:
+            if h in result:
+                result[h] = (int(requests or 0), int(tokens or 0), 0.0)
+        for h in result:
+            requests, tokens, _ = result[h]
+            result[h] = (requests, tokens, cooldowns.get(h, 0.0))
+        return result
+
+    def set_cooldown(self, h: str, until: float):
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO key_cooldown VALUES (?, ?) "
+                "ON CONFLICT(key_hash) DO UPDATE SET until = MAX(until, excluded.until)",
+                (h, until)
+            )
+
+class KeyPool:
+    """
+    Reparte las peticiones entre varias API keys según el margen de cuota
+    """
+
+    def __init__(self, rpm: int = KEY_POOL_RPM, tpm: int = KEY_POOL_TPM,
+                 cooldown_seconds: float = KEY_POOL_COOLDOWN_SECONDS,
+                 state_path: str = KEY_POOL_STATE_PATH):
+        self.rpm = max(1, rpm)
+        self.tpm = max(1, tpm)
+        self.cooldown_seconds = cooldown_seconds
+        self.store = _MemoryUsageStore()
+        if state_path:
+            try:
+                self.store = _SqliteUsageStore(state_path)
+            except sqlite3.Error as e:
+                logger.warning(f"⚠️ No se pudo abrir {state_path} para el pool de claves, se usa memoria: {e}")
+        # Peso acumulado de cada clave (round-robin ponderado suave), por proceso
+        self._current: Dict[str, float] = {}
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def _headroom(self, requests: int, tokens: int) -> float:
+        return min(1.0 - requests / self.rpm, 1.0 - tokens / self.tpm)
+
+    def acquire(self, keys: Sequence[str]) -> str:
+        """
+        Elige la clave con la que enviar la siguiente petición y la anota
+
+        Raises:
+            ProviderOverloadedError: Si todas las claves están en enfriamiento
+        """
+        if not keys:
+            raise ValueError("No hay API keys en el pool")
+        now = time.time()
+        hashes = {key: key_hash(key) for key in keys}
+        usage = self.store.usage(list(hashes.values()), now)
+
+        weights: Dict[str, float] = {}
+        over_quota: Dict[str, float] = {}
+        waits: List[float] = []
+        for key, h in hashes.items():
+            requests, tokens, cooldown_until = usage[h]
+            if cooldown_until > now:
+                waits.append(cooldown_until - now)
+                continue
+            headroom = self._headroom(requests, tokens)
+            if headroom > 0:
+                weights[key] = headroom
+            else:
+                over_quota[key] = 1.0
+
+        if not weights:
+            if not over_quota:
+                with self._lock:
+                    self._counters["exhausted"] += 1
+                raise ProviderOverloadedError(
+                    f"Las {len(keys)} API keys de Gemini están en enfriamiento por 429",
+                    retry_after=min(waits)
+                )
+            # Las cuotas configuradas son estimaciones: si todas se superaron
+            # se reparte por igual y el 429 del proveedor decide
+            weights = over_quota
+            with self._lock:
+                self._counters["over_quota"] += 1
+
+        with self._lock:
+            total = sum(weights.values())
+            for key, weight in weights.items():
+                self._current[key] = self._current.get(key, 0.0) + weight
+            chosen = max(weights, key=lambda key: self._current[key])
+            self._current[chosen] -= total
+            self._counters["acquired"] += 1
+
+        self.store.add_request(hashes[chosen], now)
+        return chosen
+
+    def record_tokens(self, api_key: str, tokens: Optional[int]):
+        """Suma los tokens consumidos por una petición (usageMetadata.totalTokenCount)"""
+        if api_key and tokens:
+            self.store.add_tokens(key_hash(api_key), int(tokens), time.time())
+
+    def report_rate_limited(self, api_key: str, retry_after: Optional[float] = None):
+        """La clave respondió 429: no se usa hasta que termine el enfriamiento"""
+        seconds = retry_after if retry_after else self.cooldown_seconds
+        self.store.set_cooldown(key_hash(api_key), time.time() + seconds)
+        with self._lock:
+            self._counters["rate_limited"] += 1
+        logger.info(f"🧊 API key {api_key[:10]}... en enfriamiento {seconds:.0f} s tras un 429")
+
+    def get_metrics(self, keys: Sequence[str]) -> Dict[str, Any]:
+        now = time.time()
+        hashes = [key_hash(key) for key in keys]
+        usage = self.store.usage(hashes, now)
+        with self._lock:
+            counters = dict(self._counters)
+        return {
+            "rpm_per_key": self.rpm,
+            "tpm_per_key": self.tpm,
+            "shared_state": isinstance(self.store, _SqliteUsageStore),
+            "keys": [
+                {
+                    "key": h,
+                    "requests_last_minute": usage[h][0],
+                    "tokens_last_minute": usage[h][1],
+                    "cooldown_s": max(0, round(usage[h][2] - now)),
+                }
+                for h in hashes
+            ],
+            **counters,
+        }
@@ -0,0 +1,230 @@
+"""
+Índice local de conocimiento de INGE LEAN (BM25).
+
+Fragmenta los archivos de src/Backend/knowledge/*.md (por sección y viñeta)
+y las preguntas frecuentes de public/data/data.json, y los indexa con BM25.
+Para cada mensaje solo los KNOWLEDGE_TOP_K fragmentos más relevantes entran
+al prompt, así que el tamaño del prompt no crece con la base de conocimiento.
+
+Variables de entorno:
+    KNOWLEDGE_TOP_K: fragmentos por mensaje (por defecto 4)
+    KNOWLEDGE_MIN_SCORE: puntaje BM25 mínimo para incluir un fragmento (por defecto 1.0)
+    KNOWLEDGE_FAQ_PATH: ruta del JSON de preguntas frecuentes (por defecto public/data/data.json)
+"""
+
+import os
+import re
+import json
+import math
+import hashlib
+import logging
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .lean_context import load_knowledge_documents
+from .response_cache import normalize_message
+
+logger = logging.getLogger(__name__)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+
+KNOWLEDGE_TOP_K = int(os.getenv("KNOWLEDGE_TOP_K", "4"))
+KNOWLEDGE_MIN_SCORE = float(os.getenv("KNOWLEDGE_MIN_SCORE", "1.0"))
+KNOWLEDGE_FAQ_PATH = os.getenv("KNOWLEDGE_FAQ_PATH", os.path.join(REPO_ROOT, "public", "data", "data.json"))
+
+# Parámetros estándar de BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+# Secciones más largas que esto se parten por viñeta
+CHUNK_MAX_CHARS = 400
+
+STOPWORDS = frozenset("""
+a al algo como con cual cuales de del el ella ellos en es esta este esto estos
+ha han hay la las le les lo los mas me mi mis muy no nos o para pero por que
+se si sin sobre son su sus te tu tus un una unas uno unos y ya yo
+""".split())
+
+_LEADING_NUMBER = re.compile(r"^\s*\d+[.)]\s*")
+
+@dataclass
+class KnowledgeChunk:
+    """Fragmento indexado"""
+    source: str
+    text: str
+
+def tokenize(text: str) -> List[str]:
+    """
+    Tokens normalizados (sin tildes, minúsculas), sin palabras vacías y con
+    un recorte simple de plurales ("servicios" -> "servicio", "ofrecen" -> "ofrece")
+    """
+    tokens = []
+    for token in normalize_message(text).split():
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        if len(token) > 4 and token.endswith("es") and token[-3] not in "aeiou":
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s"):
+            token = token[:-1]
+        elif len(token) > 5 and token.endswith(("an", "en")):
+            token = token[:-1]
+        tokens.append(token)
+    return tokens
+
+def load_faq(path: str = KNOWLEDGE_FAQ_PATH) -> List[Dict[str, str]]:
+    """
+    Preguntas frecuentes curadas de data.json, sin la numeración ("1. ¿Qué...")
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    return [
+        {"question": _LEADING_NUMBER.sub("", item["question"]).strip(), "answer": item["answer"].strip()}
+        for item in data.get("faq", [])
+        if item.get("question") and item.get("answer")
+    ]
+
+def chunk_markdown(source: str, text: str, max_chars: int = CHUNK_MAX_CHARS) -> List[KnowledgeChunk]:
+    """
+    Un fragmento por sección; las secciones largas se parten por viñeta o
+    párrafo, prefijando cada parte con el título para que conserve el contexto
+    """
+    chunks = []
+    for section in re.split(r"\n(?=#)", text):
+        section = section.strip()
+        if not section:
+            continue
+        heading = ""
+        if section.startswith("#"):
+            first_line, _, section = section.partition("\n")
+            heading = first_line.lstrip("#").strip()
+            section = section.strip()
+        if not section:
+            continue
+        parts = [section] if len(section) <= max_chars else re.split(r"\n\s*\n|\n(?=- )", section)
+        for part in parts:
+            part = part.strip()
+            if part:
+                chunks.append(KnowledgeChunk(source=source, text=f"{heading}: {part}" if heading else part))
+    return chunks
+
+class KnowledgeIndex:
+    """
+    Índice BM25 en memoria sobre los fragmentos de conocimiento
+    """
+
+    def __init__(self, chunks: List[KnowledgeChunk]):
+        self.chunks = chunks
+        self._term_freqs = [Counter(tokenize(chunk.text)) for chunk in chunks]
+        self._lengths = [sum(tf.values()) for tf in self._term_freqs]
+        self._avg_length = (sum(self._lengths) / len(self._lengths)) if self._lengths else 0.0
+        document_freq = Counter(term for tf in self._term_freqs for term in tf)
+        n = len(chunks)
+        self._idf = {
+            term: math.log(1 + (n - df + 0.5) / (df + 0.5))
+            for term, df in document_freq.items()
+        }
+        # Índice invertido término -> fragmentos que lo contienen
+        self._postings: Dict[str, List[int]] = {}
+        for i, tf in enumerate(self._term_freqs):
+            for term in tf:
+                self._postings.setdefault(term, []).append(i)
+        self.fingerprint = hashlib.sha256(
+            "\x1f".join(chunk.text for chunk in chunks).encode("utf-8")
+        ).hexdigest()[:16]
+
+    @classmethod
+    def build(cls) -> "KnowledgeIndex":
+        """Construye el índice con los .md de conocimiento y las FAQ de data.json"""
+        chunks = []
+        for source, text in load_knowledge_documents():
+            chunks.extend(chunk_markdown(source, text))
+        for item in load_faq():
+            chunks.append(KnowledgeChunk(
+                source="data.json",
+                text=f"Pregunta frecuente: {item['question']} Respuesta: {item['answer']}"
+            ))
+        index = cls(chunks)
+        logger.info(f"📚 Índice de conocimiento: {len(chunks)} fragmentos")
+        return index
+
+    def search(self, query: str, top_k: int = KNOWLEDGE_TOP_K,
+               min_score: float = KNOWLEDGE_MIN_SCORE) -> List[Dict]:
+        """
+        Fragmentos más relevantes para la consulta
+
+        Returns:
+            Lista de {source, text, score} ordenada por puntaje
+        """
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            idf = self._idf.get(term)
+            if idf is None:
+                continue
+            for i in self._postings[term]:
+                tf = self._term_freqs[i][term]
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self._lengths[i] / (self._avg_length or 1.0))
+                scores[i] = scores.get(i, 0.0) + idf * tf * (BM25_K1 + 1) / (tf + norm)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [
+            {"source": self.chunks[i].source, "text": self.chunks[i].text, "score": round(score, 3)}
+            for i, score in ranked if score >= min_score
+        ]
+
+    def get_stats(self) -> Dict:
+        return {
+            "chunks": len(self.chunks),
+            "sources": dict(Counter(chunk.source for chunk in self.chunks)),
+            "vocabulary": len(self._idf),
+            "fingerprint": self.fingerprint,
+            "top_k": KNOWLEDGE_TOP_K,
+            "min_score": KNOWLEDGE_MIN_SCORE,
+        }
+
+# Instancia global del índice
+_knowledge_index: Optional[KnowledgeIndex] = None
+_knowledge_index_lock = threading.Lock()
+
+def get_knowledge_index() -> KnowledgeIndex:
+    """
+    Obtiene el índice global de conocimiento (se construye la primera vez)
+    """
+    global _knowledge_index
+    if _knowledge_index is None:
+        with _knowledge_index_lock:
+            if _knowledge_index is None:
+                _knowledge_index = KnowledgeIndex.build()
+    return _knowledge_index
+
+def reload_knowledge_index() -> KnowledgeIndex:
+    """
+    Reconstruye el índice (tras agregar o editar archivos de conocimiento)
+    """
+    global _knowledge_index
+    index = KnowledgeIndex.build()
+    with _knowledge_index_lock:
+        _knowledge_index = index
+    return index
+
+def retrieve_knowledge(user_message: str, conversation_history: Optional[list] = None) -> Optional[str]:
+    """
+    Bloque de texto con los fragmentos relevantes para el mensaje, o None
+
+    Incluye el mensaje anterior del usuario en la consulta para que las
+    preguntas de seguimiento ("¿y cuánto tarda?") encuentren su tema.
+    """
+    query = user_message
+    if conversation_history:
+        previous = conversation_history[-1]
+        if isinstance(previous, dict) and previous.get("message"):
+            query = f"{user_message} {previous['message']}"
+
+    results = get_knowledge_index().search(query)
+    if not results:
+        return None
+    lines = "\n".join(f"- {result['text']}" for result in results)
+    return f"Información de INGE LEAN relevante para este mensaje:\n{lines}"
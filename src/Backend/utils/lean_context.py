@@ -0,0 +1,66 @@
+"""
+Contexto del sistema de LEAN BOT.
+
+Se divide en dos partes:
+- PERSONA_PROMPT: identidad, límites, tono y ejemplo. Es estático y va en
+  cada petición (y es lo que se cachea del lado del proveedor).
+- Conocimiento de la empresa: archivos Markdown en src/Backend/knowledge/.
+  Con la recuperación activa (KNOWLEDGE_RETRIEVAL_ENABLED, ver
+  knowledge_index.py) solo los fragmentos relevantes a cada mensaje entran al
+  prompt; sin ella se concatena todo, como antes.
+
+Para agregar conocimiento basta con crear otro archivo .md en esa carpeta.
+"""
+
+import os
+from typing import List, Tuple
+
+KNOWLEDGE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.realpath(__file__))), "knowledge")
+
+KNOWLEDGE_RETRIEVAL_ENABLED = os.getenv("KNOWLEDGE_RETRIEVAL_ENABLED", "1").lower() not in ("0", "false", "no")
+
+PERSONA_PROMPT = """
+Eres **LEAN BOT**, el asistente conversacional oficial de **INGE LEAN S.A.S**, una empresa tecnológica colombiana con sede en Pereira (Risaralda, Colombia). Tu propósito es representar la identidad de la marca y comunicar claramente quiénes son, qué hacen, cómo trabajan, y qué limitaciones tienen. Usa un tono profesional, cercano, centrado en la innovación, la eficiencia y el sello "Hecho en Colombia".
+
+### Limitaciones y ámbito de actuación
+- No eres un asistente general de IA; tus respuestas se limitan a información sobre INGE LEAN, sus productos y servicios, su filosofía y preguntas frecuentes relacionadas.
+- No tienes acceso a sistemas internos ni información financiera detallada más allá de lo público.
+- No realizas ventas ni trámites legales; puedes sugerir contacto al área comercial para cotizaciones o soporte técnico (correo: comercial@ingelean.com, WhatsApp: +57 311 419 6803)
+- Usa la información de INGE LEAN que se te entrega junto a cada mensaje; si no alcanza para responder, dilo y sugiere el contacto comercial en lugar de inventar.
+
+### Tono y estilo de interacción
+- Elegante, técnico pero amigable. Evita jerga innecesaria, pero no sacrifiques claridad o humanidad en la respuesta.
+- Muestras orgullo por "ingeniería colombiana", enfatizas la personalización, eficiencia y enfoque en resultados.
+
+### Ejemplo de inicio de conversación
+Usuario: "¿Qué hace INGE LEAN?"
+LEAN BOT: "Somos INGE LEAN S.A.S, una empresa colombiana con sede en Pereira especializada en ingeniería a medida: desarrollamos hardware y software industrial, automatización e inteligencia artificial aplicada a procesos productivos. Desde 2013 hemos sido el aliado de PYMEs e industrias que buscan digitalizar sus operaciones con talento 100 % colombiano..."
+
+Responde exclusivamente como LEAN BOT de acuerdo a esta información.
+"""
+
+def load_knowledge_documents(knowledge_dir: str = KNOWLEDGE_DIR) -> List[Tuple[str, str]]:
+    """
+    Lee los archivos .md de conocimiento, en orden alfabético
+
+    Returns:
+        Lista de (nombre de archivo, contenido)
+    """
+    if not os.path.isdir(knowledge_dir):
+        return []
+    documents = []
+    for name in sorted(os.listdir(knowledge_dir)):
+        if name.endswith(".md"):
+            with open(os.path.join(knowledge_dir, name), "r", encoding="utf-8") as f:
+                documents.append((name, f.read().strip()))
+    return documents
+
+def get_system_context() -> str:
+    """
+    Contexto del sistema para los proveedores: solo la persona si la
+    recuperación está activa, o la persona con todo el conocimiento
+    """
+    if KNOWLEDGE_RETRIEVAL_ENABLED:
+        return PERSONA_PROMPT
+    knowledge = "\n\n".join(text for _, text in load_knowledge_documents())
+    return f"{PERSONA_PROMPT}\n{knowledge}\n"
@@ -0,0 +1,116 @@
+"""
+Motor de coincidencia de léxicos para los análisis de sentimiento de respaldo.
+
+Compila una vez todas las listas de palabras en una sola expresión regular
+(un trie de prefijos, con límites de palabra e insensible a mayúsculas y
+tildes), de modo que cada mensaje se recorre en una sola pasada en lugar de un
+`in` por palabra, que además encontraba "no" dentro de "bueno".
+
+Las palabras con tilde diacrítica (DIACRITIC_WORDS) son la excepción: sin
+tilde son otra palabra, así que solo coinciden escritas con ella.
+"""
+
+import re
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable
+
+# Cada vocal del léxico normalizado acepta sus variantes acentuadas
+_ACCENT_CLASSES = {
+    "a": "[aáàâä]",
+    "e": "[eéèêë]",
+    "i": "[iíìîï]",
+    "o": "[oóòôö]",
+    "u": "[uúùûü]",
+    " ": r"\s+",
+}
+
+# Monosílabos (y "aún") cuya tilde distingue otra palabra: el "si"
+# condicional no es el "sí" afirmativo. Se comparan con su tilde
+DIACRITIC_WORDS = frozenset({"sí", "más", "tú", "él", "sé", "té", "dé", "mí", "aún"})
+
+# Máximo de formas superficiales memorizadas ("Pésimo", "PESIMO", ...)
+_SURFACE_CACHE_SIZE = 4096
+
+def normalize_text(text: str) -> str:
+    """
+    Normaliza un texto para la coincidencia: minúsculas, sin tildes ni
+    diéresis y con los espacios colapsados
+    """
+    if not text:
+        return ""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    without_accents = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return " ".join(without_accents.split())
+
+def _lexicon_term(word: str) -> str:
+    """Forma del término en el léxico: normalizada, salvo las de tilde diacrítica"""
+    lowered = " ".join(unicodedata.normalize("NFC", word.lower()).split())
+    return lowered if lowered in DIACRITIC_WORDS else normalize_text(word)
+
+def _trie_pattern(terms: Iterable[str]) -> str:
+    """
+    Construye una expresión regular factorizada por prefijos, de modo que en
+    cada posición del texto solo se explora una rama por carácter
+    """
+    trie: Dict = {}
+    for term in terms:
+        node = trie
+        for ch in term:
+            node = node.setdefault(ch, {})
+        node[""] = True
+
+    def build(node: Dict) -> str:
+        alternatives = [
+            _ACCENT_CLASSES.get(ch, re.escape(ch)) + build(child)
+            for ch, child in sorted(node.items()) if ch != ""
+        ]
+        if not alternatives:
+            return ""
+        body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+        # Un término que termina aquí hace opcional el resto de la rama
+        return f"(?:{body})?" if "" in node else body
+
+    return build(trie)
+
+class LexiconMatcher:
+    """
+    Cuenta coincidencias por categoría (p. ej. "POS"/"NEG") en una sola pasada
+    """
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]]):
+        self._categories: Dict[str, str] = {}
+        for category, words in lexicons.items():
+            for word in words:
+                term = _lexicon_term(word)
+                if term:
+                    self._categories.setdefault(term, category)
+
+        self._surface_cache: Dict[str, str] = {}
+        self._pattern = None
+        if self._categories:
+            # La coincidencia es voraz: "no me gusta" gana sobre "no"
+            self._pattern = re.compile(
+                rf"(?<!\w){_trie_pattern(self._categories)}(?!\w)",
+                re.IGNORECASE
+            )
+
+    def count(self, text: str) -> Dict[str, int]:
+        """
+        Devuelve el número de coincidencias por categoría
+        """
+        counts: Counter = Counter()
+        if self._pattern is None or not text:
+            return counts
+
+        for match in self._pattern.finditer(text):
+            counts[self._category_of(match.group(0))] += 1
+        return counts
+
+    def _category_of(self, surface: str) -> str:
+        category = self._surface_cache.get(surface)
+        if category is None:
+            category = self._categories.get(_lexicon_term(surface)) or self._categories[normalize_text(surface)]
+            if len(self._surface_cache) < _SURFACE_CACHE_SIZE:
+                self._surface_cache[surface] = category
+        return category
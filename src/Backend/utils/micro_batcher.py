@@ -0,0 +1,85 @@
+"""
+Micro-batcher para agrupar peticiones concurrentes de inferencia.
+
+Las peticiones que llegan desde el threadpool de uvicorn se encolan y un único
+hilo trabajador las procesa en lotes de hasta `max_batch_size`, esperando como
+máximo `max_wait_ms` a que se complete el lote. Así varias inferencias
+concurrentes comparten un forward pass en lugar de competir por los núcleos.
+
+Solo se espera si ya hay otras peticiones en cola: un mensaje que llega
+solo se procesa de inmediato, sin sumar latencia.
+"""
+
+import queue
+import threading
+import time
+import logging
+from concurrent.futures import Future
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+class MicroBatcher:
+    """
+    Agrupa elementos enviados desde varios hilos y los procesa en lote
+    """
+
+    def __init__(self, process_batch: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int, max_wait_ms: float, name: str = "micro-batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.name = name
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+
+    def submit(self, item: Any) -> Future:
+        """
+        Encola un elemento y devuelve un Future con su resultado
+        """
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def process(self, item: Any, timeout: float = None) -> Any:
+        """
+        Encola un elemento y espera su resultado
+        """
+        return self.submit(item).result(timeout=timeout)
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+
+            # Una petición sola no espera: solo se arma lote si ya hay otras en cola
+            waiting = not self._queue.empty()
+            while waiting and len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            items = [item for item, _ in batch]
+            try:
+                results = self.process_batch(items)
+                for (_, future), result in zip(batch, results):
+                    future.set_result(result)
+            except Exception as e:
+                logger.error(f"Error procesando lote en {self.name}: {e}")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
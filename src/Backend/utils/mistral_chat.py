@@ -1,125 +1,132 @@
 import requests
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Iterator, Optional
+from .http_client import MISTRAL_API_BASE_URL, get_http_session
+from .admission import remaining_timeout, request_deadline, send_with_backoff
+from .context_builder import ConversationSummary, build_context
+from .lean_context import KNOWLEDGE_RETRIEVAL_ENABLED, get_system_context
+from .knowledge_index import retrieve_knowledge
+from .structured_reply import STRUCTURED_EXTRA_OUTPUT_TOKENS, STRUCTURED_INSTRUCTION
 
 class MistralChatService:
     def __init__(self, api_key: str = None):
         # Usar API key proporcionada o la por defecto
         self.api_key = api_key or os.getenv("MISTRAL_API_KEY", "bfab35a9873a475085aa3176ef879f26")
         self.model = "mistralai/mistral-tiny"
-        self.base_url = "https://api.aimlapi.com/v1/chat/completions"
+        # URL base configurable (p. ej. un servidor local de pruebas)
+        self.api_base = MISTRAL_API_BASE_URL
+        self.base_url = f"{self.api_base}/v1/chat/completions"
         
         # Contexto base de LEAN BOT (mismo que Gemini)
-        self.lean_context = """
-        Eres **LEAN BOT**, el asistente conversacional oficial de **INGE LEAN S.A.S**, una empresa tecnológica colombiana con sede en Pereira (Risaralda, Colombia). Tu propósito es representar la identidad de la marca y comunicar claramente quiénes son, qué hacen, cómo trabajan, y qué limitaciones tienen. Usa un tono profesional, cercano, centrado en la innovación, la eficiencia y el sello "Hecho en Colombia".
-
-### 1. Información corporativa básica
-- **Nombre legal**: INGE LEAN S.A.S (Sociedad por Acciones Simplificada), NIT 9006141198
-- **Fundación**: Desde 2013 en Pereira, Risaralda, Colombia
-- **Ubicación física**: Calle 29 No. 10‑23, barrio La Victoria, Pereira, Risaralda, Colombia
-- **Tamaño estimado**: Entre 11 y 50 empleados
-
-### 2. Misión y enfoque
-- Aliado estratégico de empresas que buscan optimizar sus procesos industriales y comerciales mediante tecnología de vanguardia: automatización industrial, inteligencia artificial, ingeniería de software y hardware a la medida y mantenimiento predictivo
-- Compromiso con soluciones 100 % diseñadas, desarrolladas y fabricadas con talento colombiano ("Hecho en Colombia") para promover innovación local
-
-### 3. Productos, servicios y capacidades
-- **Hardware industrial personalizado**: diseño y fabricación de tarjetas electrónicas, PCB, controladores PLC hechos a medida para retos específicos de cada planta industrial
-- **Software a la medida**: sistemas industriales, automatización, telemetría, análisis y dashboards para toma de decisiones basada en datos
-- **Automatización e Industria 4.0**: integración de IoT, IA, RPA y mejoras continuas para eficiencia operativa
-- **Mantenimiento industrial y soporte**: incluyendo seguimiento, calibración y atención técnica especializada
-
-### 4. Audiencia objetivo y posicionamiento
-- Empresas industriales y PYMEs en sectores de manufactura, producción, logística, contabilidad operativa, que buscan digitalizar y optimizar sus procesos sin necesidad de grandes inversiones iniciales
-- Posicionamiento como el socio ideal para implementar transformación digital accesible, escalable y con retorno tangible.
-
-### 5. Comunicación de marca y mensajes frecuentes
-- Mensajes centrales: "Innovación práctica", "Tecnología con propósito", "Digitalización con enfoque estratégico"
-- Frecuentes publicaciones sobre transformación digital, cultura de datos, automatización accesible para PYMEs, desarrollo local de hardware
-
-### 6. Limitaciones y ámbito de actuación
-- No eres un asistente general de IA; tus respuestas se limitan a información sobre INGE LEAN, sus productos y servicios, su filosofía y preguntas frecuentes relacionadas.
-- No tienes acceso a sistemas internos ni información financiera detallada más allá de lo público.
-- No realizas ventas ni trámites legales; puedes sugerir contacto al área comercial para cotizaciones o soporte técnico (correo: comercial@ingelean.com, WhatsApp: +57 311 419 6803)
-
-### 7. Tono y estilo de interacción
-- Elegante, técnico pero amigable. Evita jerga innecesaria, pero no sacrifiques claridad o humanidad en la respuesta.
-- Muestras orgullo por "ingeniería colombiana", enfatizas la personalización, eficiencia y enfoque en resultados.
-
-### 8. Preguntas frecuentes que puedes responder
-- ¿Qué servicios ofrecen?
-- ¿Cómo funciona su desarrollo de hardware a medida?
-- ¿Qué es Ingelean Plus y qué incluye su plataforma?
-- ¿Cómo implementan Industry 4.0 en PYMEs?
-- ¿Qué ejemplos de proyectos han desarrollado en Colombia? (sin información privada)
-
-### Ejemplo de inicio de conversación
-Usuario: "¿Qué hace INGE LEAN?"
-LEAN BOT: "Somos INGE LEAN S.A.S, una empresa colombiana con sede en Pereira especializada en ingeniería a medida: desarrollamos hardware y software industrial, automatización e inteligencia artificial aplicada a procesos productivos. Desde 2013 hemos sido el aliado de PYMEs e industrias que buscan digitalizar sus operaciones con talento 100 % colombiano..."
-
-Responde exclusivamente como LEAN BOT de acuerdo a esta información.
+        self.lean_context = get_system_context()
+        
+        # Mensaje de sistema construido una sola vez y reutilizado: el prefijo
+        # de cada petición es idéntico byte a byte, lo que permite al proveedor
+        # reutilizar el procesamiento del prefijo entre peticiones
+        self.system_message = {
+            "role": "system",
+            "content": self.lean_context
+        }
+    
+    def _build_messages(self, user_message: str, conversation_history: list = None,
+                        summary: Optional[ConversationSummary] = None) -> list:
         """
+        Construye los mensajes para el formato de chat de Mistral
+        """
+        messages = [self.system_message]
+        
+        # Historial dentro del presupuesto de tokens (y resumen de lo anterior)
+        context = build_context(conversation_history, summary)
+        if context.summary:
+            messages.append({
+                "role": "system",
+                "content": f"Resumen de la conversación hasta ahora: {context.summary}"
+            })
+        
+        # Conocimiento de INGE LEAN relevante para este mensaje (tras el
+        # prefijo fijo, para no romper su reutilización)
+        if KNOWLEDGE_RETRIEVAL_ENABLED:
+            knowledge = retrieve_knowledge(user_message, conversation_history)
+            if knowledge:
+                messages.append({"role": "system", "content": knowledge})
+        for msg in context.turns:
+            if msg.get("message"):
+                messages.append({
+                    "role": "user",
+                    "content": msg["message"]
+                })
+            if msg.get("response"):
+                messages.append({
+                    "role": "assistant",
+                    "content": msg["response"]
+                })
+        
+        # Agregar el mensaje actual del usuario
+        messages.append({
+            "role": "user",
+            "content": user_message
+        })
+        return messages
     
-    def generate_response(self, user_message: str, conversation_history: list = None) -> str:
+    def _build_request(self, user_message: str, conversation_history: list = None,
+                       summary: Optional[ConversationSummary] = None, stream: bool = False,
+                       max_output_tokens: Optional[int] = None, structured: bool = False) -> Dict[str, Any]:
+        """
+        Prepara la petición a Mistral AI (en JSON mode con `structured`)
+        """
+        messages = self._build_messages(user_message, conversation_history, summary)
+        request = {
+            "model": self.model,
+            "messages": messages,
+            "max_tokens": max_output_tokens or 300,
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "stream": stream
+        }
+        if structured:
+            # JSON mode exige describir el formato en los mensajes
+            messages.insert(len(messages) - 1, {"role": "system", "content": STRUCTURED_INSTRUCTION})
+            request["max_tokens"] += STRUCTURED_EXTRA_OUTPUT_TOKENS
+            request["response_format"] = {"type": "json_object"}
+        return request
+    
+    def acquire_api_key(self) -> Optional[str]:
+        """
+        API key para una petición (misma interfaz que GeminiChatService)
+        """
+        return self.api_key
+    
+    def generate_response(self, user_message: str, conversation_history: list = None,
+                          summary: Optional[ConversationSummary] = None,
+                          max_output_tokens: Optional[int] = None, structured: bool = False,
+                          api_key: Optional[str] = None) -> str:
         """
         Genera una respuesta usando Mistral AI API con el contexto de LEAN BOT
+        
+        Con `structured` devuelve un JSON (reply, score, sentiment); ver
+        structured_reply.parse_structured_reply
         """
         try:
             # Verificar API key
-            current_api_key = self.api_key
+            current_api_key = api_key or self.api_key
             if not current_api_key:
                 return "Lo siento, no tengo configurada la conexión con el servicio de chat. Por favor, configura la API key."
             
-            # Construir mensajes para el formato de chat de Mistral
-            messages = [
-                {
-                    "role": "system",
-                    "content": self.lean_context
-                }
-            ]
-            
-            # Agregar historial de conversación si existe
-            if conversation_history:
-                for msg in conversation_history[-5:]:  # Últimos 5 mensajes para contexto
-                    if isinstance(msg, dict):
-                        if msg.get("message"):
-                            messages.append({
-                                "role": "user",
-                                "content": msg["message"]
-                            })
-                        if msg.get("response"):
-                            messages.append({
-                                "role": "assistant",
-                                "content": msg["response"]
-                            })
-            
-            # Agregar el mensaje actual del usuario
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
+            data = self._build_request(user_message, conversation_history, summary,
+                                       max_output_tokens=max_output_tokens, structured=structured)
             
-            # Preparar la petición a Mistral AI
-            data = {
-                "model": self.model,
-                "messages": messages,
-                "max_tokens": 300,
-                "temperature": 0.7,
-                "top_p": 0.95,
-                "stream": False
-            }
-            
-            # Hacer la petición a Mistral AI API
-            response = requests.post(
+            # Hacer la petición a Mistral AI API (reintentos dentro del plazo)
+            deadline = request_deadline()
+            response = send_with_backoff(lambda: get_http_session().post(
                 self.base_url,
                 headers={
                     "Authorization": f"Bearer {current_api_key}",
                     "Content-Type": "application/json"
                 },
                 json=data,
-                timeout=30
-            )
+                timeout=remaining_timeout(deadline)
+            ), deadline=deadline)
             
             response.raise_for_status()
             result = response.json()
@@ -144,6 +151,87 @@ Responde exclusivamente como LEAN BOT de acuerdo a esta información.
             print(f"Error inesperado en Mistral Chat Service: {e}")
             return "Lo siento, algo salió mal. ¿Podrías intentarlo de nuevo?"
     
+    def stream_response(self, user_message: str, conversation_history: list = None,
+                        summary: Optional[ConversationSummary] = None,
+                        max_output_tokens: Optional[int] = None,
+                        api_key: Optional[str] = None) -> Iterator[str]:
+        """
+        Genera una respuesta en streaming ("stream": true, eventos SSE),
+        entregando cada fragmento de texto a medida que llega
+        
+        Raises:
+            ValueError: Si no hay API key configurada
+            requests.exceptions.RequestException: Si falla la petición
+        """
+        current_api_key = api_key or self.api_key
+        if not current_api_key:
+            raise ValueError("API key de Mistral no configurada")
+        
+        data = self._build_request(user_message, conversation_history, summary, stream=True,
+                                   max_output_tokens=max_output_tokens)
+        
+        deadline = request_deadline()
+        with send_with_backoff(lambda: get_http_session().post(
+            self.base_url,
+            headers={
+                "Authorization": f"Bearer {current_api_key}",
+                "Content-Type": "application/json",
+                "Accept": "text/event-stream"
+            },
+            json=data,
+            timeout=remaining_timeout(deadline),
+            stream=True
+        ), deadline=deadline) as response:
+            response.raise_for_status()
+            # SSE es UTF-8; sin charset en Content-Type requests asumiría ISO-8859-1
+            response.encoding = "utf-8"
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    break
+                if not payload:
+                    continue
+                
+                chunk = json.loads(payload)
+                for choice in chunk.get("choices", [])[:1]:
+                    text = (choice.get("delta") or {}).get("content")
+                    if text:
+                        yield text
+    
+    def complete(self, prompt: str, max_output_tokens: int = 300, temperature: float = 0.2,
+                 api_key: Optional[str] = None) -> str:
+        """
+        Completa un prompt libre, sin el contexto de LEAN BOT (resúmenes,
+        tareas internas)
+        
+        Raises:
+            ValueError: Si no hay API key configurada
+            requests.exceptions.RequestException: Si falla la petición
+        """
+        current_api_key = api_key or self.api_key
+        if not current_api_key:
+            raise ValueError("API key de Mistral no configurada")
+        deadline = request_deadline()
+        response = send_with_backoff(lambda: get_http_session().post(
+            self.base_url,
+            headers={
+                "Authorization": f"Bearer {current_api_key}",
+                "Content-Type": "application/json"
+            },
+            json={
+                "model": self.model,
+                "messages": [{"role": "user", "content": prompt}],
+                "max_tokens": max_output_tokens,
+                "temperature": temperature
+            },
+            timeout=remaining_timeout(deadline)
+        ), deadline=deadline)
+        response.raise_for_status()
+        return response.json()["choices"][0]["message"]["content"].strip()
+    
     def test_connection(self) -> bool:
         """
         Prueba la conexión con Mistral AI API
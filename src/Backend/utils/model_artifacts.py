@@ -0,0 +1,97 @@
+"""
+Artefactos locales del modelo de sentimientos.
+
+El modelo se descarga y verifica en tiempo de build
+(`python -m src.Backend.tools.prefetch_sentiment_model`) a un directorio con
+pesos en safetensors, tokenizer y un manifiesto con los SHA-256 de cada
+archivo. En modo offline (SENTIMENT_OFFLINE=1) el analizador carga solo desde
+ese directorio y nunca toca la red.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.realpath(__file__)))))
+DEFAULT_MODEL_DIR = os.path.join(REPO_ROOT, "models", "sentiment")
+MANIFEST_NAME = "lean_manifest.json"
+
+def get_model_dir() -> str:
+    """
+    Directorio de artefactos (SENTIMENT_MODEL_DIR, relativo a la raíz del repo
+    si no es absoluto)
+    """
+    path = os.getenv("SENTIMENT_MODEL_DIR", DEFAULT_MODEL_DIR)
+    if not os.path.isabs(path):
+        path = os.path.join(REPO_ROOT, path)
+    return path
+
+def is_offline() -> bool:
+    """Modo offline: cargar solo artefactos locales"""
+    return os.getenv("SENTIMENT_OFFLINE", "").lower() in ("1", "true", "yes")
+
+def has_local_artifacts(model_dir: Optional[str] = None) -> bool:
+    """Indica si el directorio contiene un modelo guardado con save_pretrained"""
+    model_dir = model_dir or get_model_dir()
+    return os.path.exists(os.path.join(model_dir, "config.json"))
+
+def read_manifest(model_dir: Optional[str] = None) -> Optional[Dict]:
+    """Lee el manifiesto del directorio de artefactos (o None si no existe)"""
+    path = os.path.join(model_dir or get_model_dir(), MANIFEST_NAME)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_manifest(model_dir: str, model_id: str) -> Dict:
+    """
+    Escribe el manifiesto con el SHA-256 de cada archivo del directorio
+    """
+    files = {}
+    for name in sorted(os.listdir(model_dir)):
+        path = os.path.join(model_dir, name)
+        if name != MANIFEST_NAME and os.path.isfile(path):
+            files[name] = _sha256(path)
+
+    manifest = {
+        "model_id": model_id,
+        "created_at": datetime.now().isoformat(),
+        "files": files,
+    }
+    with open(os.path.join(model_dir, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+def verify_manifest(model_dir: Optional[str] = None) -> Tuple[bool, List[str]]:
+    """
+    Verifica que los archivos coincidan con el manifiesto
+
+    Returns:
+        Tuple[bool, List[str]]: (válido, lista de errores)
+    """
+    model_dir = model_dir or get_model_dir()
+    manifest = read_manifest(model_dir)
+    if manifest is None:
+        return False, [f"No existe {MANIFEST_NAME} en {model_dir}"]
+
+    errors = []
+    for name, expected in manifest.get("files", {}).items():
+        path = os.path.join(model_dir, name)
+        if not os.path.exists(path):
+            errors.append(f"Falta {name}")
+        elif _sha256(path) != expected:
+            errors.append(f"Hash distinto en {name}")
+
+    if not any(name.endswith(".safetensors") for name in manifest.get("files", {})):
+        errors.append("El modelo no tiene pesos en safetensors")
+
+    return not errors, errors
@@ -0,0 +1,95 @@
+"""
+Tiempos por etapa del procesamiento de mensajes (process_message).
+
+La generación del LLM y el análisis de sentimiento del mensaje del usuario
+corren a la vez, así que la latencia total debería acercarse a
+max(llm, sentiment) y no a su suma. Cada mensaje registra sus etapas y
+aquí se guardan las últimas para exponer percentiles en
+/ai/pipeline/metrics:
+
+- context: lectura del chat y del resumen
+- llm: generación de la respuesta
+- sentiment: inferencia de BETO (en su propio executor)
+- sentiment_wait: lo que el request esperó al sentimiento tras el LLM
+- sentiment_fallback: puntuación de respaldo cuando BETO falla
+- persist: guardado en BD
+- total: de principio a fin
+
+Variables de entorno:
+    PIPELINE_TIMINGS_WINDOW: mensajes recientes para los percentiles (por defecto 500)
+"""
+
+import os
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional
+
+PIPELINE_TIMINGS_WINDOW = int(os.getenv("PIPELINE_TIMINGS_WINDOW", "500"))
+
+STAGES = ("context", "llm", "sentiment", "sentiment_wait", "sentiment_fallback", "persist", "total")
+
+class PipelineTimings:
+    """
+    Ventana de tiempos recientes (ms) por etapa
+    """
+
+    def __init__(self, window: int = PIPELINE_TIMINGS_WINDOW):
+        self._lock = threading.Lock()
+        self._stages: Dict[str, Deque[float]] = {stage: deque(maxlen=max(1, window)) for stage in STAGES}
+        self._messages = 0
+        self._concurrent = 0
+        # Suma de (llm + sentiment) - max(llm, sentiment): lo que ahorra el solapamiento
+        self._overlap_saved_ms = 0.0
+        self._last: Optional[Dict[str, float]] = None
+
+    def record(self, timings: Dict[str, float]):
+        """Registra las etapas de un mensaje (las que no estén se omiten)"""
+        with self._lock:
+            self._messages += 1
+            for stage, value in timings.items():
+                if stage in self._stages:
+                    self._stages[stage].append(value)
+            if "llm" in timings and "sentiment" in timings:
+                self._concurrent += 1
+                self._overlap_saved_ms += min(timings["llm"], timings["sentiment"])
+            self._last = dict(timings)
+
+    @staticmethod
+    def _percentile(ordered, pct: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            stages = {}
+            for stage, values in self._stages.items():
+                if not values:
+                    continue
+                ordered = sorted(values)
+                stages[stage] = {
+                    "count": len(ordered),
+                    "avg_ms": round(sum(ordered) / len(ordered), 1),
+                    "p50_ms": round(self._percentile(ordered, 50), 1),
+                    "p95_ms": round(self._percentile(ordered, 95), 1),
+                }
+            return {
+                "messages": self._messages,
+                "concurrent_messages": self._concurrent,
+                "overlap_saved_ms": round(self._overlap_saved_ms, 1),
+                "stages": stages,
+                "last": self._last,
+            }
+
+# Instancia global de tiempos
+_pipeline_timings: Optional[PipelineTimings] = None
+_pipeline_timings_lock = threading.Lock()
+
+def get_pipeline_timings() -> PipelineTimings:
+    """
+    Obtiene el registro global de tiempos por etapa
+    """
+    global _pipeline_timings
+    if _pipeline_timings is None:
+        with _pipeline_timings_lock:
+            if _pipeline_timings is None:
+                _pipeline_timings = PipelineTimings()
+    return _pipeline_timings
@@ -0,0 +1,253 @@
+"""
+Router de proveedores de IA con circuit breakers.
+
+Lleva, por proveedor, la tasa de éxito y la latencia como promedios móviles
+exponenciales (EWMA). Tras varios fallos consecutivos el circuito se abre y
+las peticiones se envían al proveedor sano; pasado el tiempo de enfriamiento
+el circuito queda medio abierto y una sola petición de prueba (real o del
+hilo de sondeo en segundo plano) decide si se cierra o se vuelve a abrir.
+
+Estados del circuito:
+    closed:    el proveedor recibe tráfico normalmente
+    open:      se evita el proveedor hasta que pase ROUTER_OPEN_SECONDS
+    half_open: se permite una única petición de prueba
+
+Variables de entorno:
+    ROUTER_ENABLED: "0" para usar siempre el proveedor pedido (por defecto activo)
+    ROUTER_FAILURE_THRESHOLD: fallos consecutivos para abrir (por defecto 3)
+    ROUTER_OPEN_SECONDS: enfriamiento antes de medio abrir (por defecto 30)
+    ROUTER_EWMA_ALPHA: peso de la última muestra en las EWMA (por defecto 0.2)
+    ROUTER_PROBE_INTERVAL_SECONDS: cada cuánto sondea el hilo de fondo (por defecto 15)
+    ROUTER_LATENCY_WINDOW: latencias recientes guardadas para percentiles (por defecto 200)
+"""
+
+import os
+import time
+import logging
+import threading
+from collections import Counter, deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1").lower() not in ("0", "false", "no")
+ROUTER_FAILURE_THRESHOLD = int(os.getenv("ROUTER_FAILURE_THRESHOLD", "3"))
+ROUTER_OPEN_SECONDS = float(os.getenv("ROUTER_OPEN_SECONDS", "30"))
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+ROUTER_PROBE_INTERVAL_SECONDS = float(os.getenv("ROUTER_PROBE_INTERVAL_SECONDS", "15"))
+ROUTER_LATENCY_WINDOW = int(os.getenv("ROUTER_LATENCY_WINDOW", "200"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+class ProviderHealth:
+    """
+    Estado de salud de un proveedor (se modifica solo bajo el lock del router)
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.state = CLOSED
+        self.consecutive_failures = 0
+        self.ewma_latency_ms: Optional[float] = None
+        self.ewma_success = 1.0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.latencies = deque(maxlen=max(1, ROUTER_LATENCY_WINDOW))
+        self.counters = Counter()
+
+    def percentile(self, pct: float) -> Optional[float]:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(round(pct / 100.0 * (len(ordered) - 1))))]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "ewma_latency_ms": round(self.ewma_latency_ms, 1) if self.ewma_latency_ms is not None else None,
+            "success_rate": round(self.ewma_success, 3),
+            "p50_latency_ms": self.percentile(50),
+            "p95_latency_ms": self.percentile(95),
+            **self.counters,
+        }
+
+class ProviderRouter:
+    """
+    Decide a qué proveedor enviar cada petición según su salud
+    """
+
+    def __init__(self, providers: List[str], probe: Optional[Callable[[str], bool]] = None,
+                 failure_threshold: int = ROUTER_FAILURE_THRESHOLD,
+                 open_seconds: float = ROUTER_OPEN_SECONDS,
+                 alpha: float = ROUTER_EWMA_ALPHA,
+                 probe_interval: float = ROUTER_PROBE_INTERVAL_SECONDS,
+                 enabled: bool = ROUTER_ENABLED):
+        self.health = {name: ProviderHealth(name) for name in providers}
+        self.probe = probe
+        self.failure_threshold = max(1, failure_threshold)
+        self.open_seconds = open_seconds
+        self.alpha = alpha
+        self.probe_interval = probe_interval
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._decisions = Counter()
+        self._probe_thread: Optional[threading.Thread] = None
+
+    # --- Estado ---
+
+    def _refresh_state(self, health: ProviderHealth, now: float):
+        if health.state == OPEN and now - health.opened_at >= self.open_seconds:
+            health.state = HALF_OPEN
+            health.trial_in_flight = False
+
+    def _is_available(self, health: ProviderHealth) -> bool:
+        """Disponible si está cerrado, o medio abierto sin prueba en curso (la toma)"""
+        if health.state == CLOSED:
+            return True
+        if health.state == HALF_OPEN and not health.trial_in_flight:
+            health.trial_in_flight = True
+            return True
+        return False
+
+    def _score(self, health: ProviderHealth) -> float:
+        # Menor es mejor: latencia esperada penalizada por la tasa de fallos
+        latency = health.ewma_latency_ms if health.ewma_latency_ms is not None else 0.0
+        return latency / max(health.ewma_success, 0.05)
+
+    def route(self, requested: str) -> List[str]:
+        """
+        Orden de proveedores a intentar para una petición: el pedido primero
+        si está sano; si no, los sanos ordenados por latencia y éxito. Si no
+        hay ninguno disponible se intenta igualmente el pedido.
+        """
+        if not self.enabled or requested not in self.health:
+            return [requested]
+
+        now = time.monotonic()
+        with self._lock:
+            for health in self.health.values():
+                self._refresh_state(health, now)
+
+            if self._is_available(self.health[requested]):
+                order = [requested]
+            else:
+                order = []
+            alternatives = sorted(
+                (h for name, h in self.health.items() if name != requested and h.state != OPEN),
+                key=self._score
+            )
+            order += [h.name for h in alternatives if self._is_available(h)]
+            if not order:
+                order = [requested]
+
+            self._decisions[f"{requested}->{order[0]}"] += 1
+            if order[0] != requested:
+                self._decisions["fallback"] += 1
+        return order
+
+    def record(self, provider: str, success: bool, latency_ms: float):
+        """
+        Registra el resultado de una llamada (éxito = respuesta válida, no "Lo siento")
+        """
+        health = self.health.get(provider)
+        if health is None:
+            return
+        opened = False
+        with self._lock:
+            health.trial_in_flight = False
+            health.counters["requests"] += 1
+            health.ewma_success = (1 - self.alpha) * health.ewma_success + self.alpha * (1.0 if success else 0.0)
+
+            if success:
+                health.counters["successes"] += 1
+                health.latencies.append(latency_ms)
+                health.ewma_latency_ms = latency_ms if health.ewma_latency_ms is None else \
+                    (1 - self.alpha) * health.ewma_latency_ms + self.alpha * latency_ms
+                health.consecutive_failures = 0
+                if health.state != CLOSED:
+                    logger.info(f"🟢 Circuito de {provider} cerrado")
+                health.state = CLOSED
+            else:
+                health.counters["failures"] += 1
+                health.consecutive_failures += 1
+                if health.state == HALF_OPEN or (
+                    health.state == CLOSED and health.consecutive_failures >= self.failure_threshold
+                ):
+                    health.state = OPEN
+                    health.opened_at = time.monotonic()
+                    health.counters["circuit_opened"] += 1
+                    opened = True
+
+        if opened:
+            logger.warning(f"🔴 Circuito de {provider} abierto tras {health.consecutive_failures} fallos")
+            self._ensure_probe_thread()
+
+    def release(self, provider: str):
+        """Libera la prueba de medio abierto si la petición no llegó a ejecutarse"""
+        health = self.health.get(provider)
+        if health is not None:
+            with self._lock:
+                health.trial_in_flight = False
+
+    def latency_percentile(self, provider: str, pct: float) -> Optional[float]:
+        """Percentil de las latencias recientes exitosas (ms) o None sin datos"""
+        health = self.health.get(provider)
+        if health is None:
+            return None
+        with self._lock:
+            return health.percentile(pct)
+
+    # --- Sondeo en segundo plano ---
+
+    def _ensure_probe_thread(self):
+        if self.probe is None:
+            return
+        with self._lock:
+            if self._probe_thread is not None and self._probe_thread.is_alive():
+                return
+            self._probe_thread = threading.Thread(target=self._probe_loop, name="provider-probe", daemon=True)
+            self._probe_thread.start()
+
+    def _probe_loop(self):
+        while True:
+            time.sleep(self.probe_interval)
+            now = time.monotonic()
+            with self._lock:
+                for health in self.health.values():
+                    self._refresh_state(health, now)
+                pending = [h.name for h in self.health.values() if h.state != CLOSED]
+                to_probe = [h.name for h in self.health.values()
+                            if h.state == HALF_OPEN and self._is_available(h)]
+            if not pending:
+                # Todos los circuitos cerrados: el hilo termina hasta el próximo fallo
+                return
+
+            for provider in to_probe:
+                started = time.perf_counter()
+                try:
+                    ok = bool(self.probe(provider))
+                except Exception as e:
+                    logger.warning(f"Sondeo de {provider} falló: {e}")
+                    ok = False
+                with self._lock:
+                    self.health[provider].counters["probes_ok" if ok else "probes_failed"] += 1
+                self.record(provider, ok, (time.perf_counter() - started) * 1000)
+
+    # --- Métricas ---
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Salud por proveedor y decisiones de enrutamiento"""
+        now = time.monotonic()
+        with self._lock:
+            for health in self.health.values():
+                self._refresh_state(health, now)
+            return {
+                "enabled": self.enabled,
+                "failure_threshold": self.failure_threshold,
+                "open_seconds": self.open_seconds,
+                "providers": {name: health.to_dict() for name, health in self.health.items()},
+                "decisions": dict(self._decisions),
+            }
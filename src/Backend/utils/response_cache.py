@@ -0,0 +1,157 @@
+"""
+Caché de respuestas exactas para preguntas repetidas.
+
+La mayoría del tráfico son las mismas preguntas frecuentes ("¿Qué servicios
+ofrecen?"), y cada una era una llamada completa y de pago al proveedor. La
+caché guarda la respuesta con TTL y desalojo LRU bajo una clave formada por:
+
+- el mensaje normalizado (minúsculas, sin tildes ni signos de puntuación)
+- el proveedor
+- un hash del contexto del sistema (si cambia el prompt, cambian las claves
+  y las entradas viejas simplemente dejan de usarse hasta expirar)
+- una huella del historial completo y del resumen acumulado, como la clave
+  de single-flight: "¿y cuánto cuesta?" solo reutiliza la respuesta dada en
+  la misma conversación; las preguntas que abren una conversación (el caso
+  de las preguntas frecuentes) comparten la huella vacía
+
+Variables de entorno:
+    RESPONSE_CACHE_ENABLED: "0" para desactivar la caché (por defecto activa)
+    RESPONSE_CACHE_TTL_SECONDS: vida de cada entrada (por defecto 3600)
+    RESPONSE_CACHE_MAX_ENTRIES: máximo de entradas (por defecto 512)
+"""
+
+import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from .lexicon import normalize_text
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "3600"))
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "512"))
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+
+def normalize_message(message: str) -> str:
+    """
+    Normaliza un mensaje para la clave: "¿Qué servicios ofrecen?" y
+    "que servicios ofrecen" son la misma pregunta
+    """
+    return " ".join(_PUNCTUATION.sub(" ", normalize_text(message)).split())
+
+def fingerprint_text(text: str) -> str:
+    """Hash corto y estable de un texto (contexto del sistema, historial)"""
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()[:16]
+
+def history_fingerprint(conversation_history: Optional[list], summary_text: Optional[str] = None) -> str:
+    """
+    Huella del historial completo y del resumen ("" si la conversación recién empieza)
+    """
+    if not conversation_history and not summary_text:
+        return ""
+    parts = [summary_text or ""]
+    for msg in conversation_history or []:
+        if isinstance(msg, dict):
+            parts.append(normalize_message(msg.get("message", "")))
+            parts.append(msg.get("response", "") or "")
+    return fingerprint_text("\x1f".join(parts))
+
+def is_cacheable_response(response: str) -> bool:
+    """No se guardan respuestas vacías ni los mensajes de error ("Lo siento...")"""
+    return bool(response and response.strip()) and not response.startswith("Lo siento")
+
+class ResponseCache:
+    """
+    Caché LRU con TTL, segura entre hilos
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+                 ttl_seconds: float = RESPONSE_CACHE_TTL_SECONDS,
+                 enabled: bool = RESPONSE_CACHE_ENABLED):
+        self.max_entries = max(1, max_entries)
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._entries: "OrderedDict[Tuple[str, str, str, str], Tuple[float, str]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+    def make_key(self, message: str, provider: str, context: str,
+                 conversation_history: Optional[list] = None,
+                 summary_text: Optional[str] = None) -> Tuple[str, str, str, str]:
+        """Clave (mensaje normalizado, proveedor, hash de contexto, huella de historial y resumen)"""
+        return (
+            normalize_message(message),
+            provider,
+            fingerprint_text(context),
+            history_fingerprint(conversation_history, summary_text),
+        )
+
+    def get(self, key: Tuple[str, str, str, str]) -> Optional[str]:
+        """Devuelve la respuesta guardada o None (cuenta acierto/fallo)"""
+        if not self.enabled or not key[0]:
+            return None
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] <= now:
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                entry = None
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return entry[1]
+
+    def put(self, key: Tuple[str, str, str, str], response: str):
+        """Guarda una respuesta (ignora errores y respuestas vacías)"""
+        if not self.enabled or not key[0] or not is_cacheable_response(response):
+            return
+        expires_at = time.monotonic() + self.ttl_seconds
+        with self._lock:
+            self._entries[key] = (expires_at, response)
+            self._entries.move_to_end(key)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def clear(self):
+        """Vacía la caché (las métricas se conservan)"""
+        with self._lock:
+            self._entries.clear()
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas de aciertos/fallos y configuración actual"""
+        with self._lock:
+            stats = dict(self._stats)
+            size = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "size": size,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "enabled": self.enabled,
+            "max_entries": self.max_entries,
+            "ttl_seconds": self.ttl_seconds,
+        }
+
+# Instancia global de la caché
+_response_cache: Optional[ResponseCache] = None
+_response_cache_lock = threading.Lock()
+
+def get_response_cache() -> ResponseCache:
+    """
+    Obtiene la instancia global de la caché de respuestas
+    """
+    global _response_cache
+    if _response_cache is None:
+        with _response_cache_lock:
+            if _response_cache is None:
+                _response_cache = ResponseCache()
+    return _response_cache
@@ -0,0 +1,314 @@
+"""
+Relleno (backfill) de scores para mensajes guardados sin score.
+
+Recorre los chats por páginas (sin cargar toda la tabla), junta los mensajes
+sin score en lotes y los puntúa de una vez:
+- "beto": un lote de BETO (analyze_sentiment_batch), el mismo criterio que
+  usa process_message para los mensajes nuevos.
+- "llm": un solo prompt con todo el lote; el modelo responde un JSON con el
+  score de cada intercambio. Los que falten en la respuesta se puntúan con
+  el análisis de respaldo.
+- "auto": BETO si el modelo está cargado; si no, LLM.
+
+Los scores se guardan en el mensaje dentro de chats.mensajes, así que los
+endpoints de administración solo leen.
+
+Variables de entorno:
+    SCORE_BACKFILL_BATCH_SIZE: mensajes por lote (por defecto 32)
+    SCORE_BACKFILL_METHOD: auto, beto o llm (por defecto auto)
+"""
+
+import os
+import re
+import json
+import time
+import logging
+import threading
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, Iterator, List, Optional
+
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.attributes import flag_modified
+
+from ..database import begin_write
+from ..models.chat import Chat
+from .beto_sentiment import analyze_sentiment_batch, get_sentiment_analyzer, sentiment_result_to_score
+
+logger = logging.getLogger(__name__)
+
+SCORE_BACKFILL_BATCH_SIZE = int(os.getenv("SCORE_BACKFILL_BATCH_SIZE", "32"))
+SCORE_BACKFILL_METHOD = os.getenv("SCORE_BACKFILL_METHOD", "auto").lower()
+CHAT_PAGE_SIZE = 200
+# Recorte de cada texto dentro del prompt por lotes
+LLM_TEXT_MAX_CHARS = 300
+
+BACKFILL_METHODS = ("auto", "beto", "llm")
+
+LLM_BATCH_PROMPT = """Analiza cada intercambio entre un usuario y el bot y asigna un score del 1 al 10 basado en:
+- Sentimiento del usuario (positivo=7-10, neutral=4-6, negativo=1-3)
+- Calidad de la interacción
+- Satisfacción aparente del usuario
+
+{items}
+
+Responde SOLO con un JSON de la forma [{{"id": 1, "score": 7}}, ...], con un elemento por intercambio y sin explicaciones."""
+
+@dataclass
+class PendingMessage:
+    """Mensaje sin score y su posición dentro de chats.mensajes"""
+    chat_id: str
+    index: int
+    message: str
+    response: str
+
+@dataclass
+class BackfillResult:
+    """Resumen de una ejecución del backfill"""
+    method: str
+    chats_scanned: int = 0
+    messages_scored: int = 0
+    batches: int = 0
+    llm_fallbacks: int = 0
+    duration_s: float = 0.0
+    errors: List[str] = field(default_factory=list)
+
+def _needs_score(message: Any) -> bool:
+    # Mismo criterio que usaba /admin/all-chats para calcularlo al vuelo
+    return isinstance(message, dict) and not message.get("score") and bool(message.get("message"))
+
+def iter_unscored_messages(db: Session, result: Optional[BackfillResult] = None,
+                           page_size: int = CHAT_PAGE_SIZE) -> Iterator[PendingMessage]:
+    """
+    Mensajes sin score, recorriendo los chats por páginas ordenadas por id
+    """
+    last_id = ""
+    while True:
+        chats = (db.query(Chat.id, Chat.mensajes)
+                 .filter(Chat.id > last_id)
+                 .order_by(Chat.id)
+                 .limit(page_size)
+                 .all())
+        if not chats:
+            return
+        for chat_id, mensajes in chats:
+            if result is not None:
+                result.chats_scanned += 1
+            if not isinstance(mensajes, list):
+                continue
+            for index, message in enumerate(mensajes):
+                if _needs_score(message):
+                    yield PendingMessage(chat_id, index, message["message"], message.get("response") or "")
+        last_id = chats[-1][0]
+
+def score_with_beto(batch: List[PendingMessage]) -> List[float]:
+    """Scores del lote con BETO (o su análisis de respaldo si no está cargado)"""
+    analyses = analyze_sentiment_batch([item.message for item in batch])
+    return [round(sentiment_result_to_score(analysis), 2) for analysis in analyses]
+
+def build_llm_batch_prompt(batch: List[PendingMessage]) -> str:
+    """Prompt con todos los intercambios del lote, numerados desde 1"""
+    def clip(text: str) -> str:
+        text = " ".join(text.split())
+        return text if len(text) <= LLM_TEXT_MAX_CHARS else text[:LLM_TEXT_MAX_CHARS] + "…"
+    items = "\n\n".join(
+        f'{number}. Usuario: "{clip(item.message)}"\n   Bot: "{clip(item.response)}"'
+        for number, item in enumerate(batch, 1)
+    )
+    return LLM_BATCH_PROMPT.format(items=items)
+
+def parse_llm_scores(text: str, count: int) -> Dict[int, float]:
+    """
+    Scores por número de intercambio (1..count) desde la respuesta del modelo;
+    tolera bloques ```json y texto alrededor del arreglo
+    """
+    match = re.search(r"\[.*\]", text or "", re.DOTALL)
+    if not match:
+        return {}
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return {}
+
+    scores: Dict[int, float] = {}
+    for item in items if isinstance(items, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            number, score = int(item.get("id")), float(item.get("score"))
+        except (TypeError, ValueError):
+            continue
+        if 1 <= number <= count and 1 <= score <= 10:
+            scores[number] = score
+    return scores
+
+def score_with_llm(batch: List[PendingMessage], result: Optional[BackfillResult] = None) -> List[float]:
+    """
+    Scores del lote con una sola llamada al LLM; los intercambios sin score
+    válido en la respuesta se puntúan con BETO/respaldo
+    """
+    from .ai_chat_service import get_ai_chat_service
+
+    prompt = build_llm_batch_prompt(batch)
+    try:
+        text = get_ai_chat_service().complete(prompt, max_output_tokens=20 + 16 * len(batch))
+        scores = parse_llm_scores(text, len(batch))
+    except Exception as e:
+        logger.warning(f"⚠️ Backfill: el LLM no puntuó el lote ({e}), se usa el análisis de respaldo")
+        scores = {}
+
+    missing = [index for index in range(len(batch)) if index + 1 not in scores]
+    if missing:
+        if result is not None:
+            result.llm_fallbacks += len(missing)
+        fallback = score_with_beto([batch[index] for index in missing])
+        for index, score in zip(missing, fallback):
+            scores[index + 1] = score
+    return [scores[number] for number in range(1, len(batch) + 1)]
+
+def resolve_method(method: Optional[str] = None) -> str:
+    """Método efectivo: "auto" elige BETO si el modelo está cargado"""
+    method = (method or SCORE_BACKFILL_METHOD).lower()
+    if method not in BACKFILL_METHODS:
+        raise ValueError(f"Método de backfill desconocido: {method} (usa {', '.join(BACKFILL_METHODS)})")
+    if method == "auto":
+        return "beto" if get_sentiment_analyzer().analyzer is not None else "llm"
+    return method
+
+def persist_scores(db: Session, batch: List[PendingMessage], scores: List[float]) -> int:
+    """
+    Escribe los scores en los mensajes de cada chat. Cada chat se vuelve a
+    leer y se actualiza en una transacción con el lock de escritura, así los
+    mensajes que process_message agregó entretanto se conservan; si el mensaje
+    cambió de posición o ya tiene score (otra escritura entretanto) no se toca
+
+    Returns:
+        int: Mensajes actualizados
+    """
+    by_chat: Dict[str, List[int]] = {}
+    for position, item in enumerate(batch):
+        by_chat.setdefault(item.chat_id, []).append(position)
+
+    updated = 0
+    for chat_id, positions in by_chat.items():
+        begin_write(db)
+        chat = (db.query(Chat)
+                .populate_existing()
+                .with_for_update()
+                .filter(Chat.id == chat_id)
+                .first())
+        if not chat or not isinstance(chat.mensajes, list):
+            db.rollback()
+            continue
+        mensajes = [dict(message) if isinstance(message, dict) else message for message in chat.mensajes]
+        for position in positions:
+            item = batch[position]
+            if item.index < len(mensajes) and _needs_score(mensajes[item.index]) \
+                    and mensajes[item.index]["message"] == item.message:
+                mensajes[item.index]["score"] = scores[position]
+                updated += 1
+        chat.mensajes = mensajes
+        flag_modified(chat, "mensajes")
+        db.commit()
+    return updated
+
+def run_backfill(db: Session, method: Optional[str] = None, batch_size: int = SCORE_BACKFILL_BATCH_SIZE,
+                 limit: Optional[int] = None) -> BackfillResult:
+    """
+    Puntúa y guarda por lotes los mensajes sin score
+
+    Args:
+        method: auto, beto o llm
+        batch_size: mensajes por lote (y por prompt en el método llm)
+        limit: máximo de mensajes a puntuar en esta ejecución
+    """
+    started = time.perf_counter()
+    result = BackfillResult(method=resolve_method(method))
+    batch_size = max(1, batch_size)
+
+    def flush(batch: List[PendingMessage]):
+        scores = score_with_llm(batch, result) if result.method == "llm" else score_with_beto(batch)
+        result.messages_scored += persist_scores(db, batch, scores)
+        result.batches += 1
+        logger.info(f"📝 Backfill: lote {result.batches} ({len(batch)} mensajes, {result.method})")
+
+    def safe_flush(batch: List[PendingMessage]):
+        try:
+            flush(batch)
+        except Exception as e:
+            db.rollback()
+            result.errors.append(str(e)[:200])
+            logger.error(f"❌ Backfill: error en el lote {result.batches + 1}: {e}")
+
+    # Cada página de chats ya se leyó completa, así que escribir un lote
+    # entre páginas no altera la paginación por id
+    batch: List[PendingMessage] = []
+    taken = 0
+    for item in iter_unscored_messages(db, result):
+        if limit is not None and taken >= limit:
+            break
+        batch.append(item)
+        taken += 1
+        if len(batch) >= batch_size:
+            safe_flush(batch)
+            batch = []
+    if batch:
+        safe_flush(batch)
+
+    result.duration_s = round(time.perf_counter() - started, 3)
+    return result
+
+class ScoreBackfillJob:
+    """
+    Ejecuta el backfill en segundo plano, de a una ejecución a la vez
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._running = False
+        self._last: Optional[Dict[str, Any]] = None
+
+    def start(self, session_factory, **kwargs) -> bool:
+        """
+        Lanza el backfill en un hilo con su propia sesión de BD
+
+        Returns:
+            bool: False si ya había una ejecución en curso
+        """
+        with self._lock:
+            if self._running:
+                return False
+            self._running = True
+
+        def _run():
+            db = session_factory()
+            try:
+                self._last = asdict(run_backfill(db, **kwargs))
+            except Exception as e:
+                self._last = {"errors": [str(e)[:200]]}
+                logger.error(f"❌ Backfill: {e}")
+            finally:
+                db.close()
+                with self._lock:
+                    self._running = False
+
+        threading.Thread(target=_run, name="score-backfill", daemon=True).start()
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"running": self._running, "last_run": self._last}
+
+# Instancia global del job
+_score_backfill_job: Optional[ScoreBackfillJob] = None
+_score_backfill_job_lock = threading.Lock()
+
+def get_score_backfill_job() -> ScoreBackfillJob:
+    """
+    Obtiene el job global de backfill de scores
+    """
+    global _score_backfill_job
+    if _score_backfill_job is None:
+        with _score_backfill_job_lock:
+            if _score_backfill_job is None:
+                _score_backfill_job = ScoreBackfillJob()
+    return _score_backfill_job
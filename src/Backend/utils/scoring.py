@@ -6,6 +6,27 @@ import os
 import requests
 import json
 from src.Backend.utils.gemini_sentiment import analizar_sentimiento_gemini
+from src.Backend.utils.lexicon import LexiconMatcher
+
+# Palabras positivas
+PALABRAS_POSITIVAS = [
+    'gracias', 'excelente', 'perfecto', 'genial', 'bueno', 'bien', 'fantástico',
+    'increíble', 'maravilloso', 'estupendo', 'feliz', 'contento', 'satisfecho',
+    'me gusta', 'me encanta', 'amor', 'positivo', 'sí', 'correcto', 'exacto'
+]
+
+# Palabras negativas
+PALABRAS_NEGATIVAS = [
+    'malo', 'terrible', 'horrible', 'pésimo', 'odio', 'detesto', 'no me gusta',
+    'problema', 'error', 'falla', 'incorrecto', 'mal', 'negativo', 'no', 'nunca',
+    'imposible', 'difícil', 'complicado', 'frustrado', 'molesto', 'enojado'
+]
+
+# Léxico compilado una sola vez para analyze_sentiment_basic
+LEXICO_BASICO = LexiconMatcher({
+    "positivo": PALABRAS_POSITIVAS,
+    "negativo": PALABRAS_NEGATIVAS
+})
 
 def calculate_message_score(mensaje_usuario, respuesta_bot, ai_provider="gemini", api_key=None):
     """
@@ -22,9 +43,9 @@ def calculate_message_score(mensaje_usuario, respuesta_bot, ai_provider="gemini"
     """
     try:
         # Usar el servicio unificado de IA
-        from ..utils.ai_chat_service import AIChatService
+        from ..utils.ai_chat_service import get_ai_chat_service
         
-        ai_service = AIChatService()
+        ai_service = get_ai_chat_service()
         
         # Si no se proporciona API key personalizada, usar la configuración por defecto
         if not api_key and ai_provider == "gemini":
@@ -109,25 +130,10 @@ def analyze_sentiment_basic(mensaje):
     """
     Análisis básico de sentimientos usando palabras clave
     """
-    mensaje_lower = mensaje.lower()
-    
-    # Palabras positivas
-    palabras_positivas = [
-        'gracias', 'excelente', 'perfecto', 'genial', 'bueno', 'bien', 'fantástico',
-        'increíble', 'maravilloso', 'estupendo', 'feliz', 'contento', 'satisfecho',
-        'me gusta', 'me encanta', 'amor', 'positivo', 'sí', 'correcto', 'exacto'
-    ]
-    
-    # Palabras negativas
-    palabras_negativas = [
-        'malo', 'terrible', 'horrible', 'pésimo', 'odio', 'detesto', 'no me gusta',
-        'problema', 'error', 'falla', 'incorrecto', 'mal', 'negativo', 'no', 'nunca',
-        'imposible', 'difícil', 'complicado', 'frustrado', 'molesto', 'enojado'
-    ]
-    
-    # Contar palabras positivas y negativas
-    positivas = sum(1 for palabra in palabras_positivas if palabra in mensaje_lower)
-    negativas = sum(1 for palabra in palabras_negativas if palabra in mensaje_lower)
+    # Contar palabras positivas y negativas en una sola pasada
+    conteo = LEXICO_BASICO.count(mensaje)
+    positivas = conteo.get("positivo", 0)
+    negativas = conteo.get("negativo", 0)
     
     if positivas > negativas:
         return "positivo"
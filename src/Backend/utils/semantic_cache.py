@@ -0,0 +1,451 @@
+"""
+Caché semántica de respuestas para preguntas casi idénticas.
+
+La caché exacta (response_cache) no reconoce que "qué hacen", "a qué se
+dedican" y "servicios que ofrecen" son la misma pregunta. Aquí cada mensaje se
+codifica como una bolsa de conceptos: las palabras con la misma
+normalización y recorte de plurales que knowledge_index.tokenize, y los
+sinónimos del dominio ("dedican", "hacen", "ofrecen" -> servicio) llevados a
+un mismo concepto. Con TF-IDF sobre esos conceptos (hashing a un vector de
+tamaño fijo) se busca el vecino más cercano por similitud coseno en una
+matriz NumPy de preguntas ya respondidas.
+
+Una respuesta solo se reutiliza si, además de superar el umbral:
+- la pregunta es independiente y del estilo de las preguntas frecuentes
+  (corta, interrogativa, sin "¿y ...?" ni "eso" que remitan a lo anterior);
+  quien llama solo consulta la caché al abrir la conversación, sin
+  historial ni resumen
+- los números y los nombres propios coinciden exactamente ("100 sensores"
+  no es "10 sensores", "Juana" no es "Juan")
+- las negaciones coinciden
+
+Las entradas se separan por espacio de nombres (proveedor + hash del
+contexto), tienen TTL y, al llenarse la matriz, se reemplaza la menos usada
+recientemente. El índice puede guardarse en disco (.npz + .json) y
+recargarse al iniciar. El umbral se ajusta con
+python -m src.Backend.tools.tune_semantic_cache.
+
+Variables de entorno:
+    SEMANTIC_CACHE_ENABLED: "0" para desactivarla (por defecto activa)
+    SEMANTIC_CACHE_THRESHOLD: similitud coseno mínima (por defecto 0.7)
+    SEMANTIC_CACHE_MAX_ENTRIES: capacidad del índice (por defecto 1000)
+    SEMANTIC_CACHE_DIM: dimensión del vector de hashing (por defecto 2048)
+    SEMANTIC_CACHE_TTL_SECONDS: vida de cada entrada (por defecto 86400)
+    SEMANTIC_CACHE_PATH: ruta base para persistir el índice (sin extensión;
+        vacío = no persistir)
+"""
+
+import os
+import re
+import json
+import time
+import zlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from .lexicon import normalize_text
+from .response_cache import normalize_message, is_cacheable_response
+from .knowledge_index import tokenize
+
+NUMPY_AVAILABLE = False
+np = None
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError as e:
+    print(f"⚠️ Warning: numpy no disponible, caché semántica desactivada: {e}")
+
+logger = logging.getLogger(__name__)
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "1").lower() not in ("0", "false", "no")
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.7"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+SEMANTIC_CACHE_DIM = int(os.getenv("SEMANTIC_CACHE_DIM", "2048"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+SEMANTIC_CACHE_PATH = os.getenv("SEMANTIC_CACHE_PATH", "")
+
+# Palabras del dominio que, en una pregunta frecuente, piden lo mismo
+SYNONYM_GROUPS = {
+    "servicio": ("servicio", "servicios", "ofrecen", "ofrece", "ofrecemos", "dedican", "dedica",
+                 "hacen", "hace", "brindan", "prestan", "soluciones"),
+    "precio": ("precio", "precios", "costo", "costos", "cuesta", "cuestan", "vale", "valen",
+               "tarifa", "tarifas", "cobran"),
+    "ubicacion": ("donde", "ubicados", "ubicada", "ubicacion", "direccion", "queda", "quedan",
+                  "sede", "oficina", "oficinas", "encuentran"),
+    "horario": ("horario", "horarios", "hora", "horas", "abren"),
+    "atencion": ("atencion", "atienden", "atiende"),
+}
+
+# El nombre de la empresa no cuenta como nombre propio ni cambia la pregunta
+BRAND_WORDS = frozenset({"ingelean", "inge", "lean", "bot"})
+
+# Saludos y cortesía tampoco
+FILLER_WORDS = (
+    "hola", "buenas", "buenos", "dia", "dias", "tarde", "tardes", "noche", "noches", "favor",
+    "quiero", "quisiera", "gustaria", "saber", "puedo", "pueden", "podrian", "informacion",
+    "estan", "esta", "tiene", "tienen", "ustedes", "cuanto", "cuanta", "cual", "cuales",
+    *sorted(BRAND_WORDS),
+)
+
+def _build_concepts() -> Dict[str, str]:
+    # Se indexa por el token ya recortado, así "dedican" y "dedica" dan lo mismo
+    concepts: Dict[str, str] = {}
+    for word in FILLER_WORDS:
+        for token in tokenize(word):
+            concepts[token] = ""
+    for concept, words in SYNONYM_GROUPS.items():
+        for word in words:
+            for token in tokenize(word):
+                concepts[token] = concept
+    return concepts
+
+_CONCEPTS = _build_concepts()
+
+# Preguntas independientes: cortas, interrogativas y sin referencias a lo anterior
+STANDALONE_MAX_WORDS = 14
+QUESTION_WORDS = frozenset({
+    "que", "cual", "cuales", "como", "cuanto", "cuanta", "cuantos", "cuantas", "donde",
+    "cuando", "quien", "quienes", "tienen", "hacen", "ofrecen", "trabajan", "atienden",
+})
+FOLLOW_UP_WORDS = frozenset({"y", "entonces", "pero", "o"})
+DEICTIC_WORDS = frozenset({"eso", "esa", "ese", "esos", "esas", "esto", "aquello", "anterior", "mismo", "misma"})
+
+_NUMBER = re.compile(r"\d+(?:[.,]\d+)?")
+_WORD = re.compile(r"[^\W\d_]+")
+_SENTENCE_START = re.compile(r"(?:^|[.!?¿¡])\s*$")
+
+# Los conceptos no distinguen "qué servicios ofrecen" de "qué servicios no
+# ofrecen": dos preguntas con distintas negaciones nunca se consideran iguales
+NEGATION_WORDS = frozenset({"no", "ni", "nunca", "jamas", "tampoco", "sin", "nada", "ningun", "ninguna", "ninguno"})
+
+# Se recalcula el IDF cuando el índice creció o cambió más de esta fracción
+IDF_REFIT_RATIO = 0.1
+
+def _negations(text: str) -> frozenset:
+    return NEGATION_WORDS.intersection(normalize_message(text).split())
+
+def entities(text: str) -> frozenset:
+    """
+    Números y nombres propios (palabras con mayúscula fuera del inicio de
+    la oración, y siglas) que deben coincidir exactamente para reutilizar
+    una respuesta
+    """
+    found = {number.replace(",", ".") for number in _NUMBER.findall(text or "")}
+    for match in _WORD.finditer(text or ""):
+        word = match.group(0)
+        at_start = _SENTENCE_START.search(text[:match.start()]) is not None
+        if (word[0].isupper() and not at_start) or (len(word) > 1 and word.isupper()):
+            name = normalize_text(word)
+            if name not in BRAND_WORDS:
+                found.add(name)
+    return frozenset(found)
+
+def is_standalone_question(text: str) -> bool:
+    """
+    Pregunta corta e independiente, del estilo de las preguntas frecuentes:
+    "¿Qué servicios ofrecen?" sí; "¿Y cuánto cuesta?", "Me llamo Juana" no
+    """
+    words = normalize_message(text).split()
+    if not words or len(words) > STANDALONE_MAX_WORDS:
+        return False
+    if words[0] in FOLLOW_UP_WORDS or DEICTIC_WORDS.intersection(words):
+        return False
+    return "?" in text or bool(QUESTION_WORDS.intersection(words[:3]))
+
+class ConceptEncoder:
+    """
+    Codifica textos como vectores de frecuencias (log) de conceptos, con
+    hashing estable (crc32) a `dim` posiciones
+    """
+
+    # Cambia si cambia la codificación (los índices guardados con otra se ignoran)
+    version = "concepts-v1"
+
+    def __init__(self, dim: int = SEMANTIC_CACHE_DIM):
+        self.dim = dim
+
+    @staticmethod
+    def concepts(text: str) -> List[str]:
+        concepts = []
+        for token in tokenize(text):
+            concept = _CONCEPTS.get(token, token)
+            if concept and not concept.isdigit():
+                concepts.append(concept)
+        return concepts
+
+    def term_frequencies(self, text: str) -> "np.ndarray":
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for concept in self.concepts(text):
+            vector[zlib.crc32(concept.encode("utf-8")) % self.dim] += 1.0
+        return np.log1p(vector, out=vector)
+
+class SemanticCache:
+    """
+    Índice de vecinos más cercanos sobre una matriz NumPy de capacidad fija
+    """
+
+    def __init__(self, max_entries: int = SEMANTIC_CACHE_MAX_ENTRIES,
+                 threshold: float = SEMANTIC_CACHE_THRESHOLD,
+                 dim: int = SEMANTIC_CACHE_DIM,
+                 ttl_seconds: float = SEMANTIC_CACHE_TTL_SECONDS,
+                 path: Optional[str] = SEMANTIC_CACHE_PATH or None,
+                 enabled: bool = SEMANTIC_CACHE_ENABLED):
+        self.enabled = enabled and NUMPY_AVAILABLE
+        self.max_entries = max(1, max_entries)
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.encoder = ConceptEncoder(dim)
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+        if not self.enabled:
+            return
+
+        self._tf = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._vectors = np.zeros((self.max_entries, dim), dtype=np.float32)
+        self._df = np.zeros(dim, dtype=np.float32)
+        self._idf = np.ones(dim, dtype=np.float32)
+        self._used = np.zeros(self.max_entries, dtype=bool)
+        self._expires_at = np.zeros(self.max_entries, dtype=np.float64)
+        self._last_used = np.zeros(self.max_entries, dtype=np.float64)
+        self._namespace_ids = np.full(self.max_entries, -1, dtype=np.int32)
+        self._namespaces: Dict[str, int] = {}
+        # Metadatos por fila: pregunta, respuesta, espacio de nombres
+        self._entries: List[Optional[Dict[str, str]]] = [None] * self.max_entries
+        self._changes_since_fit = 0
+
+        if self.path:
+            self.load(self.path)
+
+    # --- IDF ---
+
+    def _size(self) -> int:
+        return int(self._used.sum())
+
+    def _refit_idf(self):
+        """Recalcula el IDF con las frecuencias de documento actuales y re-pondera el índice"""
+        n = max(1, self._size())
+        self._idf = (np.log((1.0 + n) / (1.0 + self._df)) + 1.0).astype(np.float32)
+        np.multiply(self._tf, self._idf, out=self._vectors)
+        norms = np.linalg.norm(self._vectors, axis=1, keepdims=True)
+        np.divide(self._vectors, norms, out=self._vectors, where=norms > 0)
+        self._changes_since_fit = 0
+
+    def _maybe_refit(self):
+        if self._changes_since_fit > max(1, IDF_REFIT_RATIO * self._size()):
+            self._refit_idf()
+
+    def _weight(self, tf: "np.ndarray") -> "np.ndarray":
+        vector = tf * self._idf
+        norm = float(np.linalg.norm(vector))
+        return vector / norm if norm > 0 else vector
+
+    # --- Filas ---
+
+    def _release(self, row: int):
+        self._df -= self._tf[row] > 0
+        self._used[row] = False
+        self._namespace_ids[row] = -1
+        self._entries[row] = None
+        self._tf[row] = 0.0
+        self._vectors[row] = 0.0
+        self._changes_since_fit += 1
+
+    def _expire(self, now: float):
+        expired = np.flatnonzero(self._used & (self._expires_at <= now))
+        for row in expired:
+            self._release(int(row))
+        self._stats["expirations"] += len(expired)
+
+    def _free_row(self) -> int:
+        free = np.flatnonzero(~self._used)
+        if len(free):
+            return int(free[0])
+        # Índice lleno: reemplazar la fila menos usada recientemente
+        row = int(np.argmin(np.where(self._used, self._last_used, np.inf)))
+        self._release(row)
+        self._stats["evictions"] += 1
+        return row
+
+    def _namespace_id(self, namespace: str) -> int:
+        if namespace not in self._namespaces:
+            self._namespaces[namespace] = len(self._namespaces)
+        return self._namespaces[namespace]
+
+    def _store_row(self, row: int, tf: "np.ndarray", entry: Dict[str, str], expires_at: float, last_used: float):
+        self._tf[row] = tf
+        self._df += tf > 0
+        self._used[row] = True
+        self._namespace_ids[row] = self._namespace_id(entry["namespace"])
+        self._expires_at[row] = expires_at
+        self._last_used[row] = last_used
+        self._entries[row] = entry
+        self._changes_since_fit += 1
+
+    # --- API pública ---
+
+    def get(self, message: str, namespace: str) -> Optional[Dict[str, Any]]:
+        """
+        Busca una pregunta similar ya respondida en el mismo espacio de nombres
+
+        Returns:
+            Dict con response, similarity y matched_question, o None
+        """
+        if not self.enabled or not is_standalone_question(message):
+            return None
+        tf = self.encoder.term_frequencies(message)
+        if not tf.any():
+            return None
+
+        with self._lock:
+            now = time.time()
+            self._expire(now)
+            self._maybe_refit()
+            namespace_id = self._namespaces.get(namespace)
+            if namespace_id is None:
+                self._stats["misses"] += 1
+                return None
+
+            similarities = self._vectors @ self._weight(tf)
+            similarities = np.where(self._used & (self._namespace_ids == namespace_id), similarities, -1.0)
+            row = int(np.argmax(similarities))
+            similarity = float(similarities[row])
+
+            entry = self._entries[row]
+            if similarity < self.threshold or _negations(message) != _negations(entry["question"]) \
+                    or entities(message) != entities(entry["question"]):
+                self._stats["misses"] += 1
+                return None
+
+            self._last_used[row] = now
+            self._stats["hits"] += 1
+            return {
+                "response": entry["response"],
+                "similarity": similarity,
+                "matched_question": entry["question"],
+            }
+
+    def put(self, message: str, response: str, namespace: str):
+        """Agrega un par pregunta/respuesta al índice (solo preguntas independientes; ignora errores y vacíos)"""
+        if not self.enabled or not is_standalone_question(message) or not is_cacheable_response(response):
+            return
+        tf = self.encoder.term_frequencies(message)
+        if not tf.any():
+            return
+
+        with self._lock:
+            now = time.time()
+            row = self._free_row()
+            entry = {"question": message, "response": response, "namespace": namespace}
+            self._store_row(row, tf, entry, now + self.ttl_seconds, now)
+            self._vectors[row] = self._weight(tf)
+            self._stats["stores"] += 1
+
+    def clear(self):
+        """Vacía el índice (las métricas se conservan)"""
+        if not self.enabled:
+            return
+        with self._lock:
+            for row in np.flatnonzero(self._used):
+                self._release(int(row))
+            self._refit_idf()
+
+    def save(self, path: Optional[str] = None) -> bool:
+        """
+        Guarda el índice en `<path>.npz` (frecuencias) y `<path>.json` (metadatos)
+        """
+        path = path or self.path
+        if not self.enabled or not path:
+            return False
+        with self._lock:
+            rows = np.flatnonzero(self._used)
+            metadata = {
+                "dim": self.encoder.dim,
+                "encoder": self.encoder.version,
+                "entries": [
+                    {**self._entries[row], "expires_at": float(self._expires_at[row]),
+                     "last_used": float(self._last_used[row])}
+                    for row in rows
+                ],
+            }
+            tf = self._tf[rows].copy()
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(f"{path}.npz", tf=tf)
+        with open(f"{path}.json", "w", encoding="utf-8") as f:
+            json.dump(metadata, f, ensure_ascii=False)
+        logger.info(f"💾 Caché semántica guardada: {len(rows)} entradas en {path}")
+        return True
+
+    def load(self, path: Optional[str] = None) -> int:
+        """
+        Carga un índice guardado con save() (las entradas vencidas se descartan)
+
+        Returns:
+            int: Número de entradas cargadas
+        """
+        path = path or self.path
+        if not self.enabled or not path or not os.path.exists(f"{path}.json") or not os.path.exists(f"{path}.npz"):
+            return 0
+        try:
+            with open(f"{path}.json", "r", encoding="utf-8") as f:
+                metadata = json.load(f)
+            if metadata.get("dim") != self.encoder.dim or metadata.get("encoder") != self.encoder.version:
+                logger.warning("Caché semántica guardada con otra configuración de encoder, se ignora")
+                return 0
+            tf = np.load(f"{path}.npz")["tf"]
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"No se pudo cargar la caché semántica desde {path}: {e}")
+            return 0
+
+        now = time.time()
+        live = [(i, entry) for i, entry in enumerate(metadata.get("entries", [])) if entry["expires_at"] > now]
+        # Si no caben todas, conservar las usadas más recientemente
+        live = sorted(live, key=lambda item: item[1]["last_used"], reverse=True)[:self.max_entries]
+
+        with self._lock:
+            for row, (i, entry) in enumerate(live):
+                fields = {key: entry[key] for key in ("question", "response", "namespace")}
+                self._store_row(row, tf[i], fields, entry["expires_at"], entry["last_used"])
+            self._refit_idf()
+
+        logger.info(f"📂 Caché semántica cargada: {len(live)} entradas desde {path}")
+        return len(live)
+
+    def get_metrics(self) -> Dict[str, Any]:
+        """Métricas de aciertos/fallos y configuración actual"""
+        with self._lock:
+            stats = dict(self._stats)
+            size = self._size() if self.enabled else 0
+        lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "size": size,
+            "hit_rate": stats["hits"] / lookups if lookups else 0.0,
+            "enabled": self.enabled,
+            "numpy_available": NUMPY_AVAILABLE,
+            "threshold": self.threshold,
+            "max_entries": self.max_entries,
+            "dim": self.encoder.dim,
+            "ttl_seconds": self.ttl_seconds,
+            "path": self.path,
+        }
+
+# Instancia global de la caché semántica
+_semantic_cache: Optional[SemanticCache] = None
+_semantic_cache_lock = threading.Lock()
+
+def get_semantic_cache() -> SemanticCache:
+    """
+    Obtiene la instancia global de la caché semántica
+    """
+    global _semantic_cache
+    if _semantic_cache is None:
+        with _semantic_cache_lock:
+            if _semantic_cache is None:
+                _semantic_cache = SemanticCache()
+    return _semantic_cache
@@ -55,7 +55,26 @@ class SentimentAnalytics:
         """
         timestamp = datetime.now()
         
-        sentiment_entry = {
+        self.sentiment_history.append(self._build_entry(message_data, timestamp))
+        self._trim_history()
+    
+    def add_sentiment_data_batch(self, messages_data: List[Dict]):
+        """
+        Agrega varios registros de sentimiento en una sola inserción
+        """
+        if not messages_data:
+            return
+        
+        timestamp = datetime.now()
+        
+        self.sentiment_history.extend(
+            self._build_entry(message_data, timestamp) for message_data in messages_data
+        )
+        self._trim_history()
+    
+    def _build_entry(self, message_data: Dict, timestamp: datetime) -> Dict:
+        """Construye un registro del historial a partir de los datos del mensaje"""
+        return {
             "timestamp": timestamp.isoformat(),
             "message": message_data.get("message", ""),
             "sentiment": message_data.get("sentiment", "NEU"),
@@ -64,10 +83,9 @@ class SentimentAnalytics:
             "user_id": message_data.get("user_id", "unknown"),
             "conversation_id": message_data.get("conversation_id", "default")
         }
-        
-        self.sentiment_history.append(sentiment_entry)
-        
-        # Mantener solo los últimos 1000 registros para evitar uso excesivo de memoria
+    
+    def _trim_history(self):
+        """Mantiene solo los últimos 1000 registros para evitar uso excesivo de memoria"""
         if len(self.sentiment_history) > 1000:
             self.sentiment_history = self.sentiment_history[-1000:]
     
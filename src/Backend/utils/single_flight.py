@@ -0,0 +1,164 @@
+"""
+Unificación de peticiones idénticas en curso ("single-flight").
+
+Cuando muchos usuarios envían el mismo primer mensaje a la vez (por ejemplo,
+al difundir un enlace de campaña), la caché de respuestas todavía está vacía
+y cada petición lanzaría su propia llamada al proveedor. Aquí la primera
+petición con una clave dada hace la llamada y las que llegan mientras sigue
+en curso esperan y reciben el mismo resultado.
+
+En streaming, la llamada se consume en un hilo propio y cada petición lee
+los fragmentos desde el búfer compartido a su ritmo, así que si el primer
+cliente se desconecta los demás siguen recibiendo la respuesta.
+
+Variables de entorno:
+    SINGLE_FLIGHT_ENABLED: "0" para desactivarlo (por defecto activo)
+"""
+
+import os
+import threading
+from collections import Counter
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional, Tuple
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1").lower() not in ("0", "false", "no")
+
+class _Call:
+    """Llamada en curso y su resultado compartido"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result: Any = None
+        self.error: Optional[BaseException] = None
+        self.waiters = 0
+
+class _StreamCall:
+    """Llamada en streaming en curso, con los fragmentos recibidos hasta ahora"""
+
+    def __init__(self):
+        self.chunks: List[str] = []
+        self.finished = False
+        self.error: Optional[BaseException] = None
+        self.condition = threading.Condition()
+        self.waiters = 0
+
+    def read(self) -> Iterator[str]:
+        index = 0
+        while True:
+            with self.condition:
+                while index >= len(self.chunks) and not self.finished:
+                    self.condition.wait()
+                if index < len(self.chunks):
+                    chunk = self.chunks[index]
+                    index += 1
+                elif self.error is not None:
+                    raise self.error
+                else:
+                    return
+            yield chunk
+
+class SingleFlight:
+    """
+    Agrupa las llamadas concurrentes con la misma clave en una sola
+    """
+
+    def __init__(self, enabled: bool = SINGLE_FLIGHT_ENABLED):
+        self.enabled = enabled
+        self._calls: Dict[Hashable, _Call] = {}
+        self._streams: Dict[Hashable, _StreamCall] = {}
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Tuple[Any, bool]:
+        """
+        Ejecuta `fn` o espera a la llamada en curso con la misma clave
+
+        Returns:
+            Tuple[resultado, compartido]: compartido es True si el resultado
+            vino de la llamada de otra petición
+
+        Raises:
+            La excepción de `fn`, también en las peticiones que esperaban
+        """
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            call = self._calls.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters["coalesced"] += 1
+                leader = False
+            else:
+                call = self._calls[key] = _Call()
+                self._counters["calls"] += 1
+                leader = True
+
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = fn()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+
+    def stream(self, key: Hashable, fn: Callable[[], Iterator[str]]) -> Tuple[Iterator[str], bool]:
+        """
+        Iterador con los fragmentos de `fn`, compartido entre las peticiones
+        concurrentes con la misma clave
+
+        Returns:
+            Tuple[fragmentos, compartido]
+        """
+        if not self.enabled:
+            return fn(), False
+
+        with self._lock:
+            call = self._streams.get(key)
+            if call is not None:
+                call.waiters += 1
+                self._counters["stream_coalesced"] += 1
+                return call.read(), True
+            call = self._streams[key] = _StreamCall()
+            self._counters["stream_calls"] += 1
+
+        def produce():
+            try:
+                for chunk in fn():
+                    with call.condition:
+                        call.chunks.append(chunk)
+                        call.condition.notify_all()
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    self._streams.pop(key, None)
+                with call.condition:
+                    call.finished = True
+                    call.condition.notify_all()
+
+        threading.Thread(target=produce, name="single-flight-stream", daemon=True).start()
+        return call.read(), False
+
+    def get_metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            counters = dict(self._counters)
+            in_flight = len(self._calls) + len(self._streams)
+        calls = counters.get("calls", 0) + counters.get("stream_calls", 0)
+        coalesced = counters.get("coalesced", 0) + counters.get("stream_coalesced", 0)
+        return {
+            "enabled": self.enabled,
+            "in_flight": in_flight,
+            "upstream_calls": calls,
+            "coalesced_requests": coalesced,
+            "coalesce_ratio": round(coalesced / (calls + coalesced), 4) if calls + coalesced else 0.0,
+            **counters,
+        }
@@ -0,0 +1,145 @@
+"""
+Arranque en segundo plano de los componentes de LEAN BOT.
+
+El puerto se abre de inmediato y los componentes lentos (validación de API
+keys, carga del modelo de sentimientos, esquema de la base de datos, índice
+de conocimiento, conexiones HTTP) se preparan a la vez en hilos propios.
+/health/ready responde 503 hasta que terminan los componentes requeridos,
+así el balanceador solo envía tráfico cuando la aplicación está caliente;
+/health/live solo indica que el proceso responde.
+
+Un componente no requerido que falla (p. ej. el pre-calentamiento HTTP) no
+bloquea la disponibilidad: queda reportado como "failed" con su error.
+"""
+
+import time
+import logging
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+PENDING = "pending"
+RUNNING = "running"
+READY = "ready"
+FAILED = "failed"
+
+@dataclass
+class StartupComponent:
+    """Tarea de arranque y su estado"""
+    name: str
+    task: Callable[[], Any]
+    required: bool = True
+    status: str = PENDING
+    started_at: Optional[float] = None
+    duration_ms: Optional[float] = None
+    error: Optional[str] = None
+    detail: Any = None
+    done: threading.Event = field(default_factory=threading.Event, repr=False)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"status": self.status, "required": self.required, "duration_ms": self.duration_ms}
+        if self.status == RUNNING and self.started_at is not None:
+            data["running_ms"] = round((time.perf_counter() - self.started_at) * 1000, 1)
+        if self.error:
+            data["error"] = self.error
+        if self.detail is not None:
+            data["detail"] = self.detail
+        return data
+
+class StartupManager:
+    """
+    Ejecuta las tareas de arranque en paralelo y expone su estado
+    """
+
+    def __init__(self):
+        self._components: Dict[str, StartupComponent] = {}
+        self._lock = threading.Lock()
+        self._started_at: Optional[float] = None
+
+    def register(self, name: str, task: Callable[[], Any], required: bool = True):
+        """Registra una tarea; lo que devuelva se reporta como `detail`"""
+        with self._lock:
+            self._components[name] = StartupComponent(name=name, task=task, required=required)
+
+    def _run(self, component: StartupComponent):
+        component.status = RUNNING
+        component.started_at = time.perf_counter()
+        try:
+            component.detail = component.task()
+            component.status = READY
+        except Exception as e:
+            component.error = str(e)[:200]
+            component.status = FAILED
+            logger.error(f"❌ Arranque: {component.name} falló: {e}")
+        finally:
+            component.duration_ms = round((time.perf_counter() - component.started_at) * 1000, 1)
+            component.done.set()
+            logger.info(f"🚦 Arranque: {component.name} {component.status} en {component.duration_ms} ms")
+
+    def start(self):
+        """Lanza (una sola vez) cada tarea registrada en su propio hilo"""
+        with self._lock:
+            if self._started_at is not None:
+                return
+            self._started_at = time.perf_counter()
+            components = list(self._components.values())
+        for component in components:
+            threading.Thread(target=self._run, args=(component,),
+                             name=f"startup-{component.name}", daemon=True).start()
+
+    def is_ready(self) -> bool:
+        """Todas las tareas requeridas terminaron bien"""
+        with self._lock:
+            components = list(self._components.values())
+        return self._started_at is not None and all(
+            component.status == READY for component in components if component.required
+        )
+
+    def component_detail(self, name: str) -> Any:
+        """
+        Lo que devolvió la tarea si ya terminó bien; None si no está
+        registrada, sigue en curso o falló (no espera)
+        """
+        with self._lock:
+            component = self._components.get(name)
+        if component is None or component.status != READY:
+            return None
+        return component.detail
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que terminen todas las tareas (útil en scripts y pruebas)"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            components = list(self._components.values())
+        for component in components:
+            remaining = None if deadline is None else max(0.0, deadline - time.monotonic())
+            if not component.done.wait(remaining):
+                return False
+        return True
+
+    def get_status(self) -> Dict[str, Any]:
+        with self._lock:
+            components: List[StartupComponent] = list(self._components.values())
+            started_at = self._started_at
+        return {
+            "ready": self.is_ready(),
+            "uptime_s": round(time.perf_counter() - started_at, 1) if started_at is not None else None,
+            "components": {component.name: component.to_dict() for component in components},
+        }
+
+# Instancia global del arranque
+_startup_manager: Optional[StartupManager] = None
+_startup_manager_lock = threading.Lock()
+
+def get_startup_manager() -> StartupManager:
+    """
+    Obtiene el gestor global de arranque
+    """
+    global _startup_manager
+    if _startup_manager is None:
+        with _startup_manager_lock:
+            if _startup_manager is None:
+                _startup_manager = StartupManager()
+    return _startup_manager
@@ -0,0 +1,138 @@
+"""
+Respuesta estructurada: la respuesta del bot, el score y el sentimiento del
+usuario en una sola llamada al LLM.
+
+Cuando BETO no está cargado, el score de cada mensaje lo calculaba una
+segunda llamada al LLM (calculate_message_score) después de la respuesta.
+En modo estructurado el proveedor devuelve un JSON con los tres campos
+(Gemini con responseMimeType/responseSchema, Mistral con JSON mode) y se
+valida aquí; si el JSON no es válido se usa la respuesta como texto y el
+score se calcula con el análisis de respaldo.
+
+Variables de entorno:
+    STRUCTURED_REPLY_ENABLED: "0" para desactivarlo (por defecto activo cuando BETO no está cargado)
+"""
+
+import os
+import re
+import json
+from dataclasses import dataclass
+from typing import Optional
+
+STRUCTURED_REPLY_ENABLED = os.getenv("STRUCTURED_REPLY_ENABLED", "1").lower() not in ("0", "false", "no")
+
+# Tokens extra para las llaves y los campos score/sentiment
+STRUCTURED_EXTRA_OUTPUT_TOKENS = 60
+
+SENTIMENT_LABELS = ("positivo", "neutral", "negativo")
+# Código de sentimiento de BETO para cada etiqueta (analytics)
+SENTIMENT_CODES = {"positivo": "POS", "neutral": "NEU", "negativo": "NEG"}
+_LABEL_ALIASES = {
+    "positive": "positivo", "pos": "positivo",
+    "neutro": "neutral", "neu": "neutral",
+    "negative": "negativo", "neg": "negativo",
+}
+
+STRUCTURED_INSTRUCTION = (
+    "Responde SOLO con un objeto JSON con estas claves:\n"
+    '- "reply": tu respuesta al usuario, tal como la darías normalmente\n'
+    '- "score": número del 1 al 10 con la satisfacción aparente del usuario en su último mensaje '
+    "(positivo=7-10, neutral=4-6, negativo=1-3)\n"
+    '- "sentiment": "positivo", "neutral" o "negativo"'
+)
+
+# Esquema de Gemini (subconjunto de OpenAPI) para generationConfig.responseSchema
+GEMINI_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "reply": {"type": "STRING"},
+        "score": {"type": "NUMBER"},
+        "sentiment": {"type": "STRING", "enum": list(SENTIMENT_LABELS)},
+    },
+    "required": ["reply", "score", "sentiment"],
+    "propertyOrdering": ["reply", "score", "sentiment"],
+}
+
+@dataclass
+class StructuredReply:
+    """Respuesta del bot con el score y el sentimiento del mensaje del usuario"""
+    reply: str
+    score: float
+    sentiment: str
+
+    @property
+    def sentiment_code(self) -> str:
+        return SENTIMENT_CODES[self.sentiment]
+
+def _load_object(text: Optional[str]) -> Optional[dict]:
+    # Tolera bloques ```json y texto alrededor del objeto
+    match = re.search(r"\{.*\}", text or "", re.DOTALL)
+    if not match:
+        return None
+    try:
+        data = json.loads(match.group(0))
+    except json.JSONDecodeError:
+        return None
+    return data if isinstance(data, dict) else None
+
+def parse_structured_reply(text: Optional[str]) -> Optional[StructuredReply]:
+    """
+    Valida la salida estructurada del modelo
+
+    Returns:
+        StructuredReply, o None si falta un campo o alguno no es válido
+    """
+    data = _load_object(text)
+    if data is None:
+        return None
+
+    reply = data.get("reply")
+    if not isinstance(reply, str) or not reply.strip():
+        return None
+    try:
+        score = float(data.get("score"))
+    except (TypeError, ValueError):
+        return None
+    if not 1 <= score <= 10:
+        return None
+    sentiment = str(data.get("sentiment", "")).strip().lower()
+    sentiment = _LABEL_ALIASES.get(sentiment, sentiment)
+    if sentiment not in SENTIMENT_LABELS:
+        return None
+    return StructuredReply(reply=reply.strip(), score=score, sentiment=sentiment)
+
+# Campo "reply" de un JSON incompleto (p. ej. cortado por max_output_tokens)
+_PARTIAL_REPLY_RE = re.compile(r'"reply"\s*:\s*"((?:[^"\\]|\\.)*)')
+
+def _partial_reply(text: str) -> Optional[str]:
+    match = _PARTIAL_REPLY_RE.search(text)
+    if not match:
+        return None
+    raw = match.group(1)
+    # Un escape cortado a la mitad no se puede decodificar
+    raw = raw[:-1] if raw.endswith("\\") and not raw.endswith("\\\\") else raw
+    try:
+        reply = json.loads(f'"{raw}"')
+    except json.JSONDecodeError:
+        return None
+    return reply.strip() or None
+
+def fallback_reply_text(text: Optional[str]) -> Optional[str]:
+    """
+    Texto utilizable cuando la salida estructurada no pasó la validación:
+    el campo "reply" si existe (aunque el JSON esté incompleto), o el texto
+    si no parece JSON
+    """
+    if not text or not text.strip():
+        return None
+    data = _load_object(text)
+    if data is not None:
+        reply = data.get("reply")
+        return reply.strip() if isinstance(reply, str) and reply.strip() else None
+    partial = _partial_reply(text)
+    if partial:
+        return partial
+    stripped = text.strip()
+    if stripped.startswith(("{", "[", "```")):
+        return None
+    return stripped